@@ -1,9 +1,19 @@
 import argparse
+import io
 import os
 import sys
 from PIL import Image
 import pillow_avif
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from manifest import INCREMENTAL_MODES, Manifest
+from tracing import tracer, enable_tracing, finish_trace
+from modes import working_mode, encoder_inputs
+from scheduler import BYTES_PER_PIXEL, submit_streaming, image_pixels, memory_budget_bytes, available_cores, split_cores, split_candidates, calibrate_split
+from readahead import read_ahead, read_file, source_of, open_source
+from sharding import DEFAULT_STALE_AFTER, FolderClaims, parse_shard, folder_filter
+from target_size import DEFAULT_MAX_ATTEMPTS, quality_seeds
+from encoders import (RESAMPLE_MODES, FORMATS, jpeg_options, webp_options, avif_options, parse_formats, format_settings,
+                      resize_image, encode_image, encode_formats)
+from concurrent.futures import ThreadPoolExecutor
 
 # **Main Parser Setup**
 parser = argparse.ArgumentParser(
@@ -13,102 +23,359 @@ parser = argparse.ArgumentParser(
       python Convert.py jpeg -i "input_path" -o "output_path" -q quality -t threads -w width --h height -p --opt
       python Convert.py webp -i "input_path" -o "output_path" -q quality -t threads -w width --h height -m method
       python Convert.py avif -i "input_path" -o "output_path" -q quality -t threads -w width --h height -s speed
+      python Convert.py multi -i "input_path" -o "output_path" -f jpeg,webp,avif -q quality -t threads -jq jpeg_quality -m method -s speed
     """,
     formatter_class=argparse.RawTextHelpFormatter
 )
-subparsers = parser.add_subparsers(dest="format", required=True, help="Choose image format: jpeg, webp, avif")
+subparsers = parser.add_subparsers(dest="format", required=True, help="Choose image format: jpeg, webp, avif (or multi)")
 
 # **Common Arguments (General Settings)**
 common_parser = argparse.ArgumentParser(add_help=False)
 common_parser.add_argument("-i", "-input-path",type=str, required=True,metavar="INPUT-PATH")
 common_parser.add_argument("-o", "-output-path", type=str, required=True,metavar="OUTPUT-PATH")
-common_parser.add_argument("-t", "-threads", type=int, required=True,metavar="THREADS")
+common_parser.add_argument("-t", "-threads", type=int, required=False,metavar="THREADS (default: auto)",
+                           help="Images converted in parallel (default: derived from the available cores, cgroup CPU quota included)")
+common_parser.add_argument("-et", "-encoder-threads", type=int, required=False, metavar="ENCODER-THREADS (default: auto)",
+                           help="Threads inside every AVIF encode (default: the cores the outer threads leave free)")
+common_parser.add_argument("-calibrate", type=int, nargs="?", const=8, required=False, metavar="SAMPLE (default: 8)",
+                           help="Time a sample of the batch under several thread splits and keep the fastest (unless -t / -et fix it)")
+common_parser.add_argument("-inc", "-incremental", choices=INCREMENTAL_MODES, required=False, metavar="INCREMENTAL (mtime/hash)",
+                           help="Skip images already converted from the same source with the same settings")
+common_parser.add_argument("-mem", "-memory-budget", type=int, required=False, metavar="MEMORY-BUDGET (MB)",
+                           help="Limit the estimated decoded image memory of all images in flight (read from the image headers)")
+common_parser.add_argument("-ra", "-readahead", type=int, default=0, metavar="READAHEAD (images)",
+                           help="Read the next READAHEAD source files into memory on I/O threads (for slow / network storage)")
+common_parser.add_argument("-shard", type=str, required=False, metavar="SHARD (i/N)",
+                           help="Convert only the folders of shard i of N (stable hash of the folder path, e.g. 2/4 on the second of four nodes)")
+common_parser.add_argument("-claims", type=str, required=False, metavar="CLAIMS-PATH",
+                           help="Shared claims folder: nodes take folders through lock files as they reach them (use a new folder per run)")
+common_parser.add_argument("-claim-timeout", type=float, default=DEFAULT_STALE_AFTER, metavar="SECONDS",
+                           help="Take over claims of nodes that did not finish a folder within SECONDS")
+common_parser.add_argument("-trace", action="store_true", help="Time decode, resize and every encode per image and print percentiles at the end")
+common_parser.add_argument("-trace-file", type=str, required=False, metavar="TRACE-FILE", help="Also write a Chrome trace JSON (implies -trace)")
 
 # **Quality Arguments (MUST COME FIRST)**
 quality_group = common_parser.add_argument_group("Quality Settings")
 quality_group.add_argument("-q", "-quality", type=int, default=100,metavar="QUALITY (1-100, default: 100)")
 
+# **Target Size Arguments (Quality Searched per Output, -q Is the Highest Quality Tried)**
+target_group = common_parser.add_argument_group("Target Size Settings")
+target_group.add_argument("-ts", "-target-size", type=float, required=False, metavar="TARGET-SIZE (KB)",
+                          help="Highest quality whose file fits TARGET-SIZE KB, per output")
+target_group.add_argument("-tp", "-target-psnr", type=float, required=False, metavar="TARGET-PSNR (dB)",
+                          help="Lowest quality whose output reaches TARGET-PSNR dB against the (resized) source, per output")
+target_group.add_argument("-ta", "-target-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, metavar=f"ATTEMPTS (default: {DEFAULT_MAX_ATTEMPTS})",
+                          help="Most encodes per output; searches start from the quality chosen for earlier images of the same category")
+
 # **Resize Arguments (AFTER Quality)**
 resize_group = common_parser.add_argument_group("Resize Settings")
 resize_group.add_argument("-w",  "-width",type=int, required=False,metavar="WIDTH")
 resize_group.add_argument("--h", "-height", type=int, required=False,metavar="HEIGHT")
+resize_group.add_argument("-widths", type=str, required=False, metavar="WIDTHS (e.g. 1600,1200,800,400)",
+                          help="Responsive sizes from one decode: every width (aspect ratio kept, never enlarged) is resized from the next larger one, "
+                               "written to <format>/<width>w/")
+resize_group.add_argument("-rs", "-resample", choices=list(RESAMPLE_MODES), default="exact", metavar="RESAMPLE (exact/fast/fastest)",
+                          help="Downscale quality/speed: exact (default), fast, fastest")
 
 # **JPEG Arguments**
-jpeg_parser = subparsers.add_parser("jpeg", parents=[common_parser], help="Convert images to JPEG format")
-jpeg_parser.add_argument("-p", "-progressive", type=bool, choices=["true", "false"], metavar="PROGRESSIVE (true/false)", default="false")
-jpeg_parser.add_argument("-opt", "-optimize", type=bool, choices=["true", "false"], metavar="OPTIMIZE(true/false)", default="false")
+jpeg_parser = subparsers.add_parser("jpeg", parents=[common_parser, jpeg_options], help="Convert images to JPEG format")
 
 # **WEBP Arguments**
-webp_parser = subparsers.add_parser("webp", parents=[common_parser], help="Convert images to WEBP format")
-webp_parser.add_argument("-m", "-method", type=int, choices=range(0, 7), required=False, metavar="METHOD (0-6)")
+webp_parser = subparsers.add_parser("webp", parents=[common_parser, webp_options], help="Convert images to WEBP format")
 
 # **AVIF Arguments**
-avif_parser = subparsers.add_parser("avif", parents=[common_parser], help="Convert images to AVIF format")
-avif_parser.add_argument("-s", "-speed", type=int, choices=range(0, 8), required=False,metavar="SPEED (0-10)", help=" #s Speed (0-10) for AVIF")
-
-# **Parse Arguments**
-args = parser.parse_args()
-
-# **Check format before using format-specific arguments**
-progressive = args.p if args.format == "jpeg" else False  # Only for JPEG
-optimize = args.opt if args.format == "jpeg" else False   # Only for JPE
-
-# **Define Format-Specific Folder**
-format_folder = os.path.join(args.o, args.format)
-os.makedirs(format_folder, exist_ok=True)
-
-# **Resize Logic Before Conversion**
-def resize_image(img):
-    if args.w and args.h:
-        original_width, original_height = img.size
-        if args.w < original_width or args.h < original_height:  # Smaller size only
-            img = img.resize((args.w, args.h), Image.LANCZOS)  # Maintain sharpness
+avif_parser = subparsers.add_parser("avif", parents=[common_parser, avif_options], help="Convert images to AVIF format")
+
+# **Multi-Format Arguments (Decode Once, Encode to Several Formats)**
+multi_parser = subparsers.add_parser("multi", parents=[common_parser, jpeg_options, webp_options, avif_options], help="Convert each image to several formats in one pass")
+multi_parser.add_argument("-f", "-formats", type=str, required=True, metavar="FORMATS (e.g. jpeg,webp,avif)")
+multi_parser.add_argument("-jq", "-jpeg-quality", type=int, required=False, metavar="JPEG QUALITY (default: -q)")
+multi_parser.add_argument("-wq", "-webp-quality", type=int, required=False, metavar="WEBP QUALITY (default: -q)")
+multi_parser.add_argument("-aq", "-avif-quality", type=int, required=False, metavar="AVIF QUALITY (default: -q)")
+
+# **Decoded images one conversion holds at its peak: the source and one encoder copy (+1 for the current size level with -widths)**
+CONVERT_WORKING_IMAGES = 2
+PYRAMID_WORKING_IMAGES = 3
+
+def parse_widths(text):
+    """Comma-separated output widths (e.g. '1600,1200,800'), largest first; None if it is empty or invalid."""
+    try:
+        widths = sorted({int(w) for w in text.split(",") if w.strip()}, reverse=True)
+    except ValueError:
+        return None
+    if not widths or widths[-1] < 1:
+        return None
+    return widths
+
+def cascade_levels(img, widths, resample="exact"):
+    """Yield (width, image) for every width (largest first, none wider than the image), each level resized from the level before it;
+    levels are closed once the next one exists."""
+    source_width, source_height = img.size
+    level = img
+    try:
+        for width in widths:
+            height = max(1, round(source_height * width / source_width))
+            with tracer.stage("resize"):
+                resized = resize_image(level, width, height, resample)
+            if level is not img and resized is not level:
+                level.close()
+            level = resized
+            yield width, level
+    finally:
+        if level is not img:
+            level.close()
+
+def output_levels(img, widths=None):
+    """(width, image) of every output size of a decoded image: one level resized to -w/--h, or the -widths cascade
+    down to the smallest of `widths` (the levels that still have outputs to write)."""
+    if widths is None:
+        with tracer.stage("resize"):
+            resized = resize_image(img, args.w, args.h, args.rs)
+        try:
+            yield None, resized
+        finally:
+            if resized is not img:
+                resized.close()
+        return
+    yield from cascade_levels(img, [width for width in pyramid_widths if min(widths) <= width <= img.width], args.rs)
+
+def open_image(image_path, width=None, height=None, resample="exact", formats=None, buffers=None):
+    """Decode an image in the working mode of its target formats (RGBA without formats), from its read-ahead buffer when given; JPEG sources are decoded at a reduced DCT scale when a fast downscale follows."""
+    img = open_source(image_path, buffers)
+    if RESAMPLE_MODES[resample] and width and height and img.format == "JPEG":
+        img.draft("RGB", (width, height))  # **Scale 1/2, 1/4 or 1/8 that still covers the target size**
+    mode = working_mode(img.mode, formats) if formats else "RGBA"
+    if img.mode != mode:
+        converted = img.convert(mode)
+        img.close()
+        return converted
+    img.load()  # **Already in the working mode: decode without the copy convert() would make (encoders may share it)**
     return img
 
-def convert_image(image_path, output_subfolder):
+def encode_sample(item, threads):
+    """Decode, resize and encode one calibration image to memory in every selected format (AVIF with `threads` encoder threads)."""
+    image_path, data = item
+    img = open_image(image_path, args.w, args.h, args.rs, selected_formats, {image_path: data})
     try:
-        filename = os.path.basename(image_path)
-        output_file = os.path.join(output_subfolder, os.path.splitext(filename)[0] + f".{args.format}")
+        for _, level in output_levels(img, pyramid_widths):
+            inputs = encoder_inputs(level, selected_formats)
+            with ThreadPoolExecutor(max_workers=len(selected_formats)) as encoders:
+                for future in [encoders.submit(encode_image, inputs[fmt], io.BytesIO(), fmt, {**encode_settings[fmt], "max_threads": threads})
+                               for fmt in selected_formats]:
+                    future.result()
+    finally:
+        img.close()
+
+def calibration_sample(size):
+    """The first `size` PNGs of the input folder, read into memory (the timing is about encoding, not storage)."""
+    sample = []
+    for root, _, files in os.walk(args.i):
+        for filename in sorted(files):
+            if filename.lower().endswith(".png"):
+                image_path = os.path.join(root, filename)
+                data = read_file(image_path)
+                if data is not None:
+                    sample.append((image_path, data))
+                if len(sample) >= size:
+                    return sample
+    return sample
+
+def describe_output(fmt, output_file, result):
+    """One output of the result line (with the chosen quality and encode attempts in target mode)."""
+    if result is None:
+        return f"{fmt.upper()} ({output_file})"
+    missed = "" if result["met"] else ", target missed"
+    return f"{fmt.upper()} ({output_file}, q{result['quality']}, {result['attempts']} encodes{missed})"
+
+def level_folder(fmt, width):
+    """Output folder of one format and size level (<format>/<width>w with -widths)."""
+    return os.path.join(format_folders[fmt], f"{width}w") if width else format_folders[fmt]
 
-        # **Skip Already Converted Files**
-        if os.path.exists(output_file):
-            return f"⚠️ Skipped (Already Exists): {filename}"
+def level_params(fmt, width):
+    """Manifest parameters of one format and size level."""
+    return {**conversion_params[fmt], "width": width} if width else conversion_params[fmt]
+
+def level_settings(width):
+    """Encoder settings of a size level (target mode seeds are kept per width)."""
+    if not width:
+        return encode_settings
+    return {fmt: {**settings, "target": {**settings["target"], "level": width}} if settings.get("target") else settings
+            for fmt, settings in encode_settings.items()}
+
+def convert_image(image_path, relative_path, buffers=None):
+    try:
+        filename = os.path.basename(image_path)
+        name = os.path.splitext(filename)[0]
 
-        img = Image.open(image_path).convert("RGBA")
+        # **Skip Already Converted Files (per Format and Size; sizes wider than the source are never written)**
+        widths, too_small = pyramid_widths or [None], []
+        if pyramid_widths:
+            with Image.open(source_of(image_path, buffers)) as header:
+                source_width = header.width
+            too_small = [width for width in pyramid_widths if width > source_width]
+            widths = [width for width in pyramid_widths if width <= source_width]
+        levels = {}
+        for width in widths:
+            for fmt in selected_formats:
+                output_file = os.path.join(level_folder(fmt, width), relative_path, f"{name}.{fmt}")
+                if fmt in manifests:
+                    if manifests[fmt].is_up_to_date(output_file, [image_path], level_params(fmt, width)):
+                        continue
+                elif os.path.exists(output_file):
+                    continue
+                levels.setdefault(width, []).append((fmt, output_file))
+                if width:
+                    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        if not levels:
+            return f"⚠️ Skipped ({'Up To Date' if manifests else 'Already Exists'}): {filename}"
 
-        # **Apply Resize (Only If Needed)**
-        img = resize_image(img)
+        outputs = []
+        with tracer.stage("image"):
+            img = None
+            try:
+                # **Decode Once for All Formats and Sizes**
+                with tracer.stage("decode") as stage:
+                    formats = list(dict.fromkeys(fmt for targets in levels.values() for fmt, _ in targets))
+                    img = open_image(image_path, args.w, args.h, args.rs, formats, buffers)
+                    if stage.active:
+                        stage.bytes = os.path.getsize(image_path)
 
-        # **JPEG Conversion**
-        if args.format == "jpeg":
-            img.convert("RGB").save(output_file, "JPEG", quality=args.q, progressive=progressive, optimize=optimize)
+                # **Resize (Only If Needed) and Encode Every Format of Every Level (Recording Each in Its Manifest)**
+                for width, level in output_levels(img, list(levels) if pyramid_widths else None):
+                    targets = levels.get(width)
+                    if not targets:
+                        continue  # **Up to date, only resized on the way to a smaller level**
 
-        # **AVIF Conversion**
-        elif args.format == "avif":
-            img.convert("RGB").save(output_file, "AVIF", quality=args.q, speed=args.s)
+                    def record(fmt, output_file, width=width):
+                        if fmt in manifests:
+                            manifests[fmt].record(output_file, [image_path], level_params(fmt, width))
 
-        # **WEBP Conversion**
-        elif args.format == "webp":
-            img.save(output_file, "WEBP", quality=args.q, method=args.m)
+                    results = encode_formats(level, targets, level_settings(width), on_saved=record)
+                    outputs += [describe_output(fmt, output_file, results[fmt]) for fmt, output_file in targets]
+            finally:
+                # **Free the decoded image now, not whenever the last reference goes away**
+                if img is not None:
+                    img.close()
 
-        return f"✅ {filename} → {args.format.upper()} ({output_file})"
+        skipped = f" (not enlarged to {', '.join(f'{width}w' for width in too_small)})" if too_small else ""
+        return f"✅ {filename} → " + ", ".join(outputs) + skipped
     
     except Exception as e:
         return f"❌ Error converting {image_path}: {e}"
-# **Collect All PNG Files from the Input Folder**
-image_files = []
-for root, _, files in os.walk(args.i):
-    relative_path = os.path.relpath(root, args.i)
-    output_subfolder = os.path.join(format_folder, relative_path)
-    os.makedirs(output_subfolder, exist_ok=True)
-    for filename in files:
-        if filename.lower().endswith(".png"):
-            image_files.append((os.path.join(root, filename), output_subfolder))
-
-# **Process Images Using Multi-threading**
-with ThreadPoolExecutor(max_workers=args.t) as executor:
-    future_tasks = {executor.submit(convert_image, img_path, folder): img_path for img_path, folder in image_files}
-    for future in as_completed(future_tasks):
-        print(future.result())
-
-print(f"\n PNG images successfully converted to {args.format.upper()} format in '{format_folder}'!")
+
+if __name__ == "__main__":
+    # **Parse Arguments**
+    args = parser.parse_args()
+    if args.trace or args.trace_file:
+        enable_tracing()
+
+    # **Selected Output Formats**
+    selected_formats = parse_formats(args.f) if args.format == "multi" else [args.format]
+    if selected_formats is None:
+        print(f"❌ Invalid format! Choose from {', '.join(FORMATS)}")
+        sys.exit(1)
+
+    if args.ts is not None and args.tp is not None:
+        print("❌ Choose either -target-size or -target-psnr")
+        sys.exit(1)
+    if (args.ts is not None and args.ts <= 0) or args.ta < 1:
+        print("❌ -target-size must be positive and -target-attempts at least 1")
+        sys.exit(1)
+    encode_settings = {fmt: format_settings(args, fmt) for fmt in selected_formats}
+
+    # **Responsive Size Levels (-widths) Instead of One -w / --h Size**
+    pyramid_widths = None
+    if args.widths:
+        pyramid_widths = parse_widths(args.widths)
+        if pyramid_widths is None:
+            print("❌ Invalid -widths! Use positive widths like 1600,1200,800,400")
+            sys.exit(1)
+        if args.w or args.h:
+            print("❌ Choose either -widths or -w / --h")
+            sys.exit(1)
+
+    # **Define Format-Specific Folders**
+    format_folders = {fmt: os.path.join(args.o, fmt) for fmt in selected_formats}
+    for format_folder in format_folders.values():
+        os.makedirs(format_folder, exist_ok=True)
+    if args.ts is not None or args.tp is not None:
+        quality_seeds.load(args.o)
+
+    # **Incremental Manifests (Source Fingerprint + Conversion Settings per Output, one per Format Folder)**
+    # **Multi-Node Partitioning (Static Shard and / or Dynamic Claims per Folder)**
+    try:
+        shard = parse_shard(args.shard) if args.shard else None
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    claims = FolderClaims(args.claims, args.claim_timeout) if args.claims else None
+    select = folder_filter(shard, claims)
+
+    manifests = {fmt: Manifest(format_folders[fmt], args.inc, shared=select is not None) for fmt in selected_formats} if args.inc else {}
+    conversion_params = {fmt: {"format": fmt, "width": args.w, "height": args.h, **encode_settings[fmt]} for fmt in selected_formats}
+    if args.rs != "exact":
+        for params in conversion_params.values():
+            params["resample"] = args.rs  # **Only recorded when set, existing manifests stay valid for exact**
+
+    memory_budget = memory_budget_bytes(args.mem)
+
+    # **Outer Threads x AVIF Encoder Threads (Fitted to the Available Cores, Optionally Measured on a Sample)**
+    if (args.t is not None and args.t < 1) or (args.et is not None and args.et < 1) or (args.calibrate is not None and args.calibrate < 1):
+        print("❌ -threads, -encoder-threads and -calibrate must be at least 1")
+        sys.exit(1)
+    cores = available_cores()
+    workers, encoder_threads = split_cores(cores, selected_formats, encode_settings, args.t, args.et)
+    split_source = "fixed" if args.t is not None or args.et is not None else "heuristic"
+    if args.calibrate:
+        if args.t is not None or args.et is not None:
+            print("⚠️ -calibrate ignored: -threads / -encoder-threads fix the split")
+        else:
+            candidates = split_candidates(cores, selected_formats, encode_settings)
+            sample = calibration_sample(args.calibrate) if len(candidates) > 1 else []
+            if sample:
+                workers, encoder_threads = calibrate_split(sample, encode_sample, candidates)
+                split_source = f"calibrated on {len(sample)} images"
+    if "avif" in encode_settings:
+        encode_settings["avif"]["max_threads"] = encoder_threads  # **After conversion_params: thread counts are not recorded in the manifests**
+    print(f"⚙️ {cores} cores: {workers} image threads" + (f" x {encoder_threads} AVIF encoder threads" if "avif" in encode_settings else "") + f" ({split_source})")
+
+    # **Collect PNG Files from the Input Folder (Tasks Are Produced While the Walk Runs)**
+    def image_files():
+        for root, _, files in os.walk(args.i):
+            relative_path = os.path.relpath(root, args.i)
+            png_files = [filename for filename in files if filename.lower().endswith(".png")]
+            if select and png_files and not select(relative_path):
+                continue
+            if not pyramid_widths:
+                for format_folder in format_folders.values():
+                    os.makedirs(os.path.join(format_folder, relative_path), exist_ok=True)
+            for filename in png_files:
+                if claims:
+                    claims.add(relative_path)
+                yield os.path.join(root, filename), relative_path
+        if claims:
+            claims.scan_finished()
+
+    # **Read the Next Files Ahead of the Workers (Optional) and Turn Them into Tasks**
+    def image_tasks():
+        for (img_path, relative_path), buffers in read_ahead(image_files(), lambda item: [item[0]], args.ra):
+            cost = (PYRAMID_WORKING_IMAGES if pyramid_widths else CONVERT_WORKING_IMAGES) * BYTES_PER_PIXEL * image_pixels(source_of(img_path, buffers)) if memory_budget else 0
+            yield convert_image, (img_path, relative_path, buffers), relative_path, cost
+
+    # **Process Images Using Multi-threading (Bounded Window, Optional Memory Budget)**
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for relative_path, future in submit_streaming(executor, image_tasks(), max_pending=workers * 4, memory_budget=memory_budget):
+            result = future.result()
+            print(result)
+            if claims:
+                claims.finished(relative_path, not result.startswith("❌"))
+
+    for manifest in manifests.values():
+        manifest.save()
+    quality_seeds.save()
+    quality_seeds.print_report()
+
+    finish_trace("image", args.trace_file)
+
+    output_location = format_folders[args.format] if args.format in format_folders else args.o
+    print(f"\n PNG images successfully converted to {', '.join(f.upper() for f in selected_formats)} format in '{output_location}'!")
@@ -0,0 +1,279 @@
+import io
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import random
+import logging
+import argparse
+import tempfile
+import subprocess
+import statistics
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+from pairs import CATEGORIES, iter_image_pairs
+from compositing import composite_pair
+from png_profiles import save_png
+from resize import plan_geometry, scale_visible_region, compose_pair
+from encoders import FORMATS, RESAMPLE_MODES, resize_image, save_image
+
+# **Benchmark Tools (end to end, each run in a fresh process)**
+TOOLS = ("resize", "main", "convert")
+
+# **Regression Threshold (throughput drop / peak RSS growth vs. the baseline)**
+DEFAULT_TOLERANCE = 0.10
+
+TREE_CONFIG = "benchmark_tree.json"
+
+def parse_size(text: str) -> tuple:
+    """'2000x2000' -> (2000, 2000)."""
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height or width)
+
+def texture(rng, size: tuple, base: tuple, spread: int) -> np.ndarray:
+    """RGB gradient with noise (compresses like a photo, not like a flat fill)."""
+    width, height = size
+    gradient = np.linspace(0, spread, height, dtype=np.float32)[:, None, None]
+    noise = rng.normal(0, 6, (height, width, 3)).astype(np.float32)
+    return np.clip(np.array(base, dtype=np.float32) + gradient + noise, 0, 255).astype(np.uint8)
+
+def object_mask(rng, size: tuple, coverage: float) -> Image.Image:
+    """Anti-aliased ellipse covering `coverage` of the frame, placed off-center like a raw product shot."""
+    width, height = size
+    aspect = rng.uniform(0.5, 2.0)
+    semi_x = min(width / 2 - 2, math.sqrt(coverage * width * height * aspect / math.pi))
+    semi_y = min(height / 2 - 2, coverage * width * height / (math.pi * semi_x))
+    center_x = rng.uniform(semi_x + 1, width - semi_x - 1)
+    center_y = rng.uniform(semi_y + 1, height - semi_y - 1)
+    mask = Image.new("L", size, 0)
+    ImageDraw.Draw(mask).ellipse((center_x - semi_x, center_y - semi_y, center_x + semi_x, center_y + semi_y), fill=255)
+    return mask.filter(ImageFilter.GaussianBlur(2))
+
+def generate_pair(rng, np_rng, size: tuple, coverage: float) -> tuple:
+    """(background image, transparent image) of one synthetic view, both RGBA like the real masters."""
+    mask = object_mask(rng, size, coverage)
+    product = Image.fromarray(texture(np_rng, size, [rng.randint(40, 200) for _ in range(3)], 40), "RGB")
+    backdrop = Image.fromarray(texture(np_rng, size, (225, 225, 225), 20), "RGB")
+
+    with_bg = Image.composite(product, backdrop, mask).convert("RGBA")
+    no_bg = product.convert("RGBA")
+    no_bg.putalpha(mask)
+    return with_bg, no_bg
+
+def generate_tree(root: str, skus: int, views: int, size: tuple, coverage: float, seed: int):
+    """Write a SKU tree in the production naming scheme (<SKU>-R-V1.png + <SKU>-RA-V1.png for R/W/Y)."""
+    config = {"skus": skus, "views": views, "size": list(size), "coverage": coverage, "seed": seed}
+    config_path = os.path.join(root, TREE_CONFIG)
+    if os.path.exists(config_path):
+        with open(config_path, "r", encoding="utf-8") as f:
+            if json.load(f) == config:
+                print(f"Using existing synthetic tree in {root}")
+                return
+    shutil.rmtree(root, ignore_errors=True)
+
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    for sku_index in range(skus):
+        sku = f"BENCH{sku_index:04d}"
+        folder = os.path.join(root, sku)
+        os.makedirs(folder, exist_ok=True)
+        for category in CATEGORIES:
+            for view in range(1, views + 1):
+                with_bg, no_bg = generate_pair(rng, np_rng, size, coverage)
+                # **Cheapest zlib level: generation time is not what is being measured**
+                with_bg.save(os.path.join(folder, f"{sku}-{category}-V{view}.png"), "PNG", compress_level=1)
+                no_bg.save(os.path.join(folder, f"{sku}-{category}A-V{view}.png"), "PNG", compress_level=1)
+        print(f"Generated {sku} ({len(CATEGORIES) * views} pairs)")
+
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+
+def run_process(command: list) -> tuple:
+    """Run a command; returns (seconds, peak RSS in MB of that process, or None where the OS does not report it)."""
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        # **ru_maxrss is in KB on Linux, in bytes on macOS**
+        peak_rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    else:
+        process.wait()
+        peak_rss = None
+    seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"Benchmark command failed ({process.returncode}): {' '.join(command)}")
+    return seconds, peak_rss
+
+def tool_command(tool: str, input_root: str, output_root: str, threads: int, formats: list) -> list:
+    """Command line of one tool on the synthetic tree."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    if tool == "resize":
+        return [sys.executable, os.path.join(here, "resize.py"), input_root, output_root, "100", "100", "100", "100", "1", str(threads)]
+    if tool == "main":
+        # **main.py has no command line (hard-coded paths), so call its entry point directly**
+        code = f"import main; main.process_images_in_folders({input_root!r}, {output_root!r}, max_workers={threads})"
+        return [sys.executable, "-c", code]
+    return [sys.executable, os.path.join(here, "Convert.py"), "multi", "-i", input_root, "-o", output_root,
+            "-t", str(threads), "-f", ",".join(formats), "-m", "4"]
+
+def bench_end_to_end(tool: str, input_root: str, work_root: str, threads: int, formats: list, repeat: int, pairs: int, megapixels: float) -> dict:
+    """Best-of-N wall time of a tool on the whole tree (fresh output folder per run)."""
+    # **Convert.py works on PNG files, not pairs: one image per PNG in the tree**
+    units = pairs * 2 if tool == "convert" else pairs
+    runs, peaks = [], []
+    for _ in range(repeat):
+        output_root = os.path.join(work_root, f"out_{tool}")
+        shutil.rmtree(output_root, ignore_errors=True)
+        seconds, peak_rss = run_process(tool_command(tool, input_root, output_root, threads, formats))
+        runs.append(seconds)
+        if peak_rss is not None:
+            peaks.append(peak_rss)
+    best = min(runs)
+    return {
+        "seconds": best, "median_seconds": statistics.median(runs),
+        "units_per_s": units / best, "unit": "images" if tool == "convert" else "pairs",
+        "mp_per_s": megapixels / best,
+        "peak_rss_mb": max(peaks) if peaks else None,
+    }
+
+def time_call(function, repeat: int) -> tuple:
+    """(best, median) seconds of `repeat` calls."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    return min(runs), statistics.median(runs)
+
+def bench_functions(input_root: str, repeat: int, formats: list) -> dict:
+    """Per-function timings on the first pair of the tree (same settings as the end-to-end runs)."""
+    input_folder, _, bg_file, no_bg_file = next(iter_image_pairs(input_root, input_root))
+    bg_path, no_bg_path = os.path.join(input_folder, bg_file), os.path.join(input_folder, no_bg_file)
+    margins = (100, 100, 100, 100)
+
+    def decode():
+        for path in (bg_path, no_bg_path):
+            with Image.open(path) as image:
+                image.load()
+
+    img_with_bg, img_no_bg = Image.open(bg_path), Image.open(no_bg_path)
+    img_with_bg.load()
+    img_no_bg.load()
+    size = img_no_bg.size
+    geometry = plan_geometry(img_no_bg, size, margins, True)
+    zoom_factor, offset = geometry["zoom_factor"], geometry["offset"]
+    bg_region, bg_position = scale_visible_region(img_with_bg, zoom_factor, offset, size)
+    centered_transparent, final_image, _, _ = compose_pair(input_folder, bg_file, no_bg_file, margins, True)
+    thumbnail = resize_image(final_image, size[0] // 4, size[1] // 4)
+
+    cases = {
+        "decode_pair": (decode, 2),
+        "plan_geometry": (lambda: plan_geometry(img_no_bg, size, margins, True), 1),
+        "scale_visible_region": (lambda: scale_visible_region(img_with_bg, zoom_factor, offset, size), 1),
+        "composite_pair": (lambda: composite_pair(bg_region, centered_transparent, bg_position[0], bg_position[1], size), 1),
+        "compose_pair": (lambda: compose_pair(input_folder, bg_file, no_bg_file, margins, True), 2),
+        "save_png": (lambda: save_png(final_image, io.BytesIO()), 1),
+    }
+    for resample in RESAMPLE_MODES:
+        cases[f"resize_image_quarter_{resample}"] = ((lambda resample=resample: resize_image(final_image, size[0] // 4, size[1] // 4, resample)), 1)
+    for fmt in formats:
+        settings = {"quality": 90, "progressive": False, "optimize": False, "method": 4, "speed": 6}
+        cases[f"save_{fmt}_quarter"] = ((lambda fmt=fmt: save_image(thumbnail, io.BytesIO(), fmt, settings)), 1 / 16)
+
+    megapixels = size[0] * size[1] / 1e6
+    results = {}
+    for name, (function, images) in cases.items():
+        best, median = time_call(function, repeat)
+        results[name] = {"ms": best * 1000, "median_ms": median * 1000, "mp_per_s": images * megapixels / best}
+        print(f"  {name:<30} {best * 1000:>9.1f} ms {images * megapixels / best:>8.1f} MP/s")
+    return results
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions vs. a baseline: lower throughput or higher peak RSS beyond the tolerance."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        if current["mp_per_s"] < previous["mp_per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: {current['mp_per_s']:.1f} MP/s vs. {previous['mp_per_s']:.1f} MP/s baseline")
+        if current.get("peak_rss_mb") and previous.get("peak_rss_mb") and current["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {current['peak_rss_mb']:.0f} MB vs. {previous['peak_rss_mb']:.0f} MB baseline")
+    return regressions
+
+# **Main Execution (Command Line Arguments)**
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark resize.py, main.py and Convert.py on a synthetic SKU tree")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "image_process_benchmark"),
+                        help="Folder for the synthetic tree and benchmark outputs")
+    parser.add_argument("--skus", type=int, default=2, help="Number of SKU folders (default: 2)")
+    parser.add_argument("--views", type=int, default=2, help="Views per category, pairs per SKU = 3 x views (default: 2)")
+    parser.add_argument("--size", default="2000x2000", help="Image resolution WIDTHxHEIGHT (default: 2000x2000)")
+    parser.add_argument("--coverage", type=float, default=0.3, help="Share of the frame covered by the object (default: 0.3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="Worker threads of every tool (default: CPU count)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, the best one counts (default: 3)")
+    parser.add_argument("--tools", default=",".join(TOOLS), help=f"End-to-end runs (default: {','.join(TOOLS)})")
+    parser.add_argument("--formats", default="jpeg,webp", help="Formats for Convert.py and the encoder timings (default: jpeg,webp)")
+    parser.add_argument("--no-functions", action="store_true", help="Skip the per-function timings")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Store the results as a baseline JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against a stored baseline (exit code 1 on regressions)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown / RSS growth (default: 0.10)")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)  # **Per-pair log lines would be timed too**
+
+    size = parse_size(args.size)
+    requested = [tool.strip() for tool in args.tools.split(",") if tool.strip()]
+    tools = [tool for tool in TOOLS if tool in requested]  # **resize runs before convert (convert reuses its output)**
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    if any(tool not in TOOLS for tool in requested) or any(fmt not in FORMATS for fmt in formats):
+        print(f"Error: tools must be from {', '.join(TOOLS)} and formats from {', '.join(FORMATS)}")
+        sys.exit(1)
+
+    # **Synthetic Tree (Reused While the Settings Match)**
+    input_root = os.path.join(args.workdir, "input")
+    generate_tree(input_root, args.skus, args.views, size, args.coverage, args.seed)
+    pairs = args.skus * len(CATEGORIES) * args.views
+    megapixels = pairs * 2 * size[0] * size[1] / 1e6
+
+    results = {}
+    for tool in tools:
+        # **Convert.py runs on the composed PNGs (the real pipeline order)**
+        source = os.path.join(args.workdir, "out_resize") if tool == "convert" else input_root
+        if tool == "convert" and "resize" not in tools:
+            run_process(tool_command("resize", input_root, source, args.threads, formats))
+        result = bench_end_to_end(tool, source, args.workdir, args.threads, formats, args.repeat, pairs, megapixels)
+        results[f"e2e/{tool}"] = result
+        peak = f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] else "n/a"
+        print(f"{tool:<8} {result['seconds']:>8.2f} s {result['units_per_s']:>8.2f} {result['unit']}/s {result['mp_per_s']:>8.1f} MP/s  peak RSS {peak}")
+
+    if not args.no_functions:
+        print(f"\nPer-function timings (best of {args.repeat}, {size[0]}x{size[1]})")
+        for name, result in bench_functions(input_root, args.repeat, formats).items():
+            results[f"func/{name}"] = result
+
+    report = {
+        "config": {"skus": args.skus, "views": args.views, "size": list(size), "coverage": args.coverage, "seed": args.seed,
+                   "threads": args.threads, "formats": formats, "python": sys.version.split()[0], "cpu_count": os.cpu_count()},
+        "results": results,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config", {}) != report["config"]:
+            print("\nWarning: baseline was recorded with different settings, numbers may not be comparable")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressions (> {args.tolerance:.0%}):")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
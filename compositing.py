@@ -0,0 +1,58 @@
+import numpy as np
+from PIL import Image
+from modes import rgb_source
+
+# **Rows blended per step (bounds the size of the temporary arrays)**
+STRIP_HEIGHT = 256
+
+def multiply_color(value: int, color: int) -> int:
+    """Same integer result as ImageChops.multiply for one channel value (a * b / 255, truncated)."""
+    return value * color // 255
+
+def multiply_lut(bg_color: tuple, alpha: bool = False) -> list:
+    """Lookup table that multiplies every RGB channel with the background color (alpha, if present, becomes opaque)."""
+    lut = [multiply_color(value, color) for color in bg_color for value in range(256)]
+    return lut + [255] * 256 if alpha else lut
+
+def blend_over_opaque(dst: np.ndarray, src: np.ndarray):
+    """Alpha-composite RGBA `src` over opaque RGBA `dst` in place, matching Image.alpha_composite."""
+    alpha = src[..., 3].astype(np.uint16)
+    inverse_alpha = 255 - alpha
+    for channel in range(3):
+        # **(src * a + dst * (255 - a)) / 255 with Pillow's rounding, all in 16 bits**
+        tmp = src[..., channel] * alpha
+        tmp += dst[..., channel] * inverse_alpha
+        tmp += 128
+        tmp += tmp >> 8
+        tmp >>= 8
+        dst[..., channel] = tmp
+
+def composite_pair(background_image: Image.Image, centered_transparent: Image.Image, dx: int, dy: int, final_size: tuple, bg_color: tuple = (0, 0, 255)) -> Image.Image:
+    """Fused process_background + compose_final_image, writing into a single RGBA canvas."""
+    width, height = final_size
+
+    # **Step 1: Canvas Color Multiplied With Itself (area not covered by the background)**
+    canvas_color = tuple(multiply_color(color, color) for color in bg_color)
+    output = Image.new("RGBA", final_size, canvas_color + (255,))
+
+    # **Step 2: Shifted Background Multiplied With Canvas Color (visible part only)**
+    left, top = max(dx, 0), max(dy, 0)
+    right = min(dx + background_image.width, width)
+    bottom = min(dy + background_image.height, height)
+    if left < right and top < bottom:
+        # **RGBA backgrounds go through the LUT directly (no RGB copy; opaque alpha like the old convert("RGB"))**
+        visible_bg, has_alpha = rgb_source(background_image.crop((left - dx, top - dy, right - dx, bottom - dy)))
+        output.paste(visible_bg.point(multiply_lut(bg_color, has_alpha)), (left, top))
+
+    # **Step 3: Blend the Transparent Image (only where it has visible pixels)**
+    bbox = centered_transparent.getbbox()
+    if bbox is not None:
+        left, top, right, bottom = bbox
+        for strip_top in range(top, bottom, STRIP_HEIGHT):
+            strip_box = (left, strip_top, right, min(strip_top + STRIP_HEIGHT, bottom))
+            src = np.asarray(centered_transparent.crop(strip_box))
+            dst = np.array(output.crop(strip_box))
+            blend_over_opaque(dst, src)
+            output.paste(Image.fromarray(dst, "RGBA"), strip_box[:2])
+
+    return output
@@ -0,0 +1,125 @@
+import os
+import json
+import shutil
+import hashlib
+import uuid
+import threading
+import logging
+from tracing import tracer
+
+# **Content-Addressed Output Store**
+# A pair is identified by the SHA-256 of its two sources and the render parameters; the outputs of every rendered
+# pair are kept under that key, so an identical pair (same shot reused by another SKU / colorway, in this run
+# or a later one) gets its outputs linked or copied from the store instead of being rendered again.
+#   bytes  : key from the source bytes (no decode needed on a hit)
+#   pixels : also key by the decoded pixels, for shots that were re-saved (different bytes, same image)
+DEDUPE_MODES = ("bytes", "pixels")
+
+# **How a stored output is placed at its destination**
+# link : hard link (no extra space, falls back to a copy across filesystems)
+# copy : independent copy
+PLACE_MODES = ("link", "copy")
+
+def file_digest(path: str, data: bytes = None) -> str:
+    """SHA-256 of a source file (of its read-ahead buffer when given)."""
+    if data is not None:
+        return hashlib.sha256(data).hexdigest()
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def pixel_digest(image) -> str:
+    """SHA-256 of a decoded image (mode, size and pixels)."""
+    digest = hashlib.sha256(f"{image.mode}:{image.width}x{image.height}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+def replace_output(path: str):
+    """Unlink an existing output before it is rewritten, so a file hard-linked with the store is replaced, never overwritten in place."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class DedupeStore:
+    """Outputs of rendered pairs by content key: <root>/<key[:2]>/<key>/<role> (role = final.png, cutout.webp, ...)."""
+
+    def __init__(self, root: str, mode: str = "bytes", place: str = "link", params: dict = None):
+        if mode not in DEDUPE_MODES:
+            raise ValueError(f"Unknown dedupe mode '{mode}'. Choose from {', '.join(DEDUPE_MODES)}")
+        if place not in PLACE_MODES:
+            raise ValueError(f"Unknown dedupe placement '{place}'. Choose from {', '.join(PLACE_MODES)}")
+        self.root = root
+        self.mode = mode
+        self.place = place
+        self.params = params or {}
+
+    def bind(self, params: dict) -> "DedupeStore":
+        """The store for one run: keys also cover the run's render parameters."""
+        return DedupeStore(self.root, self.mode, self.place, params)
+
+    @property
+    def pixels(self) -> bool:
+        return self.mode == "pixels"
+
+    def key(self, kind: str, digests: list) -> str:
+        text = json.dumps({"kind": kind, "sources": digests, "params": self.params}, sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def source_key(self, paths: list, buffers: dict = None) -> str:
+        with tracer.stage("dedupe"):
+            return self.key("bytes", [file_digest(path, buffers.get(path) if buffers else None) for path in paths])
+
+    def pixel_key(self, images: list) -> str:
+        with tracer.stage("dedupe"):
+            return self.key("pixels", [pixel_digest(image) for image in images])
+
+    def entry(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def fetch(self, key: str, outputs: dict) -> bool:
+        """Place the stored outputs of `key` at their destinations ({role: path}); False when the store does not have all of them."""
+        entry = self.entry(key)
+        if not all(os.path.exists(os.path.join(entry, role)) for role in outputs):
+            return False
+        for role, path in outputs.items():
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.copy(os.path.join(entry, role), path)
+        return True
+
+    def store(self, keys: list, outputs: dict):
+        """Keep freshly rendered outputs ({role: path}) under every key they were looked up by."""
+        for key in keys:
+            entry = self.entry(key)
+            if os.path.exists(entry):
+                continue
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            staging = None
+            try:
+                # **Unique per call (threads and nodes may store the same key at once); umask permissions, not mkdtemp's 0700,
+                # so other users and nodes sharing the store can read and link the entry**
+                staging = f"{entry}.{uuid.uuid4().hex}.tmp"
+                os.mkdir(staging, 0o777)
+                for role, path in outputs.items():
+                    self.copy(path, os.path.join(staging, role))
+                os.rename(staging, entry)  # **Complete entries only; another worker may have stored the same pair meanwhile**
+            except OSError as e:
+                if not os.path.exists(entry):
+                    logging.warning(f"Could not store dedupe entry {key}: {e}")
+                if staging:
+                    shutil.rmtree(staging, ignore_errors=True)
+
+    def copy(self, source: str, destination: str):
+        """Hard link (or copy) source to destination, replacing whatever is there."""
+        staging = f"{destination}.{os.getpid()}.{threading.get_ident()}.dedupe"
+        replace_output(staging)
+        if self.place == "link":
+            try:
+                os.link(source, staging)
+            except OSError:
+                shutil.copyfile(source, staging)  # **Other filesystem / no hard links: copy instead**
+        else:
+            shutil.copyfile(source, staging)
+        os.replace(staging, destination)
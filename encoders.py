@@ -0,0 +1,127 @@
+import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from tracing import tracer
+from modes import encoder_mode, encoder_inputs, to_mode
+from dedupe import replace_output
+from target_size import encode_to_target
+
+# **Encoders Shared by Convert.py, resize.py --convert and service.py (pillow_avif is only imported for the first AVIF encode)**
+
+# **Downscale Modes (-rs): Pillow reducing_gap of the box pre-shrink before the final LANCZOS pass**
+# exact   : one LANCZOS pass over the full-resolution image (reference quality)
+# fast    : reduce() by an integer factor while the rest of the shrink stays >= 3x, then LANCZOS
+# fastest : same with a gap of 2x (the Pillow thumbnail() default), fastest on large masters
+RESAMPLE_MODES = {"exact": None, "fast": 3.0, "fastest": 2.0}
+
+# **Encoder Settings When the Command Line / a Job Does Not Set Them (Pillow / pillow-avif defaults)**
+DEFAULT_WEBP_METHOD = 4
+DEFAULT_AVIF_SPEED = 6
+
+# **JPEG Arguments (parents of the Convert.py subcommands and resize.py --convert)**
+jpeg_options = argparse.ArgumentParser(add_help=False)
+jpeg_options.add_argument("-p", "-progressive", type=bool, choices=["true", "false"], metavar="PROGRESSIVE (true/false)", default="false")
+jpeg_options.add_argument("-opt", "-optimize", type=bool, choices=["true", "false"], metavar="OPTIMIZE(true/false)", default="false")
+
+# **WEBP Arguments**
+webp_options = argparse.ArgumentParser(add_help=False)
+webp_options.add_argument("-m", "-method", type=int, choices=range(0, 7), default=DEFAULT_WEBP_METHOD, metavar=f"METHOD (0-6, default: {DEFAULT_WEBP_METHOD})")
+
+# **AVIF Arguments**
+avif_options = argparse.ArgumentParser(add_help=False)
+avif_options.add_argument("-s", "-speed", type=int, choices=range(0, 8), default=DEFAULT_AVIF_SPEED, metavar=f"SPEED (0-7, default: {DEFAULT_AVIF_SPEED})", help=" #s Speed (0-7) for AVIF")
+
+# **Supported Output Formats**
+FORMATS = ("jpeg", "webp", "avif")
+
+def parse_formats(text):
+    """Split a comma-separated format list (e.g. 'jpeg,webp,avif'); None if it is empty or invalid."""
+    formats = list(dict.fromkeys(f.strip().lower() for f in text.split(",") if f.strip()))
+    if not formats or any(f not in FORMATS for f in formats):
+        return None
+    return formats
+
+def format_settings(args, fmt):
+    """Encoder settings of one output format (per-format quality falls back to -q)."""
+    quality = getattr(args, {"jpeg": "jq", "webp": "wq", "avif": "aq"}[fmt], None)
+    if quality is None:
+        quality = args.q
+    if fmt == "jpeg":
+        settings = {"quality": quality, "progressive": args.p, "optimize": args.opt}
+    elif fmt == "webp":
+        settings = {"quality": quality, "method": DEFAULT_WEBP_METHOD if args.m is None else args.m}
+    else:
+        settings = {"quality": quality, "speed": DEFAULT_AVIF_SPEED if args.s is None else args.s}
+
+    # **Target Mode: Only Recorded When Set, Existing Manifests Stay Valid for Fixed Quality**
+    target_size, target_psnr = getattr(args, "ts", None), getattr(args, "tp", None)
+    if target_size is not None or target_psnr is not None:
+        metric, value = ("size", target_size) if target_size is not None else ("psnr", target_psnr)
+        settings["target"] = {"metric": metric, "value": value, "attempts": args.ta}
+    return settings
+
+# **Resize Logic Before Conversion**
+def resize_image(img, width=None, height=None, resample="exact"):
+    if width and height:
+        original_width, original_height = img.size
+        if width < original_width or height < original_height:  # Smaller size only
+            reducing_gap = RESAMPLE_MODES[resample]
+            if reducing_gap and img.mode == "RGBA":
+                # **Pillow ignores reducing_gap on its own RGBA premultiply path, so premultiply here**
+                img = img.convert("RGBa").resize((width, height), Image.LANCZOS, reducing_gap=reducing_gap).convert("RGBA")
+            else:
+                img = img.resize((width, height), Image.LANCZOS, reducing_gap=reducing_gap)  # Maintain sharpness
+    return img
+
+def encode_image(img, output, fmt, settings, quality=None):
+    """Encode an image in its encoder mode to a file or buffer (at `quality` instead of the configured one when given)."""
+    quality = settings["quality"] if quality is None else quality
+
+    # **JPEG Conversion**
+    if fmt == "jpeg":
+        img.save(output, "JPEG", quality=quality, progressive=settings["progressive"], optimize=settings["optimize"])
+
+    # **AVIF Conversion**
+    # **max_threads defaults to 1: resize.py / service.py encode inside their own worker pools, only Convert's split sets more**
+    elif fmt == "avif":
+        import pillow_avif  # noqa: F401 (registers the AVIF plugin with Pillow)
+        img.save(output, "AVIF", quality=quality, speed=settings["speed"], max_threads=settings.get("max_threads", 1))
+
+    # **WEBP Conversion**
+    elif fmt == "webp":
+        img.save(output, "WEBP", quality=quality, method=settings["method"])
+
+def save_image(img, output_file, fmt, settings):
+    """Encode an RGB/RGBA image to one output format (converted only if the encoder cannot take its mode);
+    in target mode, returns the quality search result."""
+    img = to_mode(img, encoder_mode(img.mode, fmt))
+    if isinstance(output_file, str):
+        replace_output(output_file)  # **Never rewrite a file in place: it may be hard-linked with the dedupe store**
+
+    if settings.get("target"):
+        return encode_to_target(img, output_file, fmt, settings["target"], settings["quality"],
+                                lambda image, buffer, quality: encode_image(image, buffer, fmt, settings, quality))
+    encode_image(img, output_file, fmt, settings)
+    return None
+
+def encode_formats(img, targets, settings, on_saved=None):
+    """Encode one decoded image to every (format, output_file) target, concurrently when there are several;
+    returns the target mode search result per format (None for a fixed quality)."""
+    # **One conversion per encoder mode, shared by the formats (JPEG + AVIF use the same RGB copy)**
+    inputs = encoder_inputs(img, [fmt for fmt, _ in targets])
+
+    def encode(fmt, output_file):
+        with tracer.stage(f"encode_{fmt}") as stage:
+            result = save_image(inputs[fmt], output_file, fmt, settings[fmt])
+            if stage.active:
+                stage.bytes = os.path.getsize(output_file)
+        if on_saved:
+            on_saved(fmt, output_file)
+        return result
+
+    if len(targets) == 1:
+        return {targets[0][0]: encode(*targets[0])}
+    with ThreadPoolExecutor(max_workers=len(targets)) as encoders:
+        futures = {fmt: encoders.submit(encode, fmt, output_file) for fmt, output_file in targets}
+        return {fmt: future.result() for fmt, future in futures.items()}
@@ -1,366 +1,270 @@
-# # import os
-# # import argparse
-# # import cv2
-# # import numpy as np
-
-# # # Argument Parser Setup
-# # parser = argparse.ArgumentParser(description="Generate Video with Logo Overlay and Watermark")
-# # parser.add_argument("-i", "--input", required=True, help="Input folder path")
-# # parser.add_argument("-o", "--output", required=True, help="Output folder path")
-# # parser.add_argument("-f", "--format", required=True, choices=["mp4", "mov"], help="Video format")
-# # parser.add_argument("--fps", type=int, default=30, help="Frames per second (default: 30)")
-# # parser.add_argument("-imgf", "--image_format", required=True, choices=["jpg", "jpeg", "png", "webp"], help="Input image format")
-# # parser.add_argument("-l", "--logo", required=True, help="Company logo (PNG)")
-# # parser.add_argument("-res", "--resolution", help="Custom resolution in WxH format (e.g., 1920x1080)")
-# # parser.add_argument("-p", "--position", required=True, choices=["top-left", "top-right", "bottom-left", "bottom-right"], help="Logo position in video")
-# # parser.add_argument("-wt", "--watermark_text", help="Watermark text to overlay on the video")
-# # parser.add_argument("-wtf", "--watermark_font", required=True, choices=["SIMPLEX", "PLAIN", "DUPLEX", "COMPLEX", "TRIPLEX", "ITALIC"], help="Watermark text font type")
-
-# # args = parser.parse_args()
-
-# # # Ensure Output Folder Exists
-# # output_folder = args.output
-# # os.makedirs(output_folder, exist_ok=True)
-
-# # # Construct Output Video Path
-# # input_folder_name = os.path.basename(os.path.normpath(args.input))
-# # video_filename = f"{input_folder_name}.{args.format}"
-# # output_video_path = os.path.join(output_folder, video_filename)
-
-# # # Read and Sort Images (Case-Insensitive)
-# # image_files = sorted([f for f in os.listdir(args.input) if f.lower().endswith(args.image_format.lower())])
-
-# # if not image_files:
-# #     print(f"❌ No images found in '{args.input}' with format '{args.image_format}'!")
-# #     exit()
-
-# # # Get Image Dimensions (Default to first image size)
-# # first_img_path = os.path.join(args.input, image_files[0])
-# # first_img = cv2.imread(first_img_path)
-
-# # if first_img is None:
-# #     print(f"❌ Failed to read the first image: {first_img_path}")
-# #     exit()
-
-# # height, width, _ = first_img.shape  # Default resolution
-
-# # # Set Custom Resolution If Provided
-# # if args.resolution:
-# #     try:
-# #         width, height = map(int, args.resolution.replace("*", "x").split("x"))
-# #     except ValueError:
-# #         print("❌ Invalid resolution format! Use WxH (e.g., 1920x1080)")
-# #         exit()
-
-# # # Load Logo Image (Even if it's not transparent)
-# # logo = cv2.imread(args.logo, cv2.IMREAD_UNCHANGED)
-
-# # if logo is None:
-# #     print(f"❌ Failed to load logo image: {args.logo}")
-# #     exit()
-
-# # # Resize Logo (15% of video width)
-# # logo_width = int(width * 0.15)
-# # logo_height = int((logo.shape[0] / logo.shape[1]) * logo_width)
-# # logo = cv2.resize(logo, (logo_width, logo_height), interpolation=cv2.INTER_AREA)
-
-# # # Convert Logo to RGB (If it has alpha, separate it)
-# # if logo.shape[2] == 4:
-# #     logo_rgb = logo[:, :, :3]
-# #     logo_alpha = logo[:, :, 3] / 255.0  # Normalize alpha
-# # else:
-# #     logo_rgb = logo
-# #     logo_alpha = np.ones((logo.shape[0], logo.shape[1]), dtype=np.float32)  # Full opacity
-
-# # # Video Writer Setup
-# # fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-# # video_writer = cv2.VideoWriter(output_video_path, fourcc, args.fps, (width, height))
-
-# # # Mapping User Input to OpenCV Font
-# # font_mapping = {
-# #     "SIMPLEX": cv2.FONT_HERSHEY_SIMPLEX,
-# #     "PLAIN": cv2.FONT_HERSHEY_PLAIN,
-# #     "DUPLEX": cv2.FONT_HERSHEY_DUPLEX,
-# #     "COMPLEX": cv2.FONT_HERSHEY_COMPLEX,
-# #     "TRIPLEX": cv2.FONT_HERSHEY_TRIPLEX,
-# #     "ITALIC": cv2.FONT_HERSHEY_SCRIPT_SIMPLEX  # Italic ek special case
-# # }
-
-# # # Get Selected Font
-# # font = font_mapping[args.watermark_font]
-
-# # # Process Each Frame
-# # for img_name in image_files:
-# #     img_path = os.path.join(args.input, img_name)
-# #     frame = cv2.imread(img_path)
-
-# #     if frame is None:
-# #         print(f"⚠️ Skipping corrupted/missing image: {img_path}")
-# #         continue
-
-# #     # Resize Frame If Custom Resolution is Given
-# #     if args.resolution:
-# #         frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
-
-# #     # Define Logo Position Based on User Input
-# #     if args.position == "top-left":
-# #         x_offset, y_offset = 20, 20
-# #     elif args.position == "top-right":
-# #         x_offset, y_offset = width - logo_width - 20, 20
-# #     elif args.position == "bottom-left":
-# #         x_offset, y_offset = 20, height - logo_height - 20
-# #     elif args.position == "bottom-right":
-# #         x_offset, y_offset = width - logo_width - 20, height - logo_height - 20
-
-# #     # Extract ROI from Frame (Same Size as Logo)
-# #     roi = frame[y_offset:y_offset + logo_height, x_offset:x_offset + logo_width]
-
-# #     # Multiply Blend Logo with Background
-# #     blended = cv2.multiply(roi.astype(np.float32), (logo_rgb / 255.0).astype(np.float32)).astype(np.uint8)
-
-# #     # Apply Alpha Mask for Smooth Blend
-# #     blended = (blended * logo_alpha[:, :, None] + roi * (1 - logo_alpha[:, :, None])).astype(np.uint8)
-
-# #     # Place Blended Logo Back on Frame
-# #     frame[y_offset:y_offset + logo_height, x_offset:x_offset + logo_width] = blended
-
-# #     # Apply Watermark Text
-# #     if args.watermark_text:
-# #         font_scale = 10
-# #         font_thickness = 20
-# #         text_size = cv2.getTextSize(args.watermark_text, font, font_scale, font_thickness)[0]
-        
-# #             # Define Watermark Position
-# #     if args.watermark_position == "top-left":
-# #         text_x, text_y = 50, 100
-# #     elif args.watermark_position == "top-right":
-# #         text_x, text_y = width - text_size[0] - 50, 100
-# #     elif args.watermark_position == "bottom-left":
-# #         text_x, text_y = 50, height - 50
-# #     elif args.watermark_position == "bottom-right":
-# #         text_x, text_y = width - text_size[0] - 50, height - 50
-# #     elif args.watermark_position == "center":
-# #         text_x, text_y = (width - text_size[0]) // 2, (height + text_size[1]) // 2
-
-# #         overlay = frame.copy()
-        
-# #     # **Step 1: Apply Black Outline for Smoother Curves**
-# #     for dx, dy in [(-2, -2), (2, -2), (-2, 2), (2, 2)]:  # Outline in 4 directions
-# #         cv2.putText(overlay, args.watermark_text, (text_x + dx, text_y + dy), font, font_scale, (110, 110, 110), font_thickness , cv2.LINE_AA)
-# #     # **Step 3: Blend Overlay for Smooth Appearance**
-# #     frame = cv2.addWeighted(overlay, 0.7, frame, 0.3, 0)  # Less transparency for better visibility
-
-# #     # Write Frame to Video
-# #     video_writer.write(frame)
-
-# # video_writer.release()
-
-# # # Get Video Details
-# # video_size = os.stat(output_video_path).st_size / (1024 * 1024)  # Convert bytes to MB
-# # cap = cv2.VideoCapture(output_video_path)
-
-# # if not cap.isOpened():
-# #     print("❌ Error opening video file")
-# # else:
-# #     frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-# #     duration = frame_count / args.fps  # Total video duration in seconds
-# #     bitrate = (video_size * 8) / duration if duration > 0 else 0  # Bitrate in Mbps
-
-# #     print(f"✅ Video Created: {output_video_path}")
-# #     print(f"📏 Resolution: {width}x{height}")
-# #     print(f"🎞️ Frame Count: {frame_count}")
-# #     print(f"⏳ Duration: {duration:.2f} seconds")
-# #     print(f"🎥 FPS: {args.fps}")
-# #     print(f"📂 File Size: {video_size:.2f} MB")
-# #     print(f"🔧 Bitrate: {bitrate:.2f} Mbps")  
-
-# # cap.release()
-
-
-# import os
-# import argparse
-# import cv2
-# import numpy as np
-
-# # Argument Parser Setup
-# parser = argparse.ArgumentParser(description="Generate Video with Logo Overlay and Watermark")
-# parser.add_argument("-i", "--input", required=True, help="Input folder path")
-# parser.add_argument("-o", "--output", required=True, help="Output folder path")
-# parser.add_argument("-f", "--format", required=True, choices=["mp4", "mov"], help="Video format")
-# parser.add_argument("--fps", type=int, default=30, help="Frames per second (default: 30)")
-# parser.add_argument("-imgf", "--image_format", required=True, choices=["jpg", "jpeg", "png", "webp"], help="Input image format")
-# parser.add_argument("-l", "--logo", required=True, help="Company logo (PNG)")
-# parser.add_argument("-res", "--resolution", help="Custom resolution in WxH format (e.g., 1920x1080)")
-# parser.add_argument("-p", "--position", required=True, choices=["top-left", "top-right", "bottom-left", "bottom-right"], help="Logo position in video")
-# parser.add_argument("-wt", "--watermark_text", help="Watermark text to overlay on the video")
-# parser.add_argument("-wtf", "--watermark_font", required=True, choices=["SIMPLEX", "PLAIN", "DUPLEX", "COMPLEX", "TRIPLEX", "ITALIC"], help="Watermark text font type")
-# parser.add_argument("-wtp", "--watermark_position", required=True, choices=["top-left", "top-right", "bottom-left", "bottom-right", "center","cross"], help="Watermark text position")
-
-# args = parser.parse_args()
-
-# # Ensure Output Folder Exists
-# output_folder = args.output
-# os.makedirs(output_folder, exist_ok=True)
-
-# # Construct Output Video Path
-# input_folder_name = os.path.basename(os.path.normpath(args.input))
-# video_filename = f"{input_folder_name}.{args.format}"
-# output_video_path = os.path.join(output_folder, video_filename)
-
-# # Read and Sort Images (Case-Insensitive)
-# image_files = sorted([f for f in os.listdir(args.input) if f.lower().endswith(args.image_format.lower())])
-
-# if not image_files:
-#     print(f"❌ No images found in '{args.input}' with format '{args.image_format}'!")
-#     exit()
-
-# # Get Image Dimensions (Default to first image size)
-# first_img_path = os.path.join(args.input, image_files[0])
-# first_img = cv2.imread(first_img_path)
-
-# if first_img is None:
-#     print(f"❌ Failed to read the first image: {first_img_path}")
-#     exit()
-
-# height, width, _ = first_img.shape  # Default resolution
-
-# # Set Custom Resolution If Provided
-# if args.resolution:
-#     try:
-#         width, height = map(int, args.resolution.replace("*", "x").split("x"))
-#     except ValueError:
-#         print("❌ Invalid resolution format! Use WxH (e.g., 1920x1080)")
-#         exit()
-
-
-# # Load Logo Image
-# logo = cv2.imread(args.logo, cv2.IMREAD_UNCHANGED)
-
-# if logo is None:
-#     print(f"❌ Failed to load logo image: {args.logo}")
-#     exit()
-
-# # Resize Logo (15% of video width)
-# logo_width = int(width * 0.15)
-# logo_height = int((logo.shape[0] / logo.shape[1]) * logo_width)
-# logo = cv2.resize(logo, (logo_width, logo_height), interpolation=cv2.INTER_AREA)
-
-# # Convert Logo to RGB (If it has alpha, separate it)
-# if logo.shape[2] == 4:
-#     logo_rgb = logo[:, :, :3]
-#     logo_alpha = logo[:, :, 3] / 255.0  # Normalize alpha
-# else:
-#     logo_rgb = logo
-#     logo_alpha = np.ones((logo.shape[0], logo.shape[1]), dtype=np.float32)  # Full opacity
-
-# # Video Writer Setup
-# fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-# video_writer = cv2.VideoWriter(output_video_path, fourcc, args.fps, (width, height))
-
-# # Mapping User Input to OpenCV Font
-# font_mapping = {
-#     "SIMPLEX": cv2.FONT_HERSHEY_SIMPLEX,
-#     "PLAIN": cv2.FONT_HERSHEY_PLAIN,
-#     "DUPLEX": cv2.FONT_HERSHEY_DUPLEX,
-#     "COMPLEX": cv2.FONT_HERSHEY_COMPLEX,
-#     "TRIPLEX": cv2.FONT_HERSHEY_TRIPLEX,
-#     "ITALIC": cv2.FONT_HERSHEY_SCRIPT_SIMPLEX
-# }
-
-# # Get Selected Font
-# font = font_mapping[args.watermark_font]
-
-# # Process Each Frame
-# for img_name in image_files:
-#     img_path = os.path.join(args.input, img_name)
-#     frame = cv2.imread(img_path)
-
-#     if frame is None:
-#         print(f"⚠️ Skipping corrupted/missing image: {img_path}")
-#         continue
-
-#     # Resize Frame If Custom Resolution is Given
-#     if args.resolution:
-#         frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
-
-#     # Define Logo Position Based on User Input
-#     if args.position == "top-left":
-#         x_offset, y_offset = 20, 20
-#     elif args.position == "top-right":
-#         x_offset, y_offset = width - logo_width - 20, 20
-#     elif args.position == "bottom-left":
-#         x_offset, y_offset = 20, height - logo_height - 20
-#     elif args.position == "bottom-right":
-#         x_offset, y_offset = width - logo_width - 20, height - logo_height - 20
-
-#     # Extract ROI from Frame (Same Size as Logo)
-#     roi = frame[y_offset:y_offset + logo_height, x_offset:x_offset + logo_width]
-
-#     # Multiply Blend Logo with Background
-#     blended = cv2.multiply(roi.astype(np.float32), (logo_rgb / 255.0).astype(np.float32)).astype(np.uint8)
-
-#     # Apply Alpha Mask for Smooth Blend
-#     blended = (blended * logo_alpha[:, :, None] + roi * (1 - logo_alpha[:, :, None])).astype(np.uint8)
-
-#     # Place Blended Logo Back on Frame
-#     frame[y_offset:y_offset + logo_height, x_offset:x_offset + logo_width] = blended
-
-#     # Apply Watermark Text
-#     if args.watermark_text:
-#         font_scale = 10
-#         font_thickness = 20
-#         text_size = cv2.getTextSize(args.watermark_text, font, font_scale, font_thickness)[0]
-
-#         # Define Watermark Position
-#         if args.watermark_position == "top-left":
-#             text_x, text_y = 50, 100
-#         elif args.watermark_position == "top-right":
-#             text_x, text_y = width - text_size[0] - 50, 100
-#         elif args.watermark_position == "bottom-left":
-#             text_x, text_y = 50, height - 50
-#         elif args.watermark_position == "bottom-right":
-#             text_x, text_y = width - text_size[0] - 50, height - 50
-#         elif args.watermark_position == "center":
-#             text_x, text_y = (width - text_size[0]) // 2, (height + text_size[1]) // 2
-#         elif args.watermark_position == "cross":
-#             positions = [
-#             (50, 100),  # Top-left
-#             (width - text_size[0] - 50, 100),  # Top-right
-#             (50, height - 50),  # Bottom-left
-#             (width - text_size[0] - 50, height - 50)  # Bottom-right
-#         ]
-#         overlay = frame.copy()
-
-#         # Apply Black Outline for Better Visibility
-#         for dx, dy in [(-2, -2), (2, -2), (-2, 2), (2, 2)]:
-#             cv2.putText(overlay, args.watermark_text, (text_x + dx, text_y + dy), font, font_scale, (110, 110, 110), font_thickness, cv2.LINE_AA)
-
-#         # Blend Overlay for Smooth Appearance
-#         frame = cv2.addWeighted(overlay, 0.7, frame, 0.3, 0)
-
-#     # Write Frame to Video
-#     video_writer.write(frame)
-
-# video_writer.release()
-
-# # Get Video Details
-# video_size = os.stat(output_video_path).st_size / (1024 * 1024)  # Convert bytes to MB
-# cap = cv2.VideoCapture(output_video_path)
-
-# if not cap.isOpened():
-#     print("❌ Error opening video file")
-# else:
-#     frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-#     duration = frame_count / args.fps  # Total video duration in seconds
-#     bitrate = (video_size * 8) / duration if duration > 0 else 0  # Bitrate in Mbps
-    
-#     print(f"✅ Video Created: {output_video_path}")
-#     print(f"📏 Resolution: {width}x{height}")
-#     print(f"🎞️ Frame Count: {frame_count}")
-#     print(f"⏳ Duration: {duration:.2f} seconds")
-#     print(f"🎥 FPS: {args.fps}")
-#     print(f"📂 File Size: {video_size:.2f} MB")
-#     print(f"🔧 Bitrate: {bitrate:.2f} Mbps")  
-
-
-# cap.release()
+import os
+import sys
+import argparse
+import cv2
+import numpy as np
+from video import list_frames, read_frame, generate_video
+
+# Mapping User Input to OpenCV Font
+FONTS = {
+    "SIMPLEX": cv2.FONT_HERSHEY_SIMPLEX,
+    "PLAIN": cv2.FONT_HERSHEY_PLAIN,
+    "DUPLEX": cv2.FONT_HERSHEY_DUPLEX,
+    "COMPLEX": cv2.FONT_HERSHEY_COMPLEX,
+    "TRIPLEX": cv2.FONT_HERSHEY_TRIPLEX,
+    "ITALIC": cv2.FONT_HERSHEY_SCRIPT_SIMPLEX
+}
+
+LOGO_POSITIONS = ["top-left", "top-right", "bottom-left", "bottom-right"]
+WATERMARK_POSITIONS = LOGO_POSITIONS + ["center", "cross"]
+
+# Watermark text style
+FONT_SCALE = 10
+FONT_THICKNESS = 20
+OUTLINE_OFFSETS = [(-2, -2), (2, -2), (-2, 2), (2, 2)]
+TEXT_COLOR = (110, 110, 110)
+
+def load_logo(logo_path: str, width: int) -> tuple:
+    """Logo resized to 15% of the video width, split into (BGR, alpha 0-1)."""
+    logo = cv2.imread(logo_path, cv2.IMREAD_UNCHANGED)
+    if logo is None:
+        return None, None
+
+    logo_width = int(width * 0.15)
+    logo_height = int((logo.shape[0] / logo.shape[1]) * logo_width)
+    logo = cv2.resize(logo, (logo_width, logo_height), interpolation=cv2.INTER_AREA)
+
+    # Convert Logo to RGB (If it has alpha, separate it)
+    if logo.shape[2] == 4:
+        return logo[:, :, :3], logo[:, :, 3] / 255.0  # Normalize alpha
+    return logo, np.ones((logo.shape[0], logo.shape[1]), dtype=np.float32)  # Full opacity
+
+def logo_offset(position: str, size: tuple, logo_size: tuple) -> tuple:
+    """Top-left corner of the logo for a position (20 px from the edges)."""
+    width, height = size
+    logo_width, logo_height = logo_size
+    if position == "top-left":
+        return 20, 20
+    if position == "top-right":
+        return width - logo_width - 20, 20
+    if position == "bottom-left":
+        return 20, height - logo_height - 20
+    return width - logo_width - 20, height - logo_height - 20
+
+def watermark_positions(position: str, size: tuple, text_size: tuple) -> list:
+    """Text origins of the watermark ("cross" puts it in all four corners)."""
+    width, height = size
+    corners = {
+        "top-left": (50, 100),
+        "top-right": (width - text_size[0] - 50, 100),
+        "bottom-left": (50, height - 50),
+        "bottom-right": (width - text_size[0] - 50, height - 50),
+    }
+    if position == "center":
+        return [((width - text_size[0]) // 2, (height + text_size[1]) // 2)]
+    if position == "cross":
+        return list(corners.values())
+    return [corners[position]]
+
+class OverlayLayer:
+    """Precomputed overlay for one frame region: out = (frame * multiplier + addend) / 255 in 16-bit integers."""
+
+    def __init__(self, x: int, y: int, multiplier: np.ndarray, addend: np.ndarray = None):
+        self.x, self.y = x, y
+        self.height, self.width = multiplier.shape[:2]
+        self.multiplier = multiplier.astype(np.uint16)
+        self.addend = None if addend is None else addend.astype(np.uint16)
+
+    def apply(self, frame):
+        """Blend the layer into its region of the frame (in place)."""
+        roi = frame[self.y:self.y + self.height, self.x:self.x + self.width]
+        tmp = roi * self.multiplier
+        if self.addend is not None:
+            tmp += self.addend
+        # **Divide by 255 with rounding, all in 16 bits**
+        tmp += 128
+        tmp += tmp >> 8
+        tmp >>= 8
+        roi[...] = tmp
+        return frame
+
+def clip_region(x: int, y: int, width: int, height: int, size: tuple) -> tuple:
+    """Part of a region that lies inside the frame, as (x0, y0, x1, y1) in frame and (left, top) in region coordinates."""
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + width, size[0]), min(y + height, size[1])
+    return (x0, y0, x1, y1), (x0 - x, y0 - y)
+
+def logo_layer(logo_rgb, logo_alpha, x_offset: int, y_offset: int, size: tuple):
+    """Logo multiply + alpha blend folded into one per-pixel factor: roi * (a * logo / 255 + 1 - a)."""
+    factor = logo_alpha[:, :, None] * (logo_rgb / 255.0) + (1 - logo_alpha[:, :, None])
+    multiplier = np.rint(factor * 255)
+    (x0, y0, x1, y1), (left, top) = clip_region(x_offset, y_offset, multiplier.shape[1], multiplier.shape[0], size)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return OverlayLayer(x0, y0, multiplier[top:top + y1 - y0, left:left + x1 - x0])
+
+def merge_boxes(boxes: list) -> list:
+    """Merge overlapping (x0, y0, x1, y1) boxes until none of them intersect."""
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
+
+def watermark_layers(size: tuple, text: str, font: int, positions: list) -> list:
+    """Watermark rendered once as a coverage mask: overlay 0.7 + frame 0.3 only changes pixels under the text."""
+    width, height = size
+    mask = np.zeros((height, width), dtype=np.uint8)
+    boxes = []
+    for text_x, text_y in positions:
+        position_mask = np.zeros_like(mask)
+        for dx, dy in OUTLINE_OFFSETS:
+            cv2.putText(mask, text, (text_x + dx, text_y + dy), font, FONT_SCALE, 255, FONT_THICKNESS, cv2.LINE_AA)
+            cv2.putText(position_mask, text, (text_x + dx, text_y + dy), font, FONT_SCALE, 255, FONT_THICKNESS, cv2.LINE_AA)
+        x, y, box_width, box_height = cv2.boundingRect(position_mask)
+        if box_width and box_height:
+            boxes.append((x, y, x + box_width, y + box_height))
+
+    # **frame * (1 - 0.7c) + color * 0.7c, with c = text coverage**
+    alpha = np.rint(mask.astype(np.float32) * 0.7)[:, :, None]
+    color = np.array(TEXT_COLOR, dtype=np.float32)
+    layers = []
+    for x0, y0, x1, y1 in merge_boxes(boxes):
+        region_alpha = alpha[y0:y1, x0:x1]
+        layers.append(OverlayLayer(x0, y0, 255 - region_alpha, region_alpha * color))
+    return layers
+
+def apply_logo(frame, logo_rgb, logo_alpha, x_offset: int, y_offset: int):
+    """Multiply-blend the logo into the frame (in place; per-frame reference of logo_layer)."""
+    logo_height, logo_width = logo_rgb.shape[:2]
+
+    # Extract ROI from Frame (Same Size as Logo)
+    roi = frame[y_offset:y_offset + logo_height, x_offset:x_offset + logo_width]
+
+    # Multiply Blend Logo with Background
+    blended = cv2.multiply(roi.astype(np.float32), (logo_rgb / 255.0).astype(np.float32)).astype(np.uint8)
+
+    # Apply Alpha Mask for Smooth Blend
+    blended = (blended * logo_alpha[:, :, None] + roi * (1 - logo_alpha[:, :, None])).astype(np.uint8)
+
+    # Place Blended Logo Back on Frame
+    frame[y_offset:y_offset + logo_height, x_offset:x_offset + logo_width] = blended
+    return frame
+
+def apply_watermark(frame, text: str, font: int, positions: list):
+    """Draw the outlined watermark text on an overlay and blend it over the frame (per-frame reference of watermark_layers)."""
+    overlay = frame.copy()
+
+    # Apply Outline for Better Visibility
+    for text_x, text_y in positions:
+        for dx, dy in OUTLINE_OFFSETS:
+            cv2.putText(overlay, text, (text_x + dx, text_y + dy), font, FONT_SCALE, TEXT_COLOR, FONT_THICKNESS, cv2.LINE_AA)
+
+    # Blend Overlay for Smooth Appearance
+    return cv2.addWeighted(overlay, 0.7, frame, 0.3, 0)
+
+def print_video_details(output_video_path: str, fps: int, width: int, height: int):
+    """Print resolution, frame count, duration, size and bitrate of the written video."""
+    video_size = os.stat(output_video_path).st_size / (1024 * 1024)  # Convert bytes to MB
+    cap = cv2.VideoCapture(output_video_path)
+
+    if not cap.isOpened():
+        print("❌ Error opening video file")
+    else:
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        duration = frame_count / fps  # Total video duration in seconds
+        bitrate = (video_size * 8) / duration if duration > 0 else 0  # Bitrate in Mbps
+
+        print(f"✅ Video Created: {output_video_path}")
+        print(f"📏 Resolution: {width}x{height}")
+        print(f"🎞️ Frame Count: {frame_count}")
+        print(f"⏳ Duration: {duration:.2f} seconds")
+        print(f"🎥 FPS: {fps}")
+        print(f"📂 File Size: {video_size:.2f} MB")
+        print(f"🔧 Bitrate: {bitrate:.2f} Mbps")
+
+    cap.release()
+
+if __name__ == "__main__":
+    # Argument Parser Setup
+    parser = argparse.ArgumentParser(description="Generate Video with Logo Overlay and Watermark")
+    parser.add_argument("-i", "--input", required=True, help="Input folder path")
+    parser.add_argument("-o", "--output", required=True, help="Output folder path")
+    parser.add_argument("-f", "--format", required=True, choices=["mp4", "mov"], help="Video format")
+    parser.add_argument("--fps", type=int, default=30, help="Frames per second (default: 30)")
+    parser.add_argument("-imgf", "--image_format", required=True, choices=["jpg", "jpeg", "png", "webp"], help="Input image format")
+    parser.add_argument("-l", "--logo", required=True, help="Company logo (PNG)")
+    parser.add_argument("-res", "--resolution", help="Custom resolution in WxH format (e.g., 1920x1080)")
+    parser.add_argument("-p", "--position", required=True, choices=LOGO_POSITIONS, help="Logo position in video")
+    parser.add_argument("-wt", "--watermark_text", help="Watermark text to overlay on the video")
+    parser.add_argument("-wtf", "--watermark_font", required=True, choices=list(FONTS), help="Watermark text font type")
+    parser.add_argument("-wtp", "--watermark_position", required=True, choices=WATERMARK_POSITIONS, help="Watermark text position")
+    parser.add_argument("-t", "--threads", type=int, default=os.cpu_count() or 1, help="Frames decoded in parallel (default: CPU count)")
+    args = parser.parse_args()
+
+    # Ensure Output Folder Exists
+    output_folder = args.output
+    os.makedirs(output_folder, exist_ok=True)
+
+    # Construct Output Video Path
+    input_folder_name = os.path.basename(os.path.normpath(args.input))
+    output_video_path = os.path.join(output_folder, f"{input_folder_name}.{args.format}")
+
+    # Read and Sort Images (Case-Insensitive)
+    image_files = list_frames(args.input, (args.image_format.lower(),))
+    if not image_files:
+        print(f"❌ No images found in '{args.input}' with format '{args.image_format}'!")
+        sys.exit(1)
+
+    # Get Image Dimensions (Default to first image size)
+    first_img = read_frame(image_files[0])
+    if first_img is None:
+        print(f"❌ Failed to read the first image: {image_files[0]}")
+        sys.exit(1)
+    height, width, _ = first_img.shape  # Default resolution
+
+    # Set Custom Resolution If Provided
+    if args.resolution:
+        try:
+            width, height = map(int, args.resolution.replace("*", "x").split("x"))
+        except ValueError:
+            print("❌ Invalid resolution format! Use WxH (e.g., 1920x1080)")
+            sys.exit(1)
+
+    # Load Logo Image
+    logo_rgb, logo_alpha = load_logo(args.logo, width)
+    if logo_rgb is None:
+        print(f"❌ Failed to load logo image: {args.logo}")
+        sys.exit(1)
+    x_offset, y_offset = logo_offset(args.position, (width, height), (logo_rgb.shape[1], logo_rgb.shape[0]))
+
+    # **Overlay Layers Rendered Once for the Video Resolution (Logo First, Then Watermark)**
+    layers = [logo_layer(logo_rgb, logo_alpha, x_offset, y_offset, (width, height))]
+    font = FONTS[args.watermark_font]
+    if args.watermark_text:
+        text_size = cv2.getTextSize(args.watermark_text, font, FONT_SCALE, FONT_THICKNESS)[0]
+        text_positions = watermark_positions(args.watermark_position, (width, height), text_size)
+        layers += watermark_layers((width, height), args.watermark_text, font, text_positions)
+    layers = [layer for layer in layers if layer is not None]
+
+    def overlay_frame(frame):
+        """Logo + watermark of one frame (runs in the prefetch workers, touches only the layer regions)."""
+        for layer in layers:
+            layer.apply(frame)
+        return frame
+
+    # **Decode, Resize and Overlay in Parallel, Written in Order by One Writer Thread**
+    generate_video(image_files, output_video_path, (width, height), args.fps, workers=args.threads, transform=overlay_frame)
+
+    # Get Video Details
+    print_video_details(output_video_path, args.fps, width, height)
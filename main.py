@@ -1,7 +1,12 @@
 import os
 import logging
 from PIL import Image, ImageChops
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from scheduler import BYTES_PER_PIXEL, create_executor, submit_streaming, image_pixels, buffer_memory, memory_budget_bytes
+from pairs import iter_image_pairs
+from png_profiles import DEFAULT_PNG_PROFILE, save_png
+from compositing import composite_pair
+from readahead import read_ahead, source_of, open_source
+from tracing import tracer, enable_tracing, worker_initializer, traced_task, task_result, finish_trace
 
 # Setup logging configuration
 logging.basicConfig(
@@ -41,68 +46,91 @@ def compose_final_image(processed_bg: Image.Image, centered_transparent: Image.I
     """Combine the processed background with the transparent image."""
     return Image.alpha_composite(processed_bg.convert("RGBA"), centered_transparent)
 
-def process_image_pair(input_folder: str, output_folder: str, bg_file: str, no_bg_file: str):
-    """Process an image pair (background + transparent) and save results."""
+def process_image_pair(input_folder: str, output_folder: str, bg_file: str, no_bg_file: str, png_profile: str = DEFAULT_PNG_PROFILE, buffers: dict = None):
+    """Process an image pair (background + transparent) and save results, decoding read-ahead buffers when given."""
     os.makedirs(output_folder, exist_ok=True)
+    images = []
     try:
-        img_with_bg = Image.open(os.path.join(input_folder, bg_file))
-        img_no_bg = Image.open(os.path.join(input_folder, no_bg_file))
-
-        # Get actual image size (assuming both images have the same size)
-        final_size = img_with_bg.size  
-
-        centered_transparent, (dx, dy) = center_image(img_no_bg, final_size=final_size)
-        processed_bg = process_background(img_with_bg, dx, dy, final_size=final_size)
-        final_image = compose_final_image(processed_bg, centered_transparent)
-
-        # Save output images
-        centered_transparent.save(os.path.join(output_folder, no_bg_file), "PNG")
-        final_image.save(os.path.join(output_folder, bg_file), "PNG")
+        with tracer.stage("pair"):
+            bg_path, no_bg_path = os.path.join(input_folder, bg_file), os.path.join(input_folder, no_bg_file)
+            with tracer.stage("decode") as stage:
+                img_with_bg = open_source(bg_path, buffers)
+                img_no_bg = open_source(no_bg_path, buffers)
+                if stage.active:
+                    # Decode here so the time is not billed to the next stage
+                    img_with_bg.load()
+                    img_no_bg.load()
+                    stage.bytes = os.path.getsize(bg_path) + os.path.getsize(no_bg_path)
+            images += [img_with_bg, img_no_bg]
+
+            # Get actual image size (assuming both images have the same size)
+            final_size = img_with_bg.size  
+
+            with tracer.stage("center"):
+                centered_transparent, (dx, dy) = center_image(img_no_bg, final_size=final_size)
+            # Background multiply and final composition in a single pass
+            with tracer.stage("composite"):
+                final_image = composite_pair(img_with_bg, centered_transparent, dx, dy, final_size)
+            images += [centered_transparent, final_image]
+
+            # Save output images with the selected PNG encode profile
+            for image, file_name in ((centered_transparent, no_bg_file), (final_image, bg_file)):
+                output_file = os.path.join(output_folder, file_name)
+                with tracer.stage("encode_png") as stage:
+                    save_png(image, output_file, png_profile)
+                    if stage.active:
+                        stage.bytes = os.path.getsize(output_file)
 
         logging.info(f"Processed: {bg_file} | dx={dx}, dy={dy} | Size: {final_size}")
 
     except Exception as e:
         logging.error(f"Error processing images in {input_folder}: {e}")
 
-def process_images_in_folders(input_root: str, output_root: str):
+    finally:
+        # Free the decoded images now, not whenever the last reference goes away
+        for image in images:
+            image.close()
+
+def pair_paths(pair: tuple) -> list:
+    """Input files of a discovered (input_folder, output_folder, bg_file, no_bg_file) pair."""
+    input_folder, _, bg_file, no_bg_file = pair
+    return [os.path.join(input_folder, bg_file), os.path.join(input_folder, no_bg_file)]
+
+def pair_memory(pair: tuple, buffers: dict = None, backend: str = "thread") -> int:
+    """Estimated peak bytes of one pair (two inputs, centered canvas, final image), from the image headers (plus its read-ahead buffers)."""
+    return 4 * BYTES_PER_PIXEL * max(image_pixels(source_of(path, buffers)) for path in pair_paths(pair)) + buffer_memory(buffers, backend)
+
+def process_images_in_folders(input_root: str, output_root: str, max_workers: int = 10, backend: str = "thread", png_profile: str = DEFAULT_PNG_PROFILE, memory_budget_mb: int = None, readahead: int = 0):
     """Process all images inside multiple subfolders and nested subfolders in parallel."""
-    for root, dirs, _ in os.walk(input_root):
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            future_tasks = []
-            for subfolder in dirs:
-                # Process all subfolders without specific name conditions
-                input_folder = os.path.join(root, subfolder)
-                output_folder = os.path.join(output_root, os.path.relpath(input_folder, input_root))
-                os.makedirs(output_folder, exist_ok=True)
-                logging.info(f"Processing folder: {input_folder}")
-
-                # Get all PNG images from folder
-                all_files = os.listdir(input_folder)
-
-                # Categories: R, W, Y
-                categories = ["R", "W", "Y"]
-                for category in categories:
-                    bg_images = [f for f in all_files if f.startswith(f"{subfolder}-{category}-") and f.endswith(".png")]
-                    no_bg_images = [f for f in all_files if f.startswith(f"{subfolder}-{category}A-") and f.endswith(".png")]
-
-                    for bg_file in bg_images:
-                        corresponding_no_bg = bg_file.replace(f"-{category}-", f"-{category}A-")
-                        if corresponding_no_bg in no_bg_images:
-                            future_tasks.append(executor.submit(
-                                process_image_pair, input_folder, output_folder, bg_file, corresponding_no_bg
-                            ))
-
-            # Wait for all tasks to complete
-            for future in as_completed(future_tasks):
-                try:
-                    future.result()
-                except Exception as e:
-                    logging.error(f"Error in thread execution: {e}")
+    memory_budget = memory_budget_bytes(memory_budget_mb)
+    # One worker pool for the whole tree; pairs are submitted while folders are still being scanned
+    # (and, with readahead, while the files of the next pairs are read into memory)
+    with create_executor(backend, max_workers, worker_initializer()) as executor:
+        pairs = read_ahead(iter_image_pairs(input_root, output_root, recursive=True), pair_paths, readahead)
+        tasks = (
+            (*traced_task(process_image_pair, (*pair, png_profile, buffers), backend), pair[2],
+             pair_memory(pair, buffers, backend) if memory_budget else 0)
+            for pair, buffers in pairs
+        )
+        for bg_file, future in submit_streaming(executor, tasks, max_pending=max_workers * 4, memory_budget=memory_budget):
+            try:
+                task_result(future.result(), backend)
+            except Exception as e:
+                logging.error(f"Error in thread execution: {e}")
 
 if __name__ == "__main__":
     input_folder_path = r"C:\\Users\\UMANG VACHHANI\\Desktop\\image_process\\parents\\input"
     output_folder_path = r"C:\\Users\\UMANG VACHHANI\\Desktop\\image_process\\P_output"
-
-    process_images_in_folders(input_folder_path, output_folder_path)
+    backend = "thread"  # "thread" or "process" (max_workers worker processes, see below)
+    png_profile = "balanced"  # "fast", "balanced" or "smallest" (see png_profiles.py)
+    trace = False  # True = print per-stage timings at the end
+    trace_file = None  # e.g. "trace.json" for a Chrome trace of all stages and workers
+    memory_budget_mb = None  # e.g. 4096 = at most ~4 GB of decoded images in flight
+    readahead = 0  # e.g. 8 = read the files of the next 8 pairs into memory (slow / network storage)
+
+    if trace or trace_file:
+        enable_tracing()
+    process_images_in_folders(input_folder_path, output_folder_path, max_workers=10, backend=backend, png_profile=png_profile, memory_budget_mb=memory_budget_mb, readahead=readahead)
+    finish_trace("pair", trace_file)
 
 
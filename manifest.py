@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+# **Manifest File (stored at the root of the output tree)**
+MANIFEST_NAME = ".image_process_manifest.json"
+
+# **Incremental Modes**
+# mtime : input is unchanged when size + modification time match
+# hash  : size + mtime is only the fast path, otherwise the SHA-256 of the content decides
+INCREMENTAL_MODES = ("mtime", "hash")
+
+# **Save the manifest every N recorded outputs (keeps progress if a run is interrupted)**
+SAVE_EVERY = 200
+
+# **Seconds after which the save lock of a shared manifest is treated as left behind by a crashed node**
+SAVE_LOCK_STALE = 60
+
+def take_over_save_lock(lock_path: str, holder: str) -> bool:
+    """Remove a save lock older than SAVE_LOCK_STALE (its node crashed); only one node wins the rename, like FolderClaims.take_over."""
+    try:
+        if time.time() - os.path.getmtime(lock_path) < SAVE_LOCK_STALE:
+            return False
+        with open(lock_path) as f:
+            stale = f.read()
+        moved = f"{lock_path}.stale.{holder.replace(':', '_')}"
+        os.rename(lock_path, moved)
+    except OSError:
+        return False
+    with open(moved) as f:
+        replaced = f.read() != stale
+    if replaced:
+        # **Another node replaced the stale lock in between: give its fresh lock back
+        # (link fails instead of replacing a lock a third node created meanwhile)**
+        try:
+            os.link(moved, lock_path)
+        except FileExistsError:
+            logging.warning(f"Could not give back save lock {os.path.basename(lock_path)}: another node took it in between")
+        os.remove(moved)
+        return False
+    os.remove(moved)
+    logging.warning(f"Took over stale save lock {os.path.basename(lock_path)}")
+    return True
+
+@contextmanager
+def save_lock(lock_path: str):
+    """Exclusive lock file (O_EXCL, works on shared filesystems) held while a shared manifest is merged and written;
+    it names its holder, so a stale lock is only ever taken over once."""
+    holder = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}:{time.time()}"
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            if not take_over_save_lock(lock_path, holder):
+                time.sleep(0.1)
+            continue
+        with os.fdopen(fd, "w") as f:
+            f.write(holder)
+        break
+    try:
+        yield
+    finally:
+        # **Only remove the lock if it is still ours (a save that outlived SAVE_LOCK_STALE may have lost it)**
+        try:
+            with open(lock_path) as f:
+                ours = f.read() == holder
+            if ours:
+                os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def normalize_params(params: dict) -> dict:
+    """Parameters as they read back from JSON (tuples become lists)."""
+    return json.loads(json.dumps(params, sort_keys=True))
+
+class Manifest:
+    """Record of every output with the inputs and parameters it was built from."""
+
+    def __init__(self, root: str, mode: str = "mtime", shared: bool = False):
+        if mode not in INCREMENTAL_MODES:
+            raise ValueError(f"Unknown incremental mode '{mode}'. Choose from {', '.join(INCREMENTAL_MODES)}")
+        self.root = root
+        self.mode = mode
+        self.path = os.path.join(root, MANIFEST_NAME)
+        self.lock = threading.Lock()
+        self.unsaved = 0
+        self.shared = shared  # **Several nodes write this manifest: every save merges with the file on disk**
+        self.changed = set()
+        self.entries = self.load()
+
+    def load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable manifest {self.path}: {e}")
+            return {}
+
+    def key(self, output_path: str) -> str:
+        """Manifest key of an output (path relative to the manifest root)."""
+        return os.path.relpath(output_path, self.root).replace(os.sep, "/")
+
+    def input_key(self, path: str) -> str:
+        """Manifest key of an input (absolute path, inputs usually live outside the output tree)."""
+        return os.path.abspath(path).replace(os.sep, "/")
+
+    def fingerprint(self, path: str, previous: dict = None) -> dict:
+        """Size + mtime of an input, plus its content hash in 'hash' mode."""
+        stat = os.stat(path)
+        fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if self.mode == "hash":
+            if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns and "sha256" in previous:
+                fingerprint["sha256"] = previous["sha256"]  # **Fast path: unchanged file, no re-hash**
+            else:
+                fingerprint["sha256"] = file_sha256(path)
+        return fingerprint
+
+    def input_unchanged(self, path: str, previous: dict) -> bool:
+        """Check one input against its recorded fingerprint."""
+        if previous is None or not os.path.exists(path):
+            return False
+        stat = os.stat(path)
+        if previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+            return True
+        # **Touched or copied file: only the content hash can tell if it really changed**
+        return self.mode == "hash" and "sha256" in previous and previous["sha256"] == file_sha256(path)
+
+    def is_up_to_date(self, output_path: str, inputs: list, params: dict, outputs: list = None) -> bool:
+        """True when the output exists and was built from the same inputs and parameters."""
+        with self.lock:
+            entry = self.entries.get(self.key(output_path))
+        if entry is None or entry.get("params") != normalize_params(params):
+            return False
+        if not all(os.path.exists(path) for path in (outputs or [output_path])):
+            return False
+        recorded = entry.get("inputs", {})
+        return all(self.input_unchanged(path, recorded.get(self.input_key(path))) for path in inputs)
+
+    def record(self, output_path: str, inputs: list, params: dict):
+        """Store the inputs and parameters an output was just built from."""
+        key = self.key(output_path)
+        with self.lock:
+            previous = self.entries.get(key, {}).get("inputs", {})
+        entry = {
+            "params": normalize_params(params),
+            "inputs": {self.input_key(path): self.fingerprint(path, previous.get(self.input_key(path))) for path in inputs},
+        }
+        with self.lock:
+            self.entries[key] = entry
+            self.changed.add(key)
+            self.unsaved += 1
+            save_now = self.unsaved >= SAVE_EVERY
+        if save_now:
+            self.save()
+
+    def save(self):
+        """Write the manifest atomically (temporary file + rename); a shared manifest first takes the entries other nodes saved meanwhile."""
+        with self.lock:
+            os.makedirs(self.root, exist_ok=True)
+            if self.shared:
+                with save_lock(f"{self.path}.lock"):
+                    entries = self.load()
+                    entries.update({key: self.entries[key] for key in self.changed})
+                    self.entries = entries
+                    self.write()
+            else:
+                self.write()
+            self.unsaved = 0
+            self.changed.clear()
+
+    def write(self):
+        tmp_path = f"{self.path}.{socket.gethostname()}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
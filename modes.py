@@ -0,0 +1,41 @@
+from PIL import Image
+
+# **Modes Each Encoder Takes Without Converting (first entry = what anything else is converted to)**
+# jpeg / avif : RGB only (alpha is dropped)
+# webp        : RGBA, or RGB for sources without alpha (same file as an opaque RGBA image)
+ENCODER_MODES = {"jpeg": ("RGB",), "avif": ("RGB",), "webp": ("RGBA", "RGB")}
+
+# **Modes the resize / compositing code works in directly**
+WORKING_MODES = ("RGB", "RGBA")
+
+def working_mode(source_mode: str, formats: list) -> str:
+    """Mode a decoded image is kept in: RGB when the source has no alpha and no encoder needs one, RGBA otherwise."""
+    if source_mode == "RGB" and all("RGB" in ENCODER_MODES[fmt] for fmt in formats):
+        return "RGB"
+    return "RGBA"
+
+def encoder_mode(image_mode: str, fmt: str) -> str:
+    """Mode an image of `image_mode` is handed to the encoder of `fmt` in."""
+    modes = ENCODER_MODES[fmt]
+    return image_mode if image_mode in modes else modes[0]
+
+def to_mode(image: Image.Image, mode: str) -> Image.Image:
+    """The image in `mode`, converting only when it is not already in it."""
+    return image if image.mode == mode else image.convert(mode)
+
+def encoder_inputs(image: Image.Image, formats: list) -> dict:
+    """Image per format for encoding, with at most one conversion per distinct encoder mode (shared by the formats)."""
+    converted = {image.mode: image}
+    inputs = {}
+    for fmt in formats:
+        mode = encoder_mode(image.mode, fmt)
+        if mode not in converted:
+            converted[mode] = image.convert(mode)
+        inputs[fmt] = converted[mode]
+    return inputs
+
+def rgb_source(image: Image.Image) -> tuple:
+    """(image, has_alpha) for an RGB point operation: RGB / RGBA are used as they are, anything else is converted to RGB once."""
+    if image.mode in WORKING_MODES:
+        return image, image.mode == "RGBA"
+    return image.convert("RGB"), False
@@ -0,0 +1,60 @@
+import os
+import logging
+from collections import deque
+
+# **Image Categories (background: <SKU>-R-V1.png, transparent: <SKU>-RA-V1.png)**
+CATEGORIES = ("R", "W", "Y")
+
+def iter_folder_pairs(folder: str, sku: str, subfolders: list = None):
+    """Yield (bg_file, no_bg_file) pairs of one SKU folder as soon as both files are seen (single scandir pass)."""
+    prefix = f"{sku}-"
+    backgrounds, cutouts = {}, {}  # **Hash index: (category, view) -> file name still waiting for its partner**
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            name = entry.name
+            if entry.is_dir():
+                if subfolders is not None:
+                    subfolders.append(entry.path)
+                continue
+            if not (name.startswith(prefix) and name.endswith(".png")):
+                continue
+            category, separator, view = name[len(prefix):].partition("-")
+            if not separator:
+                continue
+
+            if category in CATEGORIES:
+                no_bg_file = cutouts.pop((category, view), None)
+                if no_bg_file is None:
+                    backgrounds[(category, view)] = name
+                else:
+                    yield name, no_bg_file
+            elif len(category) == 2 and category[1] == "A" and category[0] in CATEGORIES:
+                bg_file = backgrounds.pop((category[0], view), None)
+                if bg_file is None:
+                    cutouts[(category[0], view)] = name
+                else:
+                    yield bg_file, name
+
+def iter_image_pairs(input_root: str, output_root: str, recursive: bool = False, folders: list = None, select=None):
+    """Stream (input_folder, output_folder, bg_file, no_bg_file) for every SKU folder below input_root
+    (only `folders` when given; folders whose relative path `select` rejects are not scanned)."""
+    if folders is not None:
+        pending = deque(os.path.join(input_root, folder) for folder in folders)
+    else:
+        with os.scandir(input_root) as entries:
+            pending = deque(sorted(entry.path for entry in entries if entry.is_dir()))
+
+    while pending:
+        input_folder = pending.popleft()
+        relative_folder = os.path.relpath(input_folder, input_root)
+        if select is not None and not select(relative_folder):
+            continue
+        output_folder = os.path.join(output_root, relative_folder)
+        logging.info(f"Processing folder: {input_folder}")
+
+        # **Nested SKU folders are only followed in recursive mode (like os.walk)**
+        subfolders = [] if recursive else None
+        for bg_file, no_bg_file in iter_folder_pairs(input_folder, os.path.basename(input_folder), subfolders):
+            yield input_folder, output_folder, bg_file, no_bg_file
+        if subfolders:
+            pending.extend(subfolders)
@@ -0,0 +1,125 @@
+import io
+import os
+import time
+import zlib
+import struct
+import threading
+import numpy as np
+from PIL import Image
+
+# **PNG Encode Profiles (zlib level + strategy; Pillow always picks the row filters adaptively)**
+# fast     : level 1 + Z_RLE, fastest encode, run-length friendly product shots stay small
+# balanced : zlib default level 6 (same files as a plain image.save(..., "PNG"))
+# smallest : level 9 + optimize, slowest encode, smallest files
+PNG_PROFILES = {
+    "fast": {"compress_level": 1, "compress_type": zlib.Z_RLE},
+    "balanced": {"compress_level": 6},
+    "smallest": {"compress_level": 9, "optimize": True},
+}
+DEFAULT_PNG_PROFILE = "balanced"
+
+def save_png(image: Image.Image, path, profile: str = DEFAULT_PNG_PROFILE):
+    """Save a PNG (path or file object) with the encoder settings of a profile."""
+    image.save(path, "PNG", **PNG_PROFILES[profile])
+
+# **PNG Stream Constants (signature, color type per mode)**
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_COLOR_TYPES = {"RGB": 2, "RGBA": 6}
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+def filter_rows(rows: np.ndarray, previous: np.ndarray, bpp: int) -> np.ndarray:
+    """PNG-filter a block of rows (uint8, one row per line) with the adaptive heuristic: per row, the filter with
+    the smallest sum of absolute signed bytes; returns the filtered rows with their filter byte in front."""
+    up = np.vstack([previous[None, :], rows[:-1]])
+    left = np.zeros_like(rows)
+    left[:, bpp:] = rows[:, :-bpp]
+    up_left = np.zeros_like(rows)
+    up_left[:, bpp:] = up[:, :-bpp]
+
+    # **Paeth predictor, vectorized over the whole block (the only filter that needs more than 8 bits)**
+    left16, up16, up_left16 = left.astype(np.int16), up.astype(np.int16), up_left.astype(np.int16)
+    estimate = left16 + up16 - up_left16
+    distance_left, distance_up, distance_up_left = np.abs(estimate - left16), np.abs(estimate - up16), np.abs(estimate - up_left16)
+    paeth = np.where((distance_left <= distance_up) & (distance_left <= distance_up_left), left,
+                     np.where(distance_up <= distance_up_left, up, up_left))
+
+    # **None, Sub, Up, Average, Paeth (uint8 arithmetic wraps modulo 256 like the PNG filters)**
+    average = (left >> 1) + (up >> 1) + (left & up & 1)
+    candidates = np.stack([rows, rows - left, rows - up, rows - average, rows - paeth])
+    best = np.minimum(candidates, -candidates).sum(axis=2, dtype=np.uint32).argmin(axis=0)
+    filtered = candidates[best, np.arange(len(rows))]
+    return np.hstack([best.astype(np.uint8)[:, None], filtered])
+
+class PngStreamWriter:
+    """Write an RGB / RGBA PNG block of rows by block (no full image in memory), with the zlib settings of a profile;
+    the file is written next to `path` and only moved there by close() (abort() drops it)."""
+
+    def __init__(self, path: str, size: tuple, mode: str = "RGBA", profile: str = DEFAULT_PNG_PROFILE):
+        settings = PNG_PROFILES[profile]
+        self.width, self.height = size
+        self.bpp = len(mode)
+        self.rows_written = 0
+        self.previous = np.zeros(self.width * self.bpp, dtype=np.uint8)
+        self.compressor = zlib.compressobj(settings.get("compress_level", 6), zlib.DEFLATED, zlib.MAX_WBITS, 9,
+                                           settings.get("compress_type", zlib.Z_DEFAULT_STRATEGY))
+        self.path = path
+        self.temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.file = open(self.temp_path, "wb")
+        self.file.write(PNG_SIGNATURE)
+        self.file.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, PNG_COLOR_TYPES[mode], 0, 0, 0)))
+
+    def write(self, image: Image.Image):
+        """Append the next rows (an image as wide as the PNG)."""
+        rows = np.asarray(image).reshape(image.height, self.width * self.bpp)
+        data = self.compressor.compress(filter_rows(rows, self.previous, self.bpp).tobytes())
+        if data:
+            self.file.write(png_chunk(b"IDAT", data))
+        self.previous = rows[-1].copy()
+        self.rows_written += image.height
+
+    def close(self):
+        """Finish the image (all rows must have been written) and move it to its path."""
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"PNG stream got {self.rows_written} of {self.height} rows")
+            self.file.write(png_chunk(b"IDAT", self.compressor.flush()))
+            self.file.write(png_chunk(b"IEND", b""))
+            self.file.close()
+            os.replace(self.temp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        """Drop an unfinished image: close and remove the temporary file, nothing is left at the path."""
+        self.file.close()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+def profile_report(images: list) -> list:
+    """Encode every image with every profile in memory; returns (profile, seconds, bytes) totals."""
+    rows = []
+    for profile in PNG_PROFILES:
+        seconds, size = 0.0, 0
+        for image in images:
+            buffer = io.BytesIO()
+            start = time.perf_counter()
+            save_png(image, buffer, profile)
+            seconds += time.perf_counter() - start
+            size += buffer.tell()
+        rows.append((profile, seconds, size))
+    return rows
+
+def print_profile_report(rows: list, image_count: int):
+    """Print encode time vs. size per profile, relative to the balanced profile."""
+    base_seconds, base_size = next((seconds, size) for profile, seconds, size in rows if profile == DEFAULT_PNG_PROFILE)
+    print(f"\nPNG profile report ({image_count} images from the current batch)")
+    print(f"{'Profile':<10} {'Encode time':>12} {'Per image':>10} {'Total size':>12} {'vs balanced':>22}")
+    for profile, seconds, size in rows:
+        per_image = seconds / max(image_count, 1)
+        relative = f"{seconds / base_seconds:.2f}x time, {size / base_size:.2f}x size" if base_seconds and base_size else "-"
+        print(f"{profile:<10} {seconds:>11.2f}s {per_image:>9.2f}s {size / 1e6:>10.2f}MB {relative:>22}")
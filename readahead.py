@@ -0,0 +1,47 @@
+import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from tracing import tracer
+
+# **I/O Threads per Read-Ahead Stage (several reads in flight hide network latency)**
+MAX_IO_THREADS = 4
+
+def read_file(path: str):
+    """Whole file in memory, or None if it cannot be read (the worker then opens the path and reports the error)."""
+    with tracer.stage("read") as stage:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if stage.active:
+            stage.bytes = len(data)
+    return data
+
+def read_ahead(items, paths_of, depth: int):
+    """Yield (item, {path: bytes}) in order while the files of the next `depth` items are read on I/O threads."""
+    if depth <= 0:
+        for item in items:
+            yield item, None
+        return
+
+    with ThreadPoolExecutor(max_workers=min(depth, MAX_IO_THREADS), thread_name_prefix="readahead") as reader:
+        pending = deque()
+        for item in items:
+            pending.append((item, {path: reader.submit(read_file, path) for path in paths_of(item)}))
+            if len(pending) > depth:
+                item, reads = pending.popleft()
+                yield item, {path: future.result() for path, future in reads.items()}
+        while pending:
+            item, reads = pending.popleft()
+            yield item, {path: future.result() for path, future in reads.items()}
+
+def source_of(path: str, buffers: dict = None):
+    """In-memory file object of a path when it was read ahead, the path itself otherwise."""
+    data = buffers.get(path) if buffers else None
+    return io.BytesIO(data) if data is not None else path
+
+def open_source(path: str, buffers: dict = None) -> Image.Image:
+    """Open an image from its read-ahead buffer when there is one, from disk otherwise."""
+    return Image.open(source_of(path, buffers))
@@ -1,12 +1,34 @@
 import os
 import sys
+import math
+import argparse
 import logging
+from itertools import groupby
+from contextlib import nullcontext
 from PIL import Image, ImageChops
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from scheduler import BACKENDS, BYTES_PER_PIXEL, create_executor, submit_streaming, image_pixels, buffer_memory, memory_budget_bytes
+from pairs import iter_image_pairs, iter_folder_pairs
+from compositing import composite_pair
+from manifest import INCREMENTAL_MODES, Manifest
+from png_profiles import PNG_PROFILES, DEFAULT_PNG_PROFILE, PngStreamWriter, save_png, profile_report, print_profile_report
+from readahead import read_ahead, source_of, open_source
+from dedupe import DEDUPE_MODES, PLACE_MODES, DedupeStore, replace_output
+from sharding import DEFAULT_STALE_AFTER, FolderClaims, parse_shard, folder_filter
+from sku_geometry import GEOMETRY_MODES, analyze_cutouts
+from watch import DEFAULT_SETTLE, DEFAULT_POLL_INTERVAL, create_watcher, watch_pairs
+from tracing import tracer, enable_tracing, worker_initializer, traced_task, task_result, finish_trace
+from encoders import jpeg_options, webp_options, avif_options, parse_formats, format_settings, resize_image, encode_formats, RESAMPLE_MODES
 
 # **Logging Setup**
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# **Decoded images a pair holds at its peak: both inputs, both scaled regions, the transparent canvas and the final image**
+PAIR_WORKING_IMAGES = 6
+
+# **Tiled mode: canvas rows rendered and encoded per strip (peak = both inputs + a few strips, whatever the resolution)**
+DEFAULT_TILE_HEIGHT = 128
+PAIR_WORKING_IMAGES_TILED = 2
+
 def find_center_of_non_transparent_area(image: Image.Image) -> tuple:
     """Find center of non-transparent area."""
     bbox = image.getbbox()
@@ -19,8 +41,10 @@ def calculate_zoom_with_margins(image: Image.Image, final_size: tuple, margins:
     """Calculate zoom factor, but only apply if margins are enabled."""
     if not apply_margins:
         return 1.0  # **No Zoom when margins are disabled**
+    return zoom_for_bbox(image.getbbox(), final_size, margins)
 
-    bbox = image.getbbox()
+def zoom_for_bbox(bbox: tuple, final_size: tuple, margins: tuple) -> float:
+    """Zoom factor that fits the object bounding box inside the margins."""
     if bbox is None:
         return 1.0  # No object found, default zoom factor
 
@@ -33,17 +57,21 @@ def calculate_zoom_with_margins(image: Image.Image, final_size: tuple, margins:
 
     return min(available_width / object_width, available_height / object_height)
 
+def scaled_size(size: tuple, zoom_factor: float) -> tuple:
+    """Size of an image after scale_image."""
+    if zoom_factor == 1.0:
+        return size
+    return (int(size[0] * zoom_factor), int(size[1] * zoom_factor))
+
 def scale_image(image: Image.Image, zoom_factor: float) -> Image.Image:
     """Scale image based on zoom factor."""
     if zoom_factor == 1.0:
         return image  # **No resizing if zoom factor is 1.0**
-    new_width = int(image.width * zoom_factor)
-    new_height = int(image.height * zoom_factor)
-    return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    return image.resize(scaled_size(image.size, zoom_factor), Image.Resampling.LANCZOS)
 
-def center_image(image: Image.Image, final_size: tuple, margins: tuple, apply_margins: bool) -> tuple:
-    """Center the image, apply margins only if enabled."""
-    center_x, center_y = find_center_of_non_transparent_area(image)
+def offset_to_center(center: tuple, final_size: tuple, margins: tuple, apply_margins: bool) -> tuple:
+    """Move (dx, dy) that puts `center` in the middle of the area inside the margins."""
+    center_x, center_y = center
 
     if apply_margins:
         top_margin, bottom_margin, left_margin, right_margin = margins
@@ -52,6 +80,11 @@ def center_image(image: Image.Image, final_size: tuple, margins: tuple, apply_ma
 
     dx = ((final_size[0] - left_margin - right_margin) // 2) - center_x + left_margin
     dy = ((final_size[1] - top_margin - bottom_margin) // 2) - center_y + top_margin
+    return dx, dy
+
+def center_image(image: Image.Image, final_size: tuple, margins: tuple, apply_margins: bool) -> tuple:
+    """Center the image, apply margins only if enabled."""
+    dx, dy = offset_to_center(find_center_of_non_transparent_area(image), final_size, margins, apply_margins)
 
     logging.info(f"Image centered: Move by (dx={dx}, dy={dy}) pixels. {'Margins Applied' if apply_margins else 'No Margins'}")
     
@@ -60,100 +93,543 @@ def center_image(image: Image.Image, final_size: tuple, margins: tuple, apply_ma
 
     return centered_img, (dx, dy)
 
-def process_background(background_image: Image.Image, dx: int, dy: int, final_size: tuple) -> Image.Image:
-    """Apply blue background and align properly."""
-    blue_canvas = Image.new("RGB", final_size, (0, 0, 255))  # Blue BG
+def plan_geometry(image: Image.Image, final_size: tuple, margins: tuple, apply_margins: bool) -> dict:
+    """Zoom factor and centering move from a single bounding box of the unscaled transparent image."""
+    bbox = image.getbbox()
+    zoom_factor = zoom_for_bbox(bbox, final_size, margins) if apply_margins else 1.0
+    scaled_width, scaled_height = scaled_size(image.size, zoom_factor)
+
+    # **Scaled bounding box derived analytically (no getbbox on the resized image)**
+    if bbox is None:
+        center = (scaled_width // 2, scaled_height // 2)  # Default center
+    else:
+        scale_x, scale_y = scaled_width / image.width, scaled_height / image.height
+        left, upper = math.floor(bbox[0] * scale_x), math.floor(bbox[1] * scale_y)
+        right, lower = math.ceil(bbox[2] * scale_x), math.ceil(bbox[3] * scale_y)
+        center = ((left + right) // 2, (upper + lower) // 2)
+
+    return {"zoom_factor": zoom_factor, "offset": offset_to_center(center, final_size, margins, apply_margins)}
+
+def sku_geometries(cutouts: list, margins: tuple, apply_margins: bool, mode: str = "batch") -> dict:
+    """plan_geometry of the given cutout paths of a SKU folder ({no_bg_file: geometry}) from one batched alpha analysis
+    (runs as a pool task, reading the cutouts from their files one at a time)."""
+    with tracer.stage("sku_geometry"):
+        analysis = analyze_cutouts(cutouts, margins, apply_margins, mode)
+    logging.info(f"SKU geometry ({mode}): {len(analysis)} cutouts analyzed in {os.path.dirname(cutouts[0]) if cutouts else '-'}")
+    return {os.path.basename(path): {"zoom_factor": zoom_factor, "offset": offset_to_center(center, size, margins, apply_margins)}
+            for path, (zoom_factor, center, size) in analysis.items()}
+
+def scale_visible_region(image: Image.Image, zoom_factor: float, offset: tuple, final_size: tuple, rows: tuple = None) -> tuple:
+    """Scale only the part of the image that lands on the canvas (only canvas `rows` (top, bottom) when given);
+    returns (region, paste position on the canvas) or (None, None)."""
+    dx, dy = offset
+    scaled_width, scaled_height = scaled_size(image.size, zoom_factor)
+    top, bottom = rows or (0, final_size[1])
+
+    # **Visible box in scaled-image coordinates (everything else would be cropped by the paste)**
+    left, upper = max(0, -dx), max(0, -dy, top - dy)
+    right, lower = min(scaled_width, final_size[0] - dx), min(scaled_height, final_size[1] - dy, bottom - dy)
+    if left >= right or upper >= lower:
+        return None, None
+
+    if zoom_factor == 1.0:
+        region = image.crop((left, upper, right, lower))
+    else:
+        # **Same LANCZOS filter as scale_image, evaluated only for the visible output pixels**
+        scale_x, scale_y = image.width / scaled_width, image.height / scaled_height
+        source_box = (left * scale_x, upper * scale_y, right * scale_x, lower * scale_y)
+        region = image.resize((right - left, lower - upper), Image.Resampling.LANCZOS, box=source_box)
+    return region, (left + dx, upper + dy)
+
+def process_background(background_image: Image.Image, dx: int, dy: int, final_size: tuple, bg_color: tuple = (0, 0, 255)) -> Image.Image:
+    """Apply background color and align properly (reference chain, see compositing.composite_pair)."""
+    color_canvas = Image.new("RGB", final_size, bg_color)  # Custom BG (default Blue)
     bg_rgb = background_image.convert("RGB")
-    blue_canvas.paste(bg_rgb, (dx, dy))
-    return ImageChops.multiply(blue_canvas, Image.new("RGB", final_size, (0, 0, 255)))  # Blend
+    color_canvas.paste(bg_rgb, (dx, dy))
+    return ImageChops.multiply(color_canvas, Image.new("RGB", final_size, bg_color))  # Blend
 
 def compose_final_image(processed_bg: Image.Image, centered_transparent: Image.Image) -> Image.Image:
     """Merge the processed background and transparent image."""
     return Image.alpha_composite(processed_bg.convert("RGBA"), centered_transparent)
 
-def process_image_pair(input_folder: str, output_folder: str, bg_file: str, no_bg_file: str, margins: tuple, apply_margins: bool):
-    """Process an image pair (background + transparent) with conditional margins."""
-    os.makedirs(output_folder, exist_ok=True)
+def converted_outputs(output_folder: str, file_name: str, convert: dict) -> list:
+    """(format, path) of every converted output, in Convert.py's <root>/<format>/<SKU>/ layout."""
+    relative_folder = os.path.relpath(output_folder, convert["png_root"])
+    name = os.path.splitext(file_name)[0]
+    return [(fmt, os.path.join(convert["output_root"], fmt, relative_folder, f"{name}.{fmt}")) for fmt in convert["settings"]]
+
+def decode_pair(input_folder: str, bg_file: str, no_bg_file: str, buffers: dict = None) -> tuple:
+    """Open both sources of a pair (from their read-ahead buffers when given)."""
+    bg_path, no_bg_path = os.path.join(input_folder, bg_file), os.path.join(input_folder, no_bg_file)
+    with tracer.stage("decode") as stage:
+        img_with_bg = open_source(bg_path, buffers)
+        img_no_bg = open_source(no_bg_path, buffers)
+        if stage.active:
+            # **Decode here so the time is not billed to the next stage**
+            img_with_bg.load()
+            img_no_bg.load()
+            stage.bytes = os.path.getsize(bg_path) + os.path.getsize(no_bg_path)
+    return img_with_bg, img_no_bg
+
+def compose_pair(input_folder: str, bg_file: str, no_bg_file: str, margins: tuple, apply_margins: bool, bg_color: tuple = (0, 0, 255), buffers: dict = None,
+                 geometry: dict = None) -> tuple:
+    """Build the centered transparent image and the final image of a pair in memory (decoding read-ahead buffers when given)."""
+    img_with_bg, img_no_bg = decode_pair(input_folder, bg_file, no_bg_file, buffers)
     try:
-        img_with_bg = Image.open(os.path.join(input_folder, bg_file))
-        img_no_bg = Image.open(os.path.join(input_folder, no_bg_file))
-
-        original_size = img_no_bg.size
-        zoom_factor = calculate_zoom_with_margins(img_no_bg, original_size, margins, apply_margins)
-
-        img_with_bg_scaled = scale_image(img_with_bg, zoom_factor)
-        img_no_bg_scaled = scale_image(img_no_bg, zoom_factor)
-
-        centered_transparent, (dx, dy) = center_image(img_no_bg_scaled, original_size, margins, apply_margins)
-        processed_bg = process_background(img_with_bg_scaled, dx, dy, original_size)
-        final_image = compose_final_image(processed_bg, centered_transparent)
+        return compose_images(img_with_bg, img_no_bg, margins, apply_margins, bg_color, geometry)
+    finally:
+        # **Free the decoded sources now, not whenever the last reference goes away**
+        img_with_bg.close()
+        img_no_bg.close()
+
+def compose_images(img_with_bg: Image.Image, img_no_bg: Image.Image, margins: tuple, apply_margins: bool, bg_color: tuple = (0, 0, 255), geometry: dict = None) -> tuple:
+    """Centered transparent image, final image, zoom factor and move of an opened pair (placed by a precomputed `geometry` when given)."""
+    original_size = img_no_bg.size
+    if geometry is None:
+        with tracer.stage("geometry"):
+            geometry = plan_geometry(img_no_bg, original_size, margins, apply_margins)
+    zoom_factor, (dx, dy) = geometry["zoom_factor"], geometry["offset"]
+    logging.info(f"Image centered: Move by (dx={dx}, dy={dy}) pixels. {'Margins Applied' if apply_margins else 'No Margins'}")
 
-        # **Save Output Images**
-        centered_transparent.save(os.path.join(output_folder, no_bg_file), "PNG")
-        final_image.save(os.path.join(output_folder, bg_file), "PNG")
+    # **Crop-Before-Scale: Resample Only What Lands on the Canvas**
+    with tracer.stage("scale"):
+        no_bg_region, no_bg_position = scale_visible_region(img_no_bg, zoom_factor, (dx, dy), original_size)
+        bg_region, bg_position = scale_visible_region(img_with_bg, zoom_factor, (dx, dy), original_size)
+
+    with tracer.stage("center"):
+        centered_transparent = Image.new("RGBA", original_size, (0, 0, 0, 0))
+        if no_bg_region is not None:
+            centered_transparent.paste(no_bg_region, no_bg_position, no_bg_region)
+
+    # **Background Multiply + Final Composition in One Pass**
+    with tracer.stage("composite"):
+        if bg_region is None:
+            bg_region, bg_position = img_with_bg.crop((0, 0, 0, 0)), (0, 0)  # Background entirely off-canvas
+        final_image = composite_pair(bg_region, centered_transparent, bg_position[0], bg_position[1], original_size, bg_color)
+
+    return centered_transparent, final_image, zoom_factor, (dx, dy)
+
+def compose_pair_tiled(img_with_bg: Image.Image, img_no_bg: Image.Image, margins: tuple, apply_margins: bool, bg_color: tuple,
+                       outputs: dict, png_profile: str = DEFAULT_PNG_PROFILE, tile_height: int = DEFAULT_TILE_HEIGHT, geometry: dict = None) -> tuple:
+    """compose_images strip by strip: every `tile_height` canvas rows are placed, multiplied, composited and appended to the
+    streamed PNGs ({"cutout": path, "final": path}), so no full canvas is ever held; returns zoom factor and move."""
+    original_size = width, height = img_no_bg.size
+    if geometry is None:
+        with tracer.stage("geometry"):
+            geometry = plan_geometry(img_no_bg, original_size, margins, apply_margins)
+    zoom_factor, offset = geometry["zoom_factor"], geometry["offset"]
+    logging.info(f"Image centered: Move by (dx={offset[0]}, dy={offset[1]}) pixels. {'Margins Applied' if apply_margins else 'No Margins'} | Tiled")
+
+    writers, finished = {}, []
+    try:
+        for role, path in outputs.items():
+            writers[role] = PngStreamWriter(path, original_size, "RGBA", png_profile)  # **Moved into place on close (never written through a dedupe hard link)**
+        for top in range(0, height, tile_height):
+            rows = (top, min(top + tile_height, height))
+            strip_size = (width, rows[1] - top)
+            with tracer.stage("scale"):
+                no_bg_region, no_bg_position = scale_visible_region(img_no_bg, zoom_factor, offset, original_size, rows)
+                bg_region, bg_position = scale_visible_region(img_with_bg, zoom_factor, offset, original_size, rows)
+
+            with tracer.stage("center"):
+                cutout = Image.new("RGBA", strip_size, (0, 0, 0, 0))
+                if no_bg_region is not None:
+                    cutout.paste(no_bg_region, (no_bg_position[0], no_bg_position[1] - top), no_bg_region)
+
+            with tracer.stage("composite"):
+                if bg_region is None:
+                    bg_region, bg_position = img_with_bg.crop((0, 0, 0, 0)), (0, top)  # Background entirely off this strip
+                final = composite_pair(bg_region, cutout, bg_position[0], bg_position[1] - top, strip_size, bg_color)
+
+            with tracer.stage("encode_png"):
+                writers["cutout"].write(cutout)
+                writers["final"].write(final)
+        for role, writer in writers.items():
+            writer.close()
+            finished.append(role)
+    except BaseException:
+        # **Drop the unfinished PNGs and let the original error through (no truncated file at the output path)**
+        for role, writer in writers.items():
+            if role not in finished:
+                writer.abort()
+        raise
+    return zoom_factor, offset
+
+def pair_output_paths(output_folder: str, bg_file: str, no_bg_file: str, convert: dict = None) -> dict:
+    """Output files of a pair by role (final / cutout + extension), the names they have in the dedupe store."""
+    paths = {}
+    for role, file_name in (("final", bg_file), ("cutout", no_bg_file)):
+        if convert is None or convert["write_png"]:
+            paths[f"{role}.png"] = os.path.join(output_folder, file_name)
+        if convert:
+            paths.update((f"{role}.{fmt}", path) for fmt, path in converted_outputs(output_folder, file_name, convert))
+    return paths
+
+def process_image_pair(input_folder: str, output_folder: str, bg_file: str, no_bg_file: str, margins: tuple, apply_margins: bool, bg_color: tuple = (0, 0, 255), convert: dict = None, png_profile: str = DEFAULT_PNG_PROFILE, buffers: dict = None,
+                       dedupe: DedupeStore = None, tile_height: int = None, geometry: dict = None):
+    """Process an image pair (background + transparent) with conditional margins, optionally converting in memory
+    (or reusing the stored outputs of an identical pair rendered before; strip by strip with a `tile_height`;
+    placed by the precomputed SKU `geometry` when given)."""
+    write_png = convert is None or convert["write_png"]
+    if write_png:
+        os.makedirs(output_folder, exist_ok=True)
+    pair_outputs = {}
+    dedupe_keys = []
+    try:
+        with tracer.stage("pair"):
+            # **Dedupe: Same Source Bytes + Parameters Rendered Before, Reuse Without Decoding**
+            if dedupe:
+                if geometry is not None:
+                    dedupe = dedupe.bind({**dedupe.params, "geometry": geometry})  # **A shared zoom depends on the other views too**
+                outputs = pair_output_paths(output_folder, bg_file, no_bg_file, convert)
+                dedupe_keys.append(dedupe.source_key([os.path.join(input_folder, bg_file), os.path.join(input_folder, no_bg_file)], buffers))
+                if dedupe.fetch(dedupe_keys[0], outputs):
+                    logging.info(f"Reused: {bg_file} | identical pair rendered before")
+                    return True
+
+            img_with_bg, img_no_bg = decode_pair(input_folder, bg_file, no_bg_file, buffers)
+            try:
+                # **Re-Saved Shots: Same Pixels, Different Bytes**
+                if dedupe and dedupe.pixels:
+                    dedupe_keys.append(dedupe.pixel_key([img_with_bg, img_no_bg]))
+                    if dedupe.fetch(dedupe_keys[1], outputs):
+                        dedupe.store(dedupe_keys[:1], outputs)  # **These bytes hit without decoding next time**
+                        logging.info(f"Reused: {bg_file} | identical pixels rendered before")
+                        return True
+                if tile_height:
+                    # **Tiled: PNGs are streamed strip by strip, nothing is left to save afterwards**
+                    zoom_factor, (dx, dy) = compose_pair_tiled(img_with_bg, img_no_bg, margins, apply_margins, bg_color,
+                                                               {"cutout": os.path.join(output_folder, no_bg_file), "final": os.path.join(output_folder, bg_file)},
+                                                               png_profile, tile_height, geometry)
+                else:
+                    centered_transparent, final_image, zoom_factor, (dx, dy) = compose_images(img_with_bg, img_no_bg, margins, apply_margins, bg_color, geometry)
+            finally:
+                img_with_bg.close()
+                img_no_bg.close()
+
+            # **Save Output Images (PNG Encode Profile)**
+            pair_outputs = {no_bg_file: centered_transparent, bg_file: final_image} if not tile_height else {}
+            if write_png and not tile_height:
+                for file_name, image in pair_outputs.items():
+                    output_file = os.path.join(output_folder, file_name)
+                    with tracer.stage("encode_png") as stage:
+                        replace_output(output_file)
+                        save_png(image, output_file, png_profile)
+                        if stage.active:
+                            stage.bytes = os.path.getsize(output_file)
+
+            # **In-Memory Conversion (Convert.py encoders, no PNG write + re-decode)**
+            if convert:
+                for file_name, image in pair_outputs.items():
+                    targets = converted_outputs(output_folder, file_name, convert)
+                    for _, output_file in targets:
+                        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+                    with tracer.stage("resize"):
+                        image = resize_image(image, convert["width"], convert["height"], convert["resample"])
+                    encode_formats(image, targets, convert["settings"])
+
+            if dedupe:
+                dedupe.store(dedupe_keys, outputs)
 
         logging.info(f"Processed: {bg_file} | {'Margins Applied' if apply_margins else 'No Margins'} | Zoom Factor: {zoom_factor} | dx={dx}, dy={dy}")
+        return True
 
     except Exception as e:
         logging.error(f"Error processing images in {input_folder}: {e}")
-
-def process_images_in_folders(input_root: str, output_root: str, margins: tuple, apply_margins: bool):
-    """Process images in all subfolders, applying margins conditionally."""
-    subfolders = [f for f in os.listdir(input_root) if os.path.isdir(os.path.join(input_root, f))]
-
-    with ThreadPoolExecutor(max_workers=max_threads) as executor:
-        future_tasks = []
-        for subfolder in subfolders:
-            input_folder = os.path.join(input_root, subfolder)
-            output_folder = os.path.join(output_root, subfolder)
-            os.makedirs(output_folder, exist_ok=True)
-            logging.info(f"Processing folder: {input_folder}")
-
-            all_files = os.listdir(input_folder)
-            categories = ["R", "W", "Y"]
-
-            for category in categories:
-                bg_images = [f for f in all_files if f.startswith(f"{subfolder}-{category}-") and f.endswith(".png")]
-                no_bg_images = [f for f in all_files if f.startswith(f"{subfolder}-{category}A-") and f.endswith(".png")]
-
-                for bg_file in bg_images:
-                    corresponding_no_bg = bg_file.replace(f"-{category}-", f"-{category}A-")
-                    if corresponding_no_bg in no_bg_images:
-                        future_tasks.append(executor.submit(
-                            process_image_pair, input_folder, output_folder, bg_file, corresponding_no_bg, margins, apply_margins
-                        ))
-
-        for future in as_completed(future_tasks):
+        return False
+
+    finally:
+        for image in pair_outputs.values():
+            image.close()
+
+def convert_options(output_root: str, settings: dict, width: int = None, height: int = None, resample: str = "exact",
+                    convert_output: str = None, write_png: bool = True) -> dict:
+    """In-memory conversion settings of a run (`settings` = encoder settings per format, as from format_settings)."""
+    return {
+        "png_root": output_root,
+        "output_root": convert_output or output_root,
+        "settings": settings,
+        "width": width, "height": height, "resample": resample,
+        "write_png": write_png,
+    }
+
+def pair_memory(inputs: list, convert: dict = None, buffers: dict = None, tiled: bool = False, backend: str = "thread") -> int:
+    """Estimated peak bytes of one pair, from the image headers (plus its read-ahead buffers)."""
+    if tiled:
+        working_images = PAIR_WORKING_IMAGES_TILED
+    else:
+        working_images = PAIR_WORKING_IMAGES + (1 if convert else 0)  # **+1 for the encoder copy of converted outputs**
+    return working_images * BYTES_PER_PIXEL * max(image_pixels(source_of(path, buffers)) for path in inputs) + buffer_memory(buffers, backend)
+
+def process_images_in_folders(input_root: str, output_root: str, margins: tuple, apply_margins: bool, max_threads: int, backend: str = "thread", bg_color: tuple = (0, 0, 255), manifest: Manifest = None, convert: dict = None, png_profile: str = DEFAULT_PNG_PROFILE, memory_budget: int = None, readahead: int = 0, executor=None, folders: list = None, pairs: list = None,
+                              shard: tuple = None, claims: FolderClaims = None, dedupe: DedupeStore = None, tile_height: int = None, geometry: str = None) -> dict:
+    """Process images in all subfolders (only `folders`, or only the given (input_folder, output_folder, bg_file, no_bg_file) `pairs`), applying margins conditionally (skipping up-to-date pairs with a manifest,
+    bounding in-flight memory with a budget, reading `readahead` pairs ahead); runs on `executor` when given (a warm pool shared between runs).
+    With several nodes, only the SKU folders of this node's static `shard` (i, N) and / or the folders it `claims` first are processed;
+    pairs already rendered with the same sources and parameters are taken from the `dedupe` store; with a `tile_height`, pairs are rendered and
+    encoded in strips of that many rows (PNG only, bounded memory for very large masters). With a `geometry` mode, the cutouts of each SKU folder are
+    analyzed together up front (batch) and optionally scaled by one zoom per SKU (shared).
+
+    Returns the processed / skipped / failed pair counts."""
+    params = {"tool": "resize", "margins": margins, "apply_margins": apply_margins, "bg_color": bg_color, "png_profile": png_profile,
+              "tiled": tile_height is not None}  # **Tiled PNGs differ in bytes (own filters, strip rounding): never mixed with full renders**
+    if geometry == "shared":
+        params["geometry"] = geometry  # **batch places every pair exactly like the per-pair analysis**
+    if convert:
+        params["convert"] = {key: convert[key] for key in ("settings", "width", "height", "write_png")}
+        if convert["resample"] != "exact":
+            params["convert"]["resample"] = convert["resample"]
+    counts = {"processed": 0, "skipped": 0, "failed": 0}
+    if dedupe:
+        dedupe = dedupe.bind(params)
+
+    def pending_pairs():
+        """Discovered pairs that need processing (up-to-date pairs are skipped before anything is read ahead)."""
+        select = folder_filter(shard, claims)
+        discovered = pairs if pairs is not None else iter_image_pairs(input_root, output_root, folders=folders, select=select)
+        for input_folder, folder_pairs in groupby(discovered, key=lambda pair: pair[0]):
+            # **Shared Zoom: Every Pair Depends on All Cutouts of Its SKU (also those not in this run)**
+            sku_cutouts = []
+            if geometry == "shared":
+                sku_cutouts = sorted(no_bg_file for _, no_bg_file in iter_folder_pairs(input_folder, os.path.basename(input_folder)))
+
+            for _, output_folder, bg_file, no_bg_file in folder_pairs:
+                inputs = [os.path.join(input_folder, bg_file), os.path.join(input_folder, no_bg_file)]
+                record_inputs = inputs + [os.path.join(input_folder, name) for name in sku_cutouts if name != no_bg_file]
+                outputs = []
+                if convert is None or convert["write_png"]:
+                    outputs += [os.path.join(output_folder, bg_file), os.path.join(output_folder, no_bg_file)]
+                if convert:
+                    outputs += [path for file_name in (bg_file, no_bg_file) for _, path in converted_outputs(output_folder, file_name, convert)]
+
+                # **Incremental Mode: Skip Pairs Built From the Same Inputs + Parameters**
+                if manifest and manifest.is_up_to_date(outputs[0], record_inputs, params, outputs):
+                    counts["skipped"] += 1
+                    continue
+
+                counts["processed"] += 1
+                if claims:
+                    claims.add(os.path.relpath(input_folder, input_root))
+                yield input_folder, output_folder, bg_file, no_bg_file, inputs, outputs, record_inputs
+        if claims:
+            claims.scan_finished()
+
+    def submit_analysis(input_folder: str, folder_pairs: list):
+        """Batched geometry of a folder's cutouts as a pool task (shared: all cutouts of the SKU), given only their paths."""
+        cutouts = sorted({path for pair in folder_pairs for path in [pair[4][1]] + pair[6][2:]})
+        function, args = traced_task(sku_geometries, (cutouts, margins, apply_margins, geometry), backend)
+        return input_folder, executor.submit(function, *args)
+
+    def release_folder(folder_pairs: list, analysis: tuple):
+        """Yield a folder's pairs with their geometry once its analysis finished (per-pair analysis when it failed)."""
+        input_folder, future = analysis
+        try:
+            geometries = task_result(future.result(), backend)
+        except Exception as e:
+            geometries = {}
+            logging.error(f"SKU geometry failed in {input_folder}, analyzing its pairs one by one: {e}")
+        for pair in folder_pairs:
+            yield (*pair, geometries.get(pair[3]))
+
+    def analyzed_pairs(found):
+        """SKU geometry ahead of the read-ahead: the analysis of the next folder is submitted before the pairs of the current one
+        are handed out, so it runs in the pool next to them. Only file names are held per folder, never pixel data or buffers;
+        at most two analyses (current and next folder) are outstanding, each decoding one cutout at a time."""
+        waiting = None
+        for input_folder, folder_pairs in groupby(found, key=lambda pair: pair[0]):
+            folder_pairs = list(folder_pairs)
+            analysis = submit_analysis(input_folder, folder_pairs)
+            if waiting:
+                yield from release_folder(*waiting)
+            waiting = (folder_pairs, analysis)
+        if waiting:
+            yield from release_folder(*waiting)
+
+    def pair_tasks():
+        """Turn pairs into worker tasks while the folder scan and the read-ahead are still running."""
+        found = analyzed_pairs(pending_pairs()) if geometry else ((*pair, None) for pair in pending_pairs())
+        pairs_read = read_ahead(found, lambda pair: pair[4], readahead)
+        for (input_folder, output_folder, bg_file, no_bg_file, inputs, outputs, record_inputs, pair_geometry), buffers in pairs_read:
+            function, args = traced_task(process_image_pair, (input_folder, output_folder, bg_file, no_bg_file, margins, apply_margins, bg_color, convert, png_profile, buffers, dedupe, tile_height, pair_geometry), backend)
+            yield function, args, (record_inputs, outputs), pair_memory(inputs, convert, buffers, bool(tile_height), backend) if memory_budget else 0
+
+    with nullcontext(executor) if executor else create_executor(backend, max_threads, worker_initializer()) as executor:
+        for (inputs, outputs), future in submit_streaming(executor, pair_tasks(), max_pending=max_threads * 4, memory_budget=memory_budget):
+            ok = False
             try:
-                future.result()
+                ok = task_result(future.result(), backend)
+                if ok and manifest:
+                    manifest.record(outputs[0], inputs, params)
             except Exception as e:
                 logging.error(f"Error in thread execution: {e}")
+            if not ok:
+                counts["failed"] += 1
+            if claims:
+                claims.finished(os.path.relpath(os.path.dirname(inputs[0]), input_root), ok)
+
+    if manifest:
+        manifest.save()
+        logging.info(f"Incremental run: {counts['processed']} pairs processed, {counts['skipped']} up-to-date pairs skipped")
+    return counts
+
+def report_png_profiles(input_root: str, output_root: str, margins: tuple, apply_margins: bool, bg_color: tuple, sample_size: int):
+    """Compose the first pairs of the batch in memory and compare the PNG profiles on them (nothing is written)."""
+    images = []
+    for input_folder, _, bg_file, no_bg_file in iter_image_pairs(input_root, output_root):
+        if len(images) >= sample_size * 2:
+            break
+        centered_transparent, final_image, _, _ = compose_pair(input_folder, bg_file, no_bg_file, margins, apply_margins, bg_color)
+        images += [centered_transparent, final_image]
+    if not images:
+        print("No image pairs found for the PNG profile report.")
+        return
+    print_profile_report(profile_report(images), len(images))
 # **Main Execution (Command Line Arguments)**
 if __name__ == "__main__":
-    if len(sys.argv) != 9:
-        print("Usage: python script.py <input_folder> <output_folder> <top_margin> <right_margin> <bottom_margin> <left_margin>  <apply_margins : 0 or 1> <max_threads>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Center product images and compose them on a background",
+                                     parents=[jpeg_options, webp_options, avif_options])
+    parser.add_argument("input_folder")
+    parser.add_argument("output_folder")
+    parser.add_argument("top_margin", type=int)
+    parser.add_argument("bottom_margin", type=int)
+    parser.add_argument("left_margin", type=int)
+    parser.add_argument("right_margin", type=int)
+    parser.add_argument("apply_margins", type=int, choices=[0, 1], help="1 = Apply Margins, 0 = No Margins")
+    parser.add_argument("max_threads", type=int)
+    parser.add_argument("bg_color", nargs="?", default="0,0,255", help="Background color as R,G,B (default: 0,0,255)")
+    parser.add_argument("-b", "--backend", choices=BACKENDS, default="thread",
+                        help="thread = thread pool (default), process = max_threads worker processes")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        help="Limit the estimated decoded image memory of all pairs in flight (read from the image headers)")
+    parser.add_argument("--readahead", type=int, default=0, metavar="PAIRS",
+                        help="Read the files of the next PAIRS pairs into memory on I/O threads (for slow / network storage)")
+    parser.add_argument("--incremental", choices=INCREMENTAL_MODES,
+                        help="Skip pairs whose outputs are up to date (mtime = size + mtime check, hash = content hash)")
+
+    parser.add_argument("--shard", metavar="i/N",
+                        help="Process only SKU folders of shard i of N (stable hash of the folder name, e.g. 2/4 on the second of four nodes)")
+    parser.add_argument("--claims", metavar="PATH",
+                        help="Shared claims folder: nodes take SKU folders through lock files as they reach them (use a new folder per rebuild)")
+    parser.add_argument("--claim-timeout", type=float, default=DEFAULT_STALE_AFTER, metavar="SECONDS",
+                        help=f"Take over claims of nodes that did not finish a folder within SECONDS (default: {DEFAULT_STALE_AFTER})")
+    parser.add_argument("--dedupe", metavar="PATH",
+                        help="Content-addressed store of rendered pairs: identical pairs (same sources + settings) reuse the stored outputs")
+    parser.add_argument("--dedupe-mode", choices=DEDUPE_MODES, default="bytes",
+                        help="bytes = match identical source files (default), pixels = also match re-saved files with identical pixels")
+    parser.add_argument("--dedupe-place", choices=PLACE_MODES, default="link",
+                        help="link = hard link reused outputs (default, copy across filesystems), copy = independent copies")
+    parser.add_argument("--tiled", type=int, nargs="?", const=DEFAULT_TILE_HEIGHT, metavar="ROWS",
+                        help=f"Render and encode each pair in strips of ROWS canvas rows (default: {DEFAULT_TILE_HEIGHT}): bounded memory for very large masters (PNG only)")
+    parser.add_argument("--sku-geometry", choices=GEOMETRY_MODES,
+                        help="Analyze the cutouts of each SKU folder in one batched NumPy pass and hand the geometry to the workers "
+                             "(batch: same placement as per pair; shared: one zoom for all views of a SKU)")
+    parser.add_argument("--watch", action="store_true",
+                        help="After processing the tree, keep watching it and process new pairs as soon as both files are written (Ctrl+C to stop)")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE, metavar="SECONDS",
+                        help=f"Watch mode: seconds a file must stay unchanged before it is processed (default: {DEFAULT_SETTLE})")
+    parser.add_argument("--poll", type=float, nargs="?", const=DEFAULT_POLL_INTERVAL, metavar="SECONDS",
+                        help=f"Watch mode: poll every SECONDS (default: {DEFAULT_POLL_INTERVAL}) instead of inotify, e.g. on network mounts")
+
+    parser.add_argument("--png-profile", choices=list(PNG_PROFILES), default=DEFAULT_PNG_PROFILE,
+                        help="PNG encoder settings: fast (zlib 1 + RLE), balanced (zlib 6, default), smallest (zlib 9 + optimize)")
+    parser.add_argument("--png-report", type=int, metavar="PAIRS",
+                        help="Compare encode time and size of every PNG profile on the first PAIRS pairs, then exit")
+    parser.add_argument("--trace", action="store_true",
+                        help="Time every stage (decode, geometry, scale, center, composite, encode) and print percentiles at the end")
+    parser.add_argument("--trace-file", metavar="PATH", help="Also write a Chrome trace JSON of all stages and workers (implies --trace)")
+
+    # **In-Memory Conversion (Same Encoders and Options as Convert.py)**
+    conversion_group = parser.add_argument_group("Conversion Settings (-p/-opt/-m/-s as in Convert.py)")
+    conversion_group.add_argument("--convert", metavar="FORMATS", help="Also encode the results to these formats, e.g. webp,avif")
+    conversion_group.add_argument("--convert-output", metavar="PATH", help="Root for converted images (default: output_folder)")
+    conversion_group.add_argument("--no-png", action="store_true", help="Do not write the PNG results (only with --convert)")
+    conversion_group.add_argument("-q", "-quality", type=int, default=100, metavar="QUALITY (1-100, default: 100)")
+    conversion_group.add_argument("-w", "-width", type=int, required=False, metavar="WIDTH")
+    conversion_group.add_argument("--h", "-height", type=int, required=False, metavar="HEIGHT")
+    conversion_group.add_argument("-rs", "-resample", choices=list(RESAMPLE_MODES), default="exact", metavar="RESAMPLE (exact/fast/fastest)")
+    args = parser.parse_args()
 
     # **Read Command Line Arguments**
-    input_folder_path = sys.argv[1]
-    output_folder_path = sys.argv[2]
-    top_margin = int(sys.argv[3])
-    bottom_margin = int(sys.argv[4])
-    left_margin = int(sys.argv[5])
-    right_margin = int(sys.argv[6])
-    apply_margins = bool(int(sys.argv[7]))  # 1 = Apply Margins, 0 = No Margins
-    max_threads = int(sys.argv[8])  
+    input_folder_path = args.input_folder
+    output_folder_path = args.output_folder
+    apply_margins = bool(args.apply_margins)
+    max_threads = args.max_threads
+    bg_color = tuple(map(int, args.bg_color.split(",")))  # RGB color from command line
 
     # **Check if max_threads is valid**
     if max_threads < 1:  
         print("Error: Thread count must be at least 1!")
         sys.exit(1)  # **Exit only if invalid input**
 
+    # **Check if bg_color is valid**
+    if len(bg_color) != 3 or not all(0 <= c <= 255 for c in bg_color):
+        print("Error: Background color must be three values between 0 and 255, e.g. 0,0,255")
+        sys.exit(1)
+
+    # **Conversion Settings**
+    convert = None
+    if args.convert:
+        convert_formats = parse_formats(args.convert)
+        if convert_formats is None:
+            print("Error: --convert takes a comma-separated list of jpeg, webp, avif")
+            sys.exit(1)
+        convert = convert_options(output_folder_path, {fmt: format_settings(args, fmt) for fmt in convert_formats},
+                                  args.w, args.h, args.rs, args.convert_output, not args.no_png)
+        if args.tiled:
+            print("Error: --tiled streams PNGs strip by strip and cannot be combined with --convert (encoders need the whole image)")
+            sys.exit(1)
+    elif args.no_png:
+        print("Error: --no-png needs --convert (otherwise nothing would be written)")
+        sys.exit(1)
+
+    # **Multi-Node Partitioning (Static Shard and / or Dynamic Claims)**
+    try:
+        shard = parse_shard(args.shard) if args.shard else None
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    claims = FolderClaims(args.claims, args.claim_timeout) if args.claims else None
+    if (shard or claims) and args.watch:
+        print("Error: --shard / --claims cannot be combined with --watch")
+        sys.exit(1)
+
     # **Margins Tuple**
-    margins = (top_margin, bottom_margin, left_margin, right_margin)
+    margins = (args.top_margin, args.bottom_margin, args.left_margin, args.right_margin)
+
+    # **PNG Profile Report (Sample of the Current Batch, Nothing Written)**
+    if args.png_report:
+        report_png_profiles(input_folder_path, output_folder_path, margins, apply_margins, bg_color, args.png_report)
+        sys.exit(0)
+
+    # **Incremental Manifest (Optional)**
+    manifest = Manifest(output_folder_path, args.incremental, shared=bool(args.shard or args.claims)) if args.incremental else None
+
+    # **Stage Tracing (Optional)**
+    if args.trace or args.trace_file:
+        enable_tracing()
 
     # **Process Images**
-    process_images_in_folders(input_folder_path, output_folder_path, margins, apply_margins)
+    dedupe = DedupeStore(args.dedupe, args.dedupe_mode, args.dedupe_place) if args.dedupe else None
+    run_options = (margins, apply_margins, max_threads, args.backend, bg_color, manifest, convert, args.png_profile, memory_budget_bytes(args.memory_budget), args.readahead)
+    if args.tiled is not None and args.tiled < 1:
+        print("Error: --tiled needs at least 1 row per strip")
+        sys.exit(1)
+    if not args.watch:
+        process_images_in_folders(input_folder_path, output_folder_path, *run_options, shard=shard, claims=claims, dedupe=dedupe, tile_height=args.tiled, geometry=args.sku_geometry)
+    else:
+        # **Watch Mode: One Warm Pool; the Watcher Starts Before the First Pass so Nothing Arriving Meanwhile Is Missed**
+        watcher = create_watcher(input_folder_path, args.poll is not None, args.poll or DEFAULT_POLL_INTERVAL)
+        with create_executor(args.backend, max_threads, worker_initializer()) as executor:
+            try:
+                process_images_in_folders(input_folder_path, output_folder_path, *run_options, executor=executor, dedupe=dedupe, tile_height=args.tiled, geometry=args.sku_geometry)
+                for batch in watch_pairs(watcher, input_folder_path, output_folder_path, args.settle):
+                    logging.info(f"Watch: {len(batch)} new pair(s) ready")
+                    process_images_in_folders(input_folder_path, output_folder_path, *run_options, executor=executor, pairs=batch, dedupe=dedupe, tile_height=args.tiled, geometry=args.sku_geometry)
+            except KeyboardInterrupt:
+                logging.info("Watch mode stopped")
+            finally:
+                watcher.close()
+    finish_trace("pair", args.trace_file)
 
 
 
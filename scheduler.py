@@ -0,0 +1,179 @@
+import os
+import math
+import time
+import logging
+from PIL import Image
+from encoders import DEFAULT_AVIF_SPEED
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+
+# **Available Execution Backends**
+# thread  : one process, many threads (low start-up cost, limited by the GIL)
+# process : max_threads worker processes (pixel work runs truly in parallel)
+BACKENDS = ("thread", "process")
+
+# **Decoded Size Estimate (RGBA, 8 bits per channel)**
+BYTES_PER_PIXEL = 4
+
+# **Copies of a task's read-ahead buffers in memory: the dispatcher's, plus the one pickled over to a worker process**
+BUFFER_COPIES = {"thread": 1, "process": 2}
+
+# **cgroup CPU Quota Files (v2: "<quota> <period>" or "max <period>", v1: quota / period in microseconds)**
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+# **Cores One Encode Keeps Busy (JPEG / WebP encode on the calling thread; WebP methods 4-6 take longest)**
+# AVIF is the only encoder with internal threads (pillow_avif max_threads, 0 = one per core): slow speeds scale
+# with threads, fast speeds barely do, so it gets its threads from the speed setting
+ENCODER_LOAD = {"jpeg": 0.25, "webp": 1.0}
+WEBP_FAST_LOAD = 0.5  # **methods 0-3**
+AVIF_THREADS_BY_SPEED = ((3, 4), (6, 2), (10, 1))  # **(up to speed, threads per encode)**
+
+# **Calibration: items timed per candidate are at least its workers x this (the sample is repeated), so wide splits can fill up**
+CALIBRATION_ROUNDS = 3
+
+def create_executor(backend: str, max_workers: int, initializer=None):
+    """Create the worker pool for the selected backend (initializer runs once in every worker process)."""
+    logging.info(f"Execution backend: {backend} | Workers: {max_workers}")
+    if backend == "thread":
+        return ThreadPoolExecutor(max_workers=max_workers)
+    if backend == "process":
+        # **Workers receive file names and write their own outputs, so decoded pixels are never pickled between processes;
+        # only the compressed read-ahead buffers are (once per task, budgeted by buffer_memory)**
+        return ProcessPoolExecutor(max_workers=max_workers, initializer=initializer)
+    raise ValueError(f"Unknown backend '{backend}'. Choose from {', '.join(BACKENDS)}")
+
+def image_pixels(source) -> int:
+    """Pixel count from the image header of a path or file object (nothing is decoded)."""
+    with Image.open(source) as img:
+        return img.width * img.height
+
+def buffer_memory(buffers: dict, backend: str) -> int:
+    """Bytes the read-ahead buffers of one task hold while it is in flight (a process worker unpickles its own copy)."""
+    if not buffers:
+        return 0
+    return BUFFER_COPIES[backend] * sum(len(data) for data in buffers.values() if data is not None)
+
+def memory_budget_bytes(megabytes: int) -> int:
+    """Budget option (MB) in bytes, None when unset."""
+    return megabytes * 1024 * 1024 if megabytes else None
+
+def submit_streaming(executor, tasks, max_pending: int, memory_budget: int = None):
+    """Submit (function, args, tag) or (function, args, tag, estimated bytes) tasks as they are produced and yield (tag, future) as they finish.
+
+    At most max_pending tasks are in flight and, with a memory budget, at most memory_budget estimated bytes
+    (a task larger than the whole budget still runs, but alone)."""
+    if memory_budget:
+        logging.info(f"Memory budget: {memory_budget / (1024 * 1024):.0f} MB of decoded images in flight")
+    pending = {}
+    in_flight = 0
+    for task in tasks:
+        function, args, tag = task[:3]
+        cost = task[3] if memory_budget and len(task) > 3 else 0
+        while pending and (len(pending) >= max_pending or (memory_budget and in_flight + cost > memory_budget)):
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                done_tag, done_cost = pending.pop(future)
+                in_flight -= done_cost
+                yield done_tag, future
+        pending[executor.submit(function, *args)] = (tag, cost)
+        in_flight += cost
+    for future in as_completed(pending):
+        yield pending[future][0], future
+
+def cgroup_cpu_limit():
+    """CPU quota of this container / cgroup in cores, None when unlimited or unknown."""
+    try:
+        with open(CGROUP_V2_CPU_MAX) as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(CGROUP_V1_QUOTA) as f:
+            quota = int(f.read())
+        with open(CGROUP_V1_PERIOD) as f:
+            period = int(f.read())
+        return quota / period if quota > 0 and period > 0 else None
+    except (OSError, ValueError):
+        return None
+
+def available_cores() -> int:
+    """Cores this process may actually use: CPU affinity, capped by the cgroup CPU quota (rounded up)."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1  # **No affinity API (macOS / Windows)**
+    limit = cgroup_cpu_limit()
+    if limit:
+        cores = min(cores, max(1, math.ceil(limit)))
+    return max(1, cores)
+
+def avif_threads(speed, cores: int) -> int:
+    """Encoder threads of one AVIF encode at `speed` (pillow_avif default speed when None)."""
+    speed = DEFAULT_AVIF_SPEED if speed is None else speed
+    threads = next(threads for up_to, threads in AVIF_THREADS_BY_SPEED if speed <= up_to)
+    return max(1, min(threads, cores))
+
+def image_load(formats: list, settings: dict, threads: int) -> float:
+    """Cores one image keeps busy while its formats are encoded side by side (AVIF with `threads` encoder threads)."""
+    load = 0.0
+    for fmt in formats:
+        if fmt == "avif":
+            load += threads
+        elif fmt == "webp" and (settings[fmt].get("method") or 0) < 4:
+            load += WEBP_FAST_LOAD
+        else:
+            load += ENCODER_LOAD[fmt]
+    return load
+
+def split_cores(cores: int, formats: list, settings: dict, workers: int = None, threads: int = None) -> tuple:
+    """(outer workers, AVIF encoder threads) that together use `cores` without oversubscribing them.
+
+    Either side may be fixed (e.g. -t): the other one is derived from it."""
+    if threads is None:
+        if "avif" not in formats:
+            threads = 1
+        elif workers is not None:
+            threads = max(1, cores // workers)  # **Fixed outer workers: the encoders get the cores they leave free**
+        else:
+            threads = avif_threads(settings["avif"].get("speed"), cores)
+    if workers is None:
+        workers = max(1, round(cores / image_load(formats, settings, threads)))
+    return workers, threads
+
+def split_candidates(cores: int, formats: list, settings: dict) -> list:
+    """(workers, threads) splits worth measuring: the heuristic one, and for AVIF every power-of-two thread count."""
+    candidates = [split_cores(cores, formats, settings)]
+    if "avif" in formats:
+        threads = 1
+        while threads <= cores:
+            candidates.append(split_cores(cores, formats, settings, threads=threads))
+            threads *= 2
+    else:
+        candidates += [(max(1, cores // 2), 1), (cores, 1), (cores * 2, 1)]
+    return list(dict.fromkeys(candidates))
+
+def run_split(items: list, run_sample, workers: int, threads: int):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(run_sample, item, threads) for item in items]:
+            future.result()
+
+def calibrate_split(sample: list, run_sample, candidates: list) -> tuple:
+    """Run the sample under every (workers, threads) candidate (run_sample(item, threads) encodes one item)
+    and return the split with the most items per second.
+
+    One untimed pass warms caches and encoders first, so the first candidate is not billed for it; every candidate
+    then runs at least workers x CALIBRATION_ROUNDS items (the sample repeated) to show its full parallelism."""
+    run_split(sample, run_sample, max(workers for workers, _ in candidates), 1)
+    best, best_rate = candidates[0], 0.0
+    for workers, threads in candidates:
+        count = max(len(sample), workers * CALIBRATION_ROUNDS)
+        items = [sample[i % len(sample)] for i in range(count)]
+        start = time.perf_counter()
+        run_split(items, run_sample, workers, threads)
+        rate = count / (time.perf_counter() - start)
+        logging.info(f"Calibration: {workers} workers x {threads} encoder threads -> {rate:.2f} images/s")
+        if rate > best_rate:
+            best, best_rate = (workers, threads), rate
+    return best
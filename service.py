@@ -0,0 +1,290 @@
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import argparse
+import logging
+import threading
+import socketserver
+from argparse import Namespace
+from collections import OrderedDict, defaultdict
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+from scheduler import BACKENDS, create_executor, memory_budget_bytes
+from manifest import INCREMENTAL_MODES, Manifest
+from png_profiles import PNG_PROFILES, DEFAULT_PNG_PROFILE
+from resize import process_images_in_folders, convert_options
+from encoders import FORMATS, parse_formats, format_settings, RESAMPLE_MODES
+
+# **Render Service: Warm Workers Behind a Local HTTP API**
+# POST /jobs            submit a job (JSON below), returns {"id": ..., "status": "queued"}
+# POST /jobs?wait=1     submit and answer once the job is finished
+# GET  /jobs/<id>       status, pair counts and timing of one job
+# GET  /jobs            all known jobs (newest last)
+# GET  /health          backend, workers and job counts
+#
+# Job: {"input": "/data/input", "output": "/data/output", "skus": ["AJR04663P201"],
+#       "margins": [top, bottom, left, right], "apply_margins": true, "bg_color": [0, 0, 255],
+#       "png_profile": "balanced", "incremental": "mtime",
+#       "convert": {"formats": "webp,avif", "quality": 90, "width": 1000, "height": 1000, "no_png": false}}
+#
+# curl -s localhost:8765/jobs?wait=1 -d @job.json
+# curl -s --unix-socket /tmp/render.sock http://localhost/jobs/<id>
+
+# **Finished Jobs Kept for Status Queries (oldest are forgotten first)**
+MAX_FINISHED_JOBS = 1000
+
+def warm_up():
+    """Load every Pillow plugin in a worker, so the first job does not pay for it."""
+    Image.init()
+    return os.getpid()
+
+def parse_job(job: dict) -> dict:
+    """Validate a job request and turn it into process_images_in_folders arguments (ValueError on bad input)."""
+    if not isinstance(job, dict):
+        raise ValueError("Job must be a JSON object")
+    input_root, output_root = job.get("input"), job.get("output")
+    if not input_root or not output_root:
+        raise ValueError("Job needs 'input' and 'output' folders")
+    if not os.path.isdir(input_root):
+        raise ValueError(f"Input folder not found: {input_root}")
+
+    skus = job.get("skus")
+    if skus is not None:
+        if isinstance(skus, str):
+            skus = [skus]
+        missing = [sku for sku in skus if not os.path.isdir(os.path.join(input_root, sku))]
+        if missing:
+            raise ValueError(f"SKU folders not found: {', '.join(missing)}")
+
+    margins = tuple(int(margin) for margin in job.get("margins", (0, 0, 0, 0)))
+    if len(margins) != 4:
+        raise ValueError("'margins' takes four values: top, bottom, left, right")
+    bg_color = tuple(int(c) for c in job.get("bg_color", (0, 0, 255)))
+    if len(bg_color) != 3 or not all(0 <= c <= 255 for c in bg_color):
+        raise ValueError("'bg_color' takes three values between 0 and 255")
+
+    png_profile = job.get("png_profile", DEFAULT_PNG_PROFILE)
+    if png_profile not in PNG_PROFILES:
+        raise ValueError(f"Unknown PNG profile '{png_profile}'. Choose from {', '.join(PNG_PROFILES)}")
+    incremental = job.get("incremental")
+    if incremental is not None and incremental not in INCREMENTAL_MODES:
+        raise ValueError(f"Unknown incremental mode '{incremental}'. Choose from {', '.join(INCREMENTAL_MODES)}")
+
+    return {
+        "input_root": input_root, "output_root": output_root, "folders": skus,
+        "margins": margins, "apply_margins": bool(job.get("apply_margins", True)), "bg_color": bg_color,
+        "png_profile": png_profile, "incremental": incremental,
+        "convert": parse_convert(job.get("convert"), output_root),
+    }
+
+def parse_convert(options: dict, output_root: str) -> dict:
+    """Conversion settings of a job (same options as the resize.py / Convert.py command line), None without conversion."""
+    if not options:
+        return None
+    formats = options.get("formats", [])
+    formats = parse_formats(formats if isinstance(formats, str) else ",".join(formats))
+    if not formats:
+        raise ValueError(f"'convert.formats' takes a list of {', '.join(FORMATS)}")
+    resample = options.get("resample", "exact")
+    if resample not in RESAMPLE_MODES:
+        raise ValueError(f"Unknown resample mode '{resample}'. Choose from {', '.join(RESAMPLE_MODES)}")
+
+    # **Same Names as the Command Line, so format_settings Applies Unchanged**
+    args = Namespace(q=options.get("quality", 100), jq=options.get("jpeg_quality"), wq=options.get("webp_quality"), aq=options.get("avif_quality"),
+                     p=bool(options.get("progressive", False)), opt=bool(options.get("optimize", False)),
+                     m=options.get("method"), s=options.get("speed"))
+    return convert_options(output_root, {fmt: format_settings(args, fmt) for fmt in formats},
+                           options.get("width"), options.get("height"), resample, options.get("output"), not options.get("no_png", False))
+
+class RenderService:
+    """One warm worker pool shared by all jobs; every job streams its pairs into it from its own job thread."""
+
+    def __init__(self, backend: str = "thread", max_workers: int = 4, max_jobs: int = 8, memory_budget: int = None, readahead: int = 0):
+        self.backend = backend
+        self.max_workers = max_workers
+        self.memory_budget = memory_budget
+        self.readahead = readahead
+        self.executor = create_executor(backend, max_workers)
+        self.job_runner = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="job")
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.manifest_locks = defaultdict(threading.Lock)  # **One manifest writer per output folder**
+
+        # **Start (and warm) every worker now, not on the first request**
+        started = time.perf_counter()
+        pids = {future.result() for future in [self.executor.submit(warm_up) for _ in range(max_workers)]}
+        logging.info(f"Workers warm in {time.perf_counter() - started:.2f}s ({len(pids)} process{'es' if len(pids) > 1 else ''})")
+
+    def submit(self, request: dict) -> dict:
+        """Queue a job and return its record (ValueError for an invalid job)."""
+        params = parse_job(request)
+        job = {"id": uuid.uuid4().hex[:12], "status": "queued", "request": request, "submitted": time.time(),
+               "done": threading.Event()}
+        with self.lock:
+            self.jobs[job["id"]] = job
+            self.forget_finished()
+        self.job_runner.submit(self.run, job, params)
+        return job
+
+    def run(self, job: dict, params: dict):
+        job["status"] = "running"
+        job["started"] = time.time()
+        try:
+            incremental = params.pop("incremental")
+            output_root = params["output_root"]
+            with self.lock:
+                manifest_lock = self.manifest_locks[os.path.abspath(output_root)] if incremental else nullcontext()
+            with manifest_lock:
+                manifest = Manifest(output_root, incremental) if incremental else None
+                job["pairs"] = process_images_in_folders(
+                    params["input_root"], output_root, params["margins"], params["apply_margins"], self.max_workers, self.backend,
+                    params["bg_color"], manifest, params["convert"], params["png_profile"], self.memory_budget, self.readahead,
+                    executor=self.executor, folders=params["folders"])
+            job["status"] = "failed" if job["pairs"]["failed"] else "done"
+        except Exception as e:
+            logging.error(f"Job {job['id']} failed: {e}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished"] = time.time()
+            job["done"].set()
+
+    def forget_finished(self):
+        """Drop the oldest finished jobs beyond MAX_FINISHED_JOBS (caller holds the lock)."""
+        finished = [job_id for job_id, job in self.jobs.items() if job["done"].is_set()]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> dict:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def status(self, job: dict) -> dict:
+        """JSON view of a job: status, pair counts and timing (queue wait + run time in seconds)."""
+        view = {key: job[key] for key in ("id", "status", "request") if key in job}
+        if "pairs" in job:
+            view["pairs"] = job["pairs"]
+        if "error" in job:
+            view["error"] = job["error"]
+        now = time.time()
+        view["queued_seconds"] = round(job.get("started", now) - job["submitted"], 3)
+        if "started" in job:
+            view["run_seconds"] = round(job.get("finished", now) - job["started"], 3)
+        return view
+
+    def health(self) -> dict:
+        with self.lock:
+            counts = defaultdict(int)
+            for job in self.jobs.values():
+                counts[job["status"]] += 1
+        return {"status": "ok", "backend": self.backend, "workers": self.max_workers, "jobs": dict(counts)}
+
+    def shutdown(self):
+        self.job_runner.shutdown(wait=True)
+        self.executor.shutdown(wait=True)
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """JSON API of the render service (self.server.service is the RenderService)."""
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service = self.server.service
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/health":
+            self.send_json(200, service.health())
+        elif path == "/jobs":
+            with service.lock:
+                jobs = list(service.jobs.values())
+            self.send_json(200, {"jobs": [service.status(job) for job in jobs]})
+        elif path.startswith("/jobs/"):
+            job = service.get(path[len("/jobs/"):])
+            if job is None:
+                self.send_json(404, {"error": "Unknown job"})
+            else:
+                self.send_json(200, service.status(job))
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        service = self.server.service
+        path, _, query = self.path.partition("?")
+        if path.rstrip("/") != "/jobs":
+            self.send_json(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = service.submit(json.loads(self.rfile.read(length) or b"{}"))
+        except (ValueError, TypeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        if "wait=1" in query.split("&"):
+            job["done"].wait()
+            self.send_json(200, service.status(job))
+        else:
+            self.send_json(202, service.status(job))
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} - {format % args}")
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP over a Unix socket (local clients only, no port to expose)."""
+    daemon_threads = True
+
+    def __init__(self, path: str, handler):
+        if os.path.exists(path):
+            os.remove(path)  # **Stale socket of a previous run**
+        super().__init__(path, handler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+# **Main Execution (Command Line Arguments)**
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Keep resize workers warm and accept jobs over a local HTTP API")
+    parser.add_argument("-t", "--threads", type=int, default=os.cpu_count() or 4, help="Worker threads / processes (default: CPU count)")
+    parser.add_argument("-b", "--backend", choices=BACKENDS, default="thread",
+                        help="thread = thread pool (default), process = --threads worker processes")
+    parser.add_argument("--jobs", type=int, default=8, help="Jobs running at the same time (their pairs share the workers)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", metavar="PATH", help="Listen on a Unix socket instead of host:port")
+    parser.add_argument("--memory-budget", type=int, metavar="MB", help="Estimated decoded image memory per job in flight")
+    parser.add_argument("--readahead", type=int, default=0, metavar="PAIRS", help="Read the files of the next PAIRS pairs of a job ahead")
+    args = parser.parse_args()
+
+    if args.threads < 1 or args.jobs < 1:
+        print("Error: --threads and --jobs must be at least 1!")
+        sys.exit(1)
+    if args.socket and not hasattr(socket, "AF_UNIX"):
+        print("Error: Unix sockets are not available on this platform, use --host/--port")
+        sys.exit(1)
+
+    service = RenderService(args.backend, args.threads, args.jobs, memory_budget_bytes(args.memory_budget), args.readahead)
+    server = UnixHTTPServer(args.socket, RequestHandler) if args.socket else ThreadingHTTPServer((args.host, args.port), RequestHandler)
+    server.service = service
+    logging.info(f"Render service listening on {args.socket or f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import logging
+
+# **Multi-Node Runs Over One Tree**
+# static  : --shard i/N, every node takes the folders whose name hashes to its shard (no coordination,
+#           a folder keeps its shard when others are added or removed)
+# dynamic : nodes claim folders through lock files in a shared claims folder as they reach them
+#           (<folder>.claim while in progress, <folder>.done once all of its work finished)
+
+# **Seconds after which the claim of a node that never finished its folder may be taken over**
+DEFAULT_STALE_AFTER = 2 * 60 * 60
+
+def parse_shard(text: str) -> tuple:
+    """'i/N' (1-based, e.g. 2/4) as (i, N); ValueError when it is malformed."""
+    index, separator, count = text.partition("/")
+    if not separator or not index.strip().isdigit() or not count.strip().isdigit():
+        raise ValueError(f"Shard must look like i/N (e.g. 2/4), got '{text}'")
+    index, count = int(index), int(count)
+    if not 1 <= index <= count:
+        raise ValueError(f"Shard index must be between 1 and {count}, got {index}")
+    return index, count
+
+def shard_of(key: str, count: int) -> int:
+    """1-based shard of a folder key (stable hash of its relative path, the same on every node and Python run)."""
+    digest = hashlib.sha1(key.replace(os.sep, "/").encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+def node_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class FolderClaims:
+    """Lock-file work queue on a shared filesystem: a node only processes the folders it claimed first.
+
+    A claim is marked done once the folder was scanned and all of its tasks finished (add / finished / scan_finished)."""
+
+    def __init__(self, claims_dir: str, stale_after: float = DEFAULT_STALE_AFTER, node: str = None):
+        os.makedirs(claims_dir, exist_ok=True)
+        self.claims_dir = claims_dir
+        self.stale_after = stale_after
+        self.node = node or node_name()
+        self.outstanding = {}  # **claimed key -> tasks not finished yet**
+        self.scanning = None  # **claimed key whose folder is still producing tasks**
+        self.failures = {}
+
+    def path(self, key: str, state: str) -> str:
+        name = key.replace(os.sep, "__").replace("/", "__")
+        return os.path.join(self.claims_dir, f"{name}.{state}")
+
+    def claim(self, key: str) -> bool:
+        """Try to take a folder; True when this node owns it now (the previously claimed folder counts as scanned)."""
+        self.scan_finished()
+        if os.path.exists(self.path(key, "done")):
+            return False
+        claim_path = self.path(key, "claim")
+        if not self.create(claim_path) and not self.take_over(claim_path):
+            return False
+        self.outstanding[key] = 0
+        self.scanning = key
+        return True
+
+    def create(self, claim_path: str) -> bool:
+        """Atomically create the claim file (O_EXCL), False when it already exists."""
+        try:
+            fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            json.dump({"node": self.node, "claimed": time.time()}, f)
+        return True
+
+    def take_over(self, claim_path: str) -> bool:
+        """Replace a claim older than stale_after (its node died); only one node wins the rename."""
+        try:
+            if time.time() - os.path.getmtime(claim_path) < self.stale_after:
+                return False
+            with open(claim_path) as f:
+                stale = f.read()
+            moved = f"{claim_path}.stale.{self.node.replace(':', '_')}"
+            os.rename(claim_path, moved)
+        except OSError:
+            return False
+        with open(moved) as f:
+            replaced = f.read() != stale
+        if replaced:
+            # **Another node replaced the stale claim in between: give its fresh claim back
+            # (link fails instead of replacing a claim a third node created meanwhile)**
+            try:
+                os.link(moved, claim_path)
+            except FileExistsError:
+                logging.warning(f"Could not give back claim {os.path.basename(claim_path)}: another node claimed it in between")
+            os.remove(moved)
+            return False
+        os.remove(moved)
+        logging.warning(f"Took over stale claim {os.path.basename(claim_path)}")
+        return self.create(claim_path)
+
+    def add(self, key: str):
+        """A task of a claimed folder was submitted."""
+        self.outstanding[key] += 1
+
+    def finished(self, key: str, ok: bool = True):
+        """A task of a claimed folder finished."""
+        self.outstanding[key] -= 1
+        if not ok:
+            self.failures[key] = self.failures.get(key, 0) + 1
+        self.release(key)
+
+    def scan_finished(self):
+        """The folder claimed last produced all of its tasks (call once more when the whole scan is over)."""
+        key, self.scanning = self.scanning, None
+        if key is not None:
+            self.release(key)
+
+    def release(self, key: str):
+        """Mark a folder done once it is scanned and none of its tasks are left."""
+        if key == self.scanning or key not in self.outstanding or self.outstanding[key]:
+            return
+        del self.outstanding[key]
+        with open(self.path(key, "done"), "w") as f:
+            json.dump({"node": self.node, "done": time.time(), "failed": self.failures.pop(key, 0)}, f)
+        try:
+            os.remove(self.path(key, "claim"))
+        except FileNotFoundError:
+            pass
+
+def folder_filter(shard: tuple = None, claims: FolderClaims = None):
+    """select(key) for the folder scans: static shard and / or dynamic claim (None when neither is used)."""
+    if shard is None and claims is None:
+        return None
+
+    def select(key: str) -> bool:
+        if shard is not None and shard_of(key, shard[1]) != shard[0]:
+            return False
+        return claims.claim(key) if claims is not None else True
+    return select
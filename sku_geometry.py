@@ -0,0 +1,85 @@
+import numpy as np
+from PIL import Image
+from readahead import source_of
+
+# **Per-SKU Geometry: Bounding Boxes, Centers and Zoom Factors of All Cutouts of a Folder at Once**
+# batch  : one vectorized pass over the alpha channels of a folder's cutouts, same geometry as each pair computes alone
+# shared : batch, and every view of the SKU gets the smallest zoom of its cutouts (same product scale across views)
+GEOMETRY_MODES = ("batch", "shared")
+
+def alpha_profiles(paths: list, buffers: dict = None) -> dict:
+    """Non-zero rows / columns of the cutouts' alpha channels, decoded one cutout at a time and stacked per canvas size:
+    {(width, height): (paths, (N, H) rows, (N, W) columns)}; cutouts without alpha are returned as {path: (bbox, size)}
+    under the key None (their getbbox covers all bands)."""
+    profiles, opaque = {}, {}
+    for path in paths:
+        with Image.open(source_of(path, buffers)) as image:
+            if "A" not in image.getbands():
+                opaque[path] = (image.getbbox(), image.size)
+                continue
+            alpha = np.asarray(image.getchannel("A"))
+        group = profiles.setdefault(image.size, ([], [], []))
+        group[0].append(path)
+        group[1].append(alpha.any(axis=1))
+        group[2].append(alpha.any(axis=0))
+        del alpha  # **Only the row / column profiles are kept, never a stack of full alpha channels**
+    stacks = {size: (group, np.stack(rows), np.stack(cols)) for size, (group, rows, cols) in profiles.items()}
+    stacks[None] = opaque
+    return stacks
+
+def alpha_bboxes(rows: np.ndarray, cols: np.ndarray) -> tuple:
+    """(N, 4) left, upper, right, lower of the non-zero pixels from N stacked row / column profiles (as getbbox) and the mask of empty ones."""
+    height, width = rows.shape[1], cols.shape[1]
+    boxes = np.stack([cols.argmax(axis=1), rows.argmax(axis=1),
+                      width - cols[:, ::-1].argmax(axis=1), height - rows[:, ::-1].argmax(axis=1)], axis=1)
+    return boxes.astype(np.int64), ~rows.any(axis=1)
+
+def fit_zooms(boxes: np.ndarray, empty: np.ndarray, sizes: np.ndarray, margins: tuple) -> np.ndarray:
+    """Zoom factor per box that fits it inside the margins of its canvas (1.0 for empty cutouts), like zoom_for_bbox."""
+    top_margin, bottom_margin, left_margin, right_margin = margins
+    object_width = np.where(empty, 1, boxes[:, 2] - boxes[:, 0])
+    object_height = np.where(empty, 1, boxes[:, 3] - boxes[:, 1])
+    zooms = np.minimum((sizes[:, 0] - (left_margin + right_margin)) / object_width,
+                       (sizes[:, 1] - (top_margin + bottom_margin)) / object_height)
+    return np.where(empty, 1.0, zooms)
+
+def scaled_centers(boxes: np.ndarray, empty: np.ndarray, sizes: np.ndarray, zooms: np.ndarray) -> np.ndarray:
+    """(N, 2) centers of the boxes after scaling each cutout by its zoom (plan_geometry's analytic scaled bounding box)."""
+    scaled = np.where(zooms[:, None] == 1.0, sizes, np.floor(sizes * zooms[:, None]).astype(np.int64))
+    scale = scaled / sizes
+    low = np.floor(boxes[:, :2] * scale).astype(np.int64)
+    high = np.ceil(boxes[:, 2:] * scale).astype(np.int64)
+    return np.where(empty[:, None], scaled // 2, (low + high) // 2)
+
+def analyze_cutouts(paths: list, margins: tuple, apply_margins: bool, mode: str = "batch", buffers: dict = None) -> dict:
+    """{path: (zoom_factor, center, canvas size)} for the cutouts of one SKU folder, computed together."""
+    if mode not in GEOMETRY_MODES:
+        raise ValueError(f"Unknown geometry mode '{mode}'. Choose from {', '.join(GEOMETRY_MODES)}")
+    stacks = alpha_profiles(paths, buffers)
+    opaque = stacks.pop(None)
+
+    # **All Bounding Boxes in One Array (profiles per canvas size + the rare cutouts without alpha)**
+    ordered, boxes, empty, sizes = [], [], [], []
+    for size, (group, rows, cols) in stacks.items():
+        group_boxes, group_empty = alpha_bboxes(rows, cols)
+        ordered += group
+        boxes.append(group_boxes)
+        empty.append(group_empty)
+        sizes.append(np.tile(size, (len(group), 1)))
+    for path, (bbox, size) in opaque.items():
+        sizes.append(np.array([size]))
+        ordered.append(path)
+        boxes.append(np.array([bbox or (0, 0, 0, 0)], dtype=np.int64))
+        empty.append(np.array([bbox is None]))
+    if not ordered:
+        return {}
+    boxes, empty, sizes = np.concatenate(boxes), np.concatenate(empty), np.concatenate(sizes).astype(np.int64)
+
+    # **Zoom Factors (shared: the smallest zoom of the SKU, so every view fits at the same scale)**
+    zooms = fit_zooms(boxes, empty, sizes, margins) if apply_margins else np.ones(len(ordered))
+    if mode == "shared" and apply_margins and not empty.all():
+        zooms = np.where(empty, 1.0, zooms[~empty].min())
+
+    centers = scaled_centers(boxes, empty, sizes, zooms)
+    return {path: (float(zoom), (int(center[0]), int(center[1])), (int(size[0]), int(size[1])))
+            for path, zoom, center, size in zip(ordered, zooms, centers, sizes)}
@@ -0,0 +1,172 @@
+import io
+import os
+import json
+import math
+import logging
+import threading
+import numpy as np
+from PIL import Image
+
+# **Target-Size Encoding: Quality Searched per Output Instead of a Fixed -q**
+# size : highest quality whose file fits the target size (KB)
+# psnr : lowest quality whose decoded output reaches the target PSNR (dB) against the encoder input
+TARGET_METRICS = ("size", "psnr")
+
+# **Encodes allowed per output (the best passing attempt so far is kept when they run out)**
+DEFAULT_MAX_ATTEMPTS = 6
+
+# **Close enough to stop searching: within 10% under the size target / 0.5 dB over the PSNR target**
+SIZE_TOLERANCE = 0.10
+PSNR_TOLERANCE = 0.5
+
+# **First step away from the seed; doubled until the target is bracketed, then bisected**
+SEED_STEP = 4
+
+# **Chosen qualities remembered per (format, category, target); the seed is their median**
+SEED_HISTORY = 32
+
+# **Seed cache file (stored at the root of the output tree, so the next run starts seeded)**
+SEEDS_NAME = ".target_quality_seeds.json"
+
+def image_category(file_name: str) -> str:
+    """Category of a product image name (<SKU>-<category>-<view>.ext, e.g. R or RA); 'default' for other names."""
+    parts = os.path.splitext(os.path.basename(file_name))[0].split("-")
+    return parts[-2] if len(parts) >= 3 else "default"
+
+def psnr(reference: np.ndarray, data: bytes, mode: str) -> float:
+    """PSNR (dB) of an encoded image against the pixels it was encoded from."""
+    with Image.open(io.BytesIO(data)) as decoded:
+        pixels = np.asarray(decoded.convert(mode), dtype=np.float32)
+    mse = float(np.mean((pixels - reference) ** 2))
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+def search_quality(encode, measure, metric: str, target: float, low: int, high: int, seed: int = None, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> dict:
+    """Bounded search over the quality range: encode(quality) -> bytes, measure(bytes) -> size / PSNR.
+
+    Starts at the seed, steps away from it (doubling) until the target is bracketed, then bisects.
+    Returns the chosen quality, its bytes and value, the attempts made and whether the target was met."""
+    upward = metric == "size"  # **Size grows with quality: a passing size means try higher; a passing PSNR means try lower**
+
+    def passes(value):
+        return value <= target if upward else value >= target
+
+    def close_enough(value):
+        return value >= target * (1 - SIZE_TOLERANCE) if upward else value <= target + PSNR_TOLERANCE
+
+    best, fallback, attempts = None, None, []
+    seen_pass = seen_fail = False
+    quality = min(high, max(low, seed if seed is not None else (low + high) // 2))
+    step = SEED_STEP
+    while low <= high and len(attempts) < max_attempts:
+        data = encode(quality)
+        value = measure(data)
+        attempts.append(quality)
+        if passes(value):
+            seen_pass = True
+            if best is None or (quality > best[0] if upward else quality < best[0]):
+                best = (quality, data, value)
+            if close_enough(value):
+                break
+            low, high = (quality + 1, high) if upward else (low, quality - 1)
+            direction = 1 if upward else -1
+        else:
+            seen_fail = True
+            if fallback is None or (quality < fallback[0] if upward else quality > fallback[0]):
+                fallback = (quality, data, value)  # **Nearest miss, written when nothing passes**
+            low, high = (low, quality - 1) if upward else (quality + 1, high)
+            direction = -1 if upward else 1
+
+        # **Gallop From the Seed Until Both Sides Were Seen, Then Bisect**
+        if seen_pass and seen_fail:
+            quality = (low + high) // 2
+        else:
+            quality = min(high, max(low, quality + direction * step))
+            step *= 2
+
+    quality, data, value = best or fallback
+    return {"quality": quality, "data": data, "value": value, "attempts": len(attempts), "met": best is not None}
+
+class QualitySeeds:
+    """Qualities chosen per (format, category, target), used to seed the next search, plus attempt statistics of the run."""
+
+    def __init__(self):
+        self.history = {}
+        self.attempts = []
+        self.missed = 0
+        self.path = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(fmt: str, category: str, target: dict) -> str:
+        level = f":{target['level']}w" if target.get("level") else ""  # **-widths: one seed per size level**
+        return f"{fmt}:{category}:{target['metric']}:{target['value']}{level}"
+
+    def load(self, root: str):
+        """Seeds left by earlier runs into the same output tree."""
+        self.path = os.path.join(root, SEEDS_NAME)
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                history = json.load(f)
+            if not isinstance(history, dict):
+                raise ValueError("not a JSON object")
+            self.history = history
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable quality seeds {self.path}: {e}")  # **Searches start unseeded, as on a first run**
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            history = dict(self.history)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(history, f, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+    def seed(self, key: str):
+        with self.lock:
+            qualities = sorted(self.history.get(key, []))
+        return qualities[len(qualities) // 2] if qualities else None
+
+    def record(self, key: str, result: dict):
+        with self.lock:
+            self.history[key] = (self.history.get(key, []) + [result["quality"]])[-SEED_HISTORY:]
+            self.attempts.append(result["attempts"])
+            self.missed += 0 if result["met"] else 1
+
+    def print_report(self):
+        """Encode attempts per output of the run (what the target mode cost on top of one encode each)."""
+        if not self.attempts:
+            return
+        counts = {}
+        for attempts in self.attempts:
+            counts[attempts] = counts.get(attempts, 0) + 1
+        print(f"\nTarget encoding: {len(self.attempts)} outputs, {sum(self.attempts)} encodes "
+              f"(average {sum(self.attempts) / len(self.attempts):.2f}, max {max(self.attempts)}), {self.missed} missed the target")
+        print("Attempts per output: " + ", ".join(f"{attempts}: {count}" for attempts, count in sorted(counts.items())))
+
+# **Process-Wide Seeds (loaded / saved by Convert.py)**
+quality_seeds = QualitySeeds()
+
+def encode_to_target(img: Image.Image, output_file: str, fmt: str, target: dict, max_quality: int, encode) -> dict:
+    """Encode `img` with the quality that meets `target` ({"metric", "value", "attempts"}) and write it to output_file;
+    encode(img, buffer, quality) writes one attempt. Returns the search result (without the bytes)."""
+    def encode_bytes(quality):
+        buffer = io.BytesIO()
+        encode(img, buffer, quality)
+        return buffer.getvalue()
+
+    if target["metric"] == "size":
+        measure, goal = len, target["value"] * 1024
+    else:
+        reference = np.asarray(img, dtype=np.float32)
+        measure, goal = (lambda data: psnr(reference, data, img.mode)), target["value"]
+
+    key = QualitySeeds.key(fmt, image_category(output_file), target)
+    result = search_quality(encode_bytes, measure, target["metric"], goal, 1, max_quality, quality_seeds.seed(key), target["attempts"])
+    with open(output_file, "wb") as f:
+        f.write(result.pop("data"))
+    quality_seeds.record(key, result)
+    return result
@@ -0,0 +1,52 @@
+import os
+import sys
+import unittest
+from unittest import mock
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import compositing
+from compositing import composite_pair
+from resize import process_background, compose_final_image
+
+class CompositePairTest(unittest.TestCase):
+    """composite_pair must stay byte-identical to the process_background + compose_final_image reference chain."""
+
+    def setUp(self):
+        self.rng = np.random.default_rng(2)
+
+    def random_image(self, mode: str, size: tuple) -> Image.Image:
+        pixels = self.rng.integers(0, 256, size=(size[1], size[0], len(mode)), dtype=np.uint8)
+        if mode == "RGBA":
+            # **Fully transparent and fully opaque areas next to partial alpha, like real cutouts**
+            pixels[: size[1] // 3, :, 3] = 0
+            pixels[size[1] // 3: size[1] // 2, :, 3] = 255
+        return Image.fromarray(pixels, mode)
+
+    def assert_identical(self, background: Image.Image, transparent: Image.Image, dx: int, dy: int, final_size: tuple, bg_color: tuple):
+        expected = compose_final_image(process_background(background, dx, dy, final_size, bg_color), transparent)
+        actual = composite_pair(background, transparent, dx, dy, final_size, bg_color)
+        self.assertEqual(actual.mode, expected.mode)
+        self.assertEqual(actual.size, expected.size)
+        self.assertEqual(actual.tobytes(), expected.tobytes(), f"dx={dx} dy={dy} size={final_size} color={bg_color} bg={background.mode}")
+
+    def test_random_pairs(self):
+        with mock.patch.object(compositing, "STRIP_HEIGHT", 7):  # **Several strips per image**
+            for case in range(60):
+                final_size = tuple(int(v) for v in self.rng.integers(8, 40, size=2))
+                background_size = tuple(int(v) for v in self.rng.integers(4, 50, size=2))
+                background = self.random_image("RGBA" if case % 2 else "RGB", background_size)
+                transparent = self.random_image("RGBA", final_size)
+                dx, dy = (int(v) for v in self.rng.integers(-30, 30, size=2))
+                bg_color = tuple(int(v) for v in self.rng.integers(0, 256, size=3))
+                self.assert_identical(background, transparent, dx, dy, final_size, bg_color)
+
+    def test_background_off_canvas_and_empty_cutout(self):
+        background = self.random_image("RGB", (20, 20))
+        empty = Image.new("RGBA", (16, 12), (0, 0, 0, 0))
+        for dx, dy in ((100, 0), (0, -100), (-20, -20), (16, 12)):
+            self.assert_identical(background, empty, dx, dy, (16, 12), (0, 0, 255))
+
+if __name__ == "__main__":
+    unittest.main()
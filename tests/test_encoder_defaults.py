@@ -0,0 +1,66 @@
+import os
+import sys
+import subprocess
+import tempfile
+import unittest
+from argparse import Namespace
+from PIL import Image, ImageDraw
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+from encoders import DEFAULT_WEBP_METHOD, DEFAULT_AVIF_SPEED, format_settings
+
+def write_pair(folder: str, sku: str, category: str = "R", view: str = "V1"):
+    """One small background / cutout pair in the production naming scheme."""
+    os.makedirs(folder, exist_ok=True)
+    cutout = Image.new("RGBA", (64, 48), (0, 0, 0, 0))
+    ImageDraw.Draw(cutout).ellipse((14, 10, 44, 36), fill=(200, 40, 40, 255))
+    background = Image.alpha_composite(Image.new("RGBA", cutout.size, (230, 230, 230, 255)), cutout)
+    background.save(os.path.join(folder, f"{sku}-{category}-{view}.png"))
+    cutout.save(os.path.join(folder, f"{sku}-{category}A-{view}.png"))
+
+def files_by_extension(root: str) -> dict:
+    counts = {}
+    for _, _, files in os.walk(root):
+        for name in files:
+            extension = os.path.splitext(name)[1].lower()
+            counts[extension] = counts.get(extension, 0) + 1
+    return counts
+
+class FormatSettingsTest(unittest.TestCase):
+
+    def test_missing_method_and_speed_fall_back_to_defaults(self):
+        args = Namespace(q=90, p=False, opt=False, m=None, s=None)
+        self.assertEqual(format_settings(args, "webp")["method"], DEFAULT_WEBP_METHOD)
+        self.assertEqual(format_settings(args, "avif")["speed"], DEFAULT_AVIF_SPEED)
+
+class ConvertWithoutEncoderFlagsTest(unittest.TestCase):
+    """Every output of a run that leaves -m / -s out is written (nothing fails on an unset encoder option)."""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.folder.name, "input")
+        self.output = os.path.join(self.folder.name, "output")
+        write_pair(os.path.join(self.input, "SKU1"), "SKU1", "R")
+        write_pair(os.path.join(self.input, "SKU1"), "SKU1", "W")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def run_tool(self, *arguments):
+        result = subprocess.run([sys.executable, *arguments], cwd=REPO, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertNotIn("Error processing", result.stderr)  # **resize.py logs failed pairs**
+        self.assertNotIn("Error converting", result.stdout)  # **Convert.py prints failed images**
+        return result
+
+    def test_resize_convert(self):
+        self.run_tool("resize.py", self.input, self.output, "5", "5", "5", "5", "1", "1", "--convert", "jpeg,webp,avif")
+        self.assertEqual(files_by_extension(self.output), {".png": 4, ".jpeg": 4, ".webp": 4, ".avif": 4})
+
+    def test_convert_multi(self):
+        self.run_tool("Convert.py", "multi", "-i", self.input, "-o", self.output, "-f", "jpeg,webp,avif")
+        self.assertEqual(files_by_extension(self.output), {".jpeg": 4, ".webp": 4, ".avif": 4})
+
+if __name__ == "__main__":
+    unittest.main()
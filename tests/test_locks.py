@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from manifest import take_over_save_lock
+from sharding import FolderClaims
+
+def create_exclusive(path: str, content: str):
+    fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    with os.fdopen(fd, "w") as f:
+        f.write(content)
+
+def read(path: str) -> str:
+    with open(path) as f:
+        return f.read()
+
+class StaleTakeOverTest(unittest.TestCase):
+    """Node A takes over a stale lock while node B replaces it first and node C creates a new one right after A's rename:
+    A must give B's lock back without replacing C's, and only C may hold the path afterwards."""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write_stale(self, path: str, content: str):
+        with open(path, "w") as f:
+            f.write(content)
+        old = time.time() - 24 * 60 * 60
+        os.utime(path, (old, old))
+
+    def interleaved_rename(self, path: str):
+        """os.rename as node A sees it: B's fresh lock replaces the stale one just before, C's lock appears just after."""
+        rename = os.rename
+
+        def interleaved(source, destination):
+            if source != path:
+                return rename(source, destination)
+            with open(path, "w") as f:
+                f.write("node B")
+            rename(source, destination)
+            create_exclusive(path, "node C")
+        return mock.patch("os.rename", side_effect=interleaved)
+
+    def assert_only_c_holds(self, path: str):
+        self.assertEqual(read(path), "node C")
+        self.assertEqual(os.listdir(os.path.dirname(path)), [os.path.basename(path)])  # **No moved lock left behind**
+
+    def test_save_lock_give_back_keeps_third_lock(self):
+        path = os.path.join(self.folder.name, "manifest.lock")
+        self.write_stale(path, "crashed node")
+        with self.interleaved_rename(path), self.assertLogs(level="WARNING"):
+            self.assertFalse(take_over_save_lock(path, "node A"))
+        self.assert_only_c_holds(path)
+
+    def test_save_lock_give_back_restores_fresh_lock(self):
+        path = os.path.join(self.folder.name, "manifest.lock")
+        self.write_stale(path, "crashed node")
+        rename = os.rename
+
+        def replaced_before(source, destination):
+            if source == path:
+                with open(path, "w") as f:
+                    f.write("node B")
+            return rename(source, destination)
+        with mock.patch("os.rename", side_effect=replaced_before):
+            self.assertFalse(take_over_save_lock(path, "node A"))
+        self.assertEqual(read(path), "node B")
+        self.assertEqual(os.listdir(self.folder.name), ["manifest.lock"])
+
+    def test_claim_give_back_keeps_third_claim(self):
+        claims = FolderClaims(self.folder.name, stale_after=60, node="node A")
+        path = claims.path("SKU1", "claim")
+        self.write_stale(path, "crashed node")
+        with self.interleaved_rename(path), self.assertLogs(level="WARNING"):
+            self.assertFalse(claims.take_over(path))
+        self.assert_only_c_holds(path)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pairs import iter_folder_pairs, iter_image_pairs
+
+class PairDiscoveryTest(unittest.TestCase):
+    """Pair matching of one scandir pass: <SKU>-<C>-<view>.png with <SKU>-<C>A-<view>.png, C in R / W / Y."""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.root = self.folder.name
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def touch(self, *parts: str):
+        path = os.path.join(self.root, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "wb").close()
+
+    def folder_pairs(self, sku: str) -> set:
+        return set(iter_folder_pairs(os.path.join(self.root, sku), sku))
+
+    def test_matching_pairs_in_any_order(self):
+        for name in ("SKU1-RA-V1.png", "SKU1-R-V1.png", "SKU1-W-V2.png", "SKU1-WA-V2.png", "SKU1-Y-V1.png", "SKU1-YA-V1.png"):
+            self.touch("SKU1", name)
+        self.assertEqual(self.folder_pairs("SKU1"), {("SKU1-R-V1.png", "SKU1-RA-V1.png"), ("SKU1-W-V2.png", "SKU1-WA-V2.png"),
+                                                     ("SKU1-Y-V1.png", "SKU1-YA-V1.png")})
+
+    def test_missing_partner(self):
+        for name in ("SKU1-R-V1.png", "SKU1-RA-V2.png", "SKU1-WA-V1.png", "SKU1-Y-V1.png", "SKU1-YA-V1.png"):
+            self.touch("SKU1", name)
+        self.assertEqual(self.folder_pairs("SKU1"), {("SKU1-Y-V1.png", "SKU1-YA-V1.png")})
+
+    def test_extension_case_must_match(self):
+        # **Only lower-case .png counts, as in the listdir matching it replaced**
+        for name in ("SKU1-R-V1.png", "SKU1-RA-V1.PNG", "SKU1-W-V1.PNG", "SKU1-WA-V1.PNG", "SKU1-Y-V1.png", "SKU1-YA-V1.png"):
+            self.touch("SKU1", name)
+        self.assertEqual(self.folder_pairs("SKU1"), {("SKU1-Y-V1.png", "SKU1-YA-V1.png")})
+
+    def test_other_files_are_ignored(self):
+        for name in ("SKU1-R-V1.png", "SKU1-RA-V1.png", "SKU1-R-V1.jpg", "SKU1-RA-V1.jpg", "SKU1-notes.txt", "SKU1.png",
+                     "SKU2-R-V1.png", "SKU2-RA-V1.png", "SKU1-X-V1.png", "SKU1-XA-V1.png", "SKU1-RB-V1.png", "Thumbs.db"):
+            self.touch("SKU1", name)
+        self.assertEqual(self.folder_pairs("SKU1"), {("SKU1-R-V1.png", "SKU1-RA-V1.png")})
+
+    def test_nested_folders(self):
+        self.touch("SKU1", "SKU1-R-V1.png")
+        self.touch("SKU1", "SKU1-RA-V1.png")
+        self.touch("SKU1", "SKU1A", "SKU1A-W-V1.png")
+        self.touch("SKU1", "SKU1A", "SKU1A-WA-V1.png")
+        self.touch("SKU1", "SKU1-R-V2.png", "placeholder")  # **A folder named like an image is not an image**
+        self.touch("SKU1", "SKU1-RA-V2.png")
+        output = os.path.join(self.root, "out")
+
+        flat = list(iter_image_pairs(self.root, output))
+        self.assertEqual([pair[2:] for pair in flat], [("SKU1-R-V1.png", "SKU1-RA-V1.png")])
+        self.assertEqual(flat[0][:2], (os.path.join(self.root, "SKU1"), os.path.join(output, "SKU1")))
+
+        nested = {pair[2:]: pair[:2] for pair in iter_image_pairs(self.root, output, recursive=True)}
+        self.assertEqual(set(nested), {("SKU1-R-V1.png", "SKU1-RA-V1.png"), ("SKU1A-W-V1.png", "SKU1A-WA-V1.png")})
+        self.assertEqual(nested[("SKU1A-W-V1.png", "SKU1A-WA-V1.png")],
+                         (os.path.join(self.root, "SKU1", "SKU1A"), os.path.join(output, "SKU1", "SKU1A")))
+
+    def test_selected_folders_only(self):
+        for sku in ("SKU1", "SKU2"):
+            self.touch(sku, f"{sku}-R-V1.png")
+            self.touch(sku, f"{sku}-RA-V1.png")
+        output = os.path.join(self.root, "out")
+        self.assertEqual([pair[2] for pair in iter_image_pairs(self.root, output, folders=["SKU2"])], ["SKU2-R-V1.png"])
+        self.assertEqual([pair[2] for pair in iter_image_pairs(self.root, output, select=lambda folder: folder != "SKU1")], ["SKU2-R-V1.png"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from png_profiles import PNG_PROFILES, PngStreamWriter
+
+class PngStreamWriterTest(unittest.TestCase):
+    """The streamed PNG must decode to exactly the pixels written, whatever the strip layout."""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "stream.png")
+        rng = np.random.default_rng(7)
+        # **Random pixels plus flat and gradient areas, so every filter type gets picked**
+        pixels = rng.integers(0, 256, size=(61, 37, 4), dtype=np.uint8)
+        pixels[10:30, :, :3] = 128
+        pixels[30:45] = np.arange(37, dtype=np.uint8)[None, :, None] * 7
+        self.pixels = pixels
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def stream(self, strip_heights: list, mode: str = "RGBA", profile: str = "balanced"):
+        pixels = self.pixels[..., :len(mode)]
+        writer = PngStreamWriter(self.path, (pixels.shape[1], pixels.shape[0]), mode, profile)
+        top = 0
+        for height in strip_heights:
+            writer.write(Image.fromarray(np.ascontiguousarray(pixels[top:top + height]), mode))
+            top += height
+        writer.close()
+        with Image.open(self.path) as image:
+            self.assertEqual(image.mode, mode)
+            np.testing.assert_array_equal(np.asarray(image), pixels)
+
+    def test_uneven_strips(self):
+        self.stream([16, 16, 16, 13])  # **Last strip shorter than the tile**
+
+    def test_single_row_strips(self):
+        self.stream([1] * 61)
+
+    def test_one_strip(self):
+        self.stream([61])
+
+    def test_rgb_and_every_profile(self):
+        for profile in PNG_PROFILES:
+            with self.subTest(profile=profile):
+                self.stream([20, 20, 21], "RGB", profile)
+
+    def test_missing_rows_leave_no_file(self):
+        writer = PngStreamWriter(self.path, (37, 61))
+        writer.write(Image.fromarray(self.pixels[:10], "RGBA"))
+        with self.assertRaises(ValueError):
+            writer.close()
+        self.assertEqual(os.listdir(self.folder.name), [])
+
+    def test_abort_leaves_no_file(self):
+        writer = PngStreamWriter(self.path, (37, 61))
+        writer.write(Image.fromarray(self.pixels[:10], "RGBA"))
+        writer.abort()
+        self.assertEqual(os.listdir(self.folder.name), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from target_size import SEEDS_NAME, QualitySeeds, search_quality
+
+class SearchQualityTest(unittest.TestCase):
+    """search_quality against monotone fake encoders: size = 100 bytes per quality step, PSNR = 20 dB + 0.3 dB per step."""
+
+    def search(self, metric: str, target: float, seed: int = None, max_attempts: int = 6):
+        calls = []
+
+        def encode(quality):
+            calls.append(quality)
+            return bytes(quality * 100)
+
+        measure = len if metric == "size" else (lambda data: 20 + 0.3 * len(data) / 100)
+        result = search_quality(encode, measure, metric, target, 1, 100, seed, max_attempts)
+        return result, calls
+
+    def test_attempts_are_bounded(self):
+        for max_attempts in (1, 3, 6):
+            result, calls = self.search("size", 5000, seed=80, max_attempts=max_attempts)
+            self.assertLessEqual(len(calls), max_attempts)
+            self.assertEqual(result["attempts"], len(calls))
+
+    def test_size_keeps_the_highest_passing_quality(self):
+        result, calls = self.search("size", 5000, seed=80)
+        passing = [quality for quality in calls if quality * 100 <= 5000]
+        self.assertTrue(result["met"])
+        self.assertEqual(result["quality"], max(passing))
+        self.assertEqual(len(result["data"]), result["value"])
+        self.assertEqual(result["value"], result["quality"] * 100)
+
+    def test_size_brackets_the_target(self):
+        # **Enough attempts: both sides are seen, then the bisection ends within the tolerance under the target**
+        result, calls = self.search("size", 5000, seed=80, max_attempts=20)
+        self.assertTrue(any(quality > 50 for quality in calls) and any(quality <= 50 for quality in calls))
+        self.assertTrue(result["met"])
+        self.assertTrue(45 <= result["quality"] <= 50)
+
+    def test_seed_close_enough_stops_at_once(self):
+        result, calls = self.search("size", 5000, seed=48)
+        self.assertEqual(calls, [48])
+        self.assertEqual(result["quality"], 48)
+
+    def test_size_nearest_miss_when_nothing_passes(self):
+        result, calls = self.search("size", 50, seed=50)
+        self.assertFalse(result["met"])
+        self.assertEqual(result["quality"], min(calls))
+        self.assertEqual(result["quality"], 1)
+
+    def test_psnr_keeps_the_lowest_passing_quality(self):
+        result, calls = self.search("psnr", 35, seed=20, max_attempts=20)
+        passing = [quality for quality in calls if 20 + 0.3 * quality >= 35]
+        self.assertTrue(result["met"])
+        self.assertEqual(result["quality"], min(passing))
+        self.assertTrue(50 <= result["quality"] <= 51)
+        self.assertTrue(any(quality < 50 for quality in calls))
+
+    def test_psnr_nearest_miss_when_nothing_passes(self):
+        result, calls = self.search("psnr", 100, seed=50)
+        self.assertFalse(result["met"])
+        self.assertEqual(result["quality"], max(calls))
+
+class QualitySeedsTest(unittest.TestCase):
+
+    def test_unreadable_seed_file_starts_unseeded(self):
+        with tempfile.TemporaryDirectory() as root:
+            for content in ("{not json", "[1, 2]"):
+                with open(os.path.join(root, SEEDS_NAME), "w", encoding="utf-8") as f:
+                    f.write(content)
+                seeds = QualitySeeds()
+                with self.assertLogs(level="WARNING"):
+                    seeds.load(root)
+                self.assertEqual(seeds.history, {})
+                self.assertIsNone(seeds.seed("webp:R:size:100"))
+
+if __name__ == "__main__":
+    unittest.main()
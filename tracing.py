@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import threading
+
+class Stage:
+    """One timed stage; set `bytes` inside the block to record the data size it handled."""
+
+    def __init__(self, tracer, name: str, nbytes: int = None):
+        self.tracer = tracer
+        self.name = name
+        self.bytes = nbytes
+        self.active = True
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.start
+        cpu = time.thread_time() - self.cpu_start
+        self.tracer.add({
+            "name": self.name, "start": self.start, "wall": wall, "cpu": cpu, "bytes": self.bytes,
+            "pid": os.getpid(), "tid": threading.get_ident(), "thread": threading.current_thread().name,
+        })
+        return False
+
+class NullStage:
+    """Stage used while tracing is off (no clock reads, nothing recorded)."""
+    active = False
+    bytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_STAGE = NullStage()
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+class StageTracer:
+    """Collects wall/CPU time and bytes per pipeline stage (off unless enabled)."""
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def stage(self, name: str, nbytes: int = None):
+        """Context manager timing one stage of the current task."""
+        return Stage(self, name, nbytes) if self.enabled else NULL_STAGE
+
+    def add(self, event: dict):
+        with self.lock:
+            self.events.append(event)
+
+    def extend(self, events: list):
+        """Merge events recorded in a worker process."""
+        with self.lock:
+            self.events.extend(events)
+
+    def drain(self) -> list:
+        """Remove and return all recorded events (used by worker processes)."""
+        with self.lock:
+            events, self.events = self.events, []
+        return events
+
+    def summary(self) -> dict:
+        """Per-stage count, wall percentiles (ms), total CPU and bytes."""
+        stages = {}
+        with self.lock:
+            events = list(self.events)
+        for event in events:
+            stages.setdefault(event["name"], []).append(event)
+        result = {}
+        for name, stage_events in stages.items():
+            walls = sorted(event["wall"] * 1000 for event in stage_events)
+            result[name] = {
+                "count": len(stage_events),
+                "total_wall_s": sum(walls) / 1000,
+                "total_cpu_s": sum(event["cpu"] for event in stage_events),
+                "p50_ms": percentile(walls, 0.50), "p90_ms": percentile(walls, 0.90),
+                "p99_ms": percentile(walls, 0.99), "max_ms": walls[-1],
+                "bytes": sum(event["bytes"] or 0 for event in stage_events),
+            }
+        return result
+
+    def utilization(self, task_stage: str) -> dict:
+        """Busy share of every worker thread, from the time spent in its top-level task stage."""
+        with self.lock:
+            events = [event for event in self.events if event["name"] == task_stage]
+        if not events:
+            return {}
+        run_start = min(event["start"] for event in events)
+        run_wall = max(event["start"] + event["wall"] for event in events) - run_start
+        busy = {}
+        for event in events:
+            worker = (event["pid"], event["thread"])
+            busy[worker] = busy.get(worker, 0.0) + event["wall"]
+        return {worker: seconds / run_wall for worker, seconds in busy.items()} if run_wall > 0 else {}
+
+    def print_summary(self, task_stage: str):
+        """Print the per-stage table and the worker utilization of the run."""
+        summary = self.summary()
+        if not summary:
+            print("\nStage trace: no events recorded")
+            return
+        print(f"\nStage trace ({summary.get(task_stage, {}).get('count', 0)} tasks)")
+        print(f"{'Stage':<16} {'Count':>6} {'Wall s':>8} {'CPU s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'Max ms':>8} {'MB':>9}")
+        for name, stats in sorted(summary.items(), key=lambda item: -item[1]["total_wall_s"]):
+            megabytes = f"{stats['bytes'] / 1e6:.2f}" if stats["bytes"] else "-"
+            print(f"{name:<16} {stats['count']:>6} {stats['total_wall_s']:>8.2f} {stats['total_cpu_s']:>8.2f} "
+                  f"{stats['p50_ms']:>8.1f} {stats['p90_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f} {megabytes:>9}")
+        utilization = self.utilization(task_stage)
+        if utilization:
+            average = sum(utilization.values()) / len(utilization)
+            print(f"Worker utilization: {len(utilization)} workers, average busy {average:.0%}")
+
+    def write_chrome_trace(self, path: str):
+        """Write a Chrome trace (chrome://tracing / Perfetto) with one lane per worker thread."""
+        with self.lock:
+            events = list(self.events)
+        origin = min((event["start"] for event in events), default=0.0)
+        trace_events = [{
+            "name": event["name"], "cat": "stage", "ph": "X",
+            "ts": (event["start"] - origin) * 1e6, "dur": event["wall"] * 1e6,
+            "pid": event["pid"], "tid": event["tid"],
+            "args": {"cpu_ms": round(event["cpu"] * 1000, 3), "bytes": event["bytes"], "thread": event["thread"]},
+        } for event in events]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+# **Process-Wide Tracer (enabled with --trace / -trace)**
+tracer = StageTracer()
+
+def enable_tracing():
+    """Turn tracing on (also used as the initializer of worker processes)."""
+    tracer.enable()
+
+def worker_initializer():
+    """Initializer for worker processes (None while tracing is off)."""
+    return enable_tracing if tracer.enabled else None
+
+def run_traced(function, *args):
+    """Run a task in a worker process and return its result together with the stage events it recorded."""
+    result = function(*args)
+    return result, tracer.drain()
+
+def traced_task(function, args: tuple, backend: str) -> tuple:
+    """(function, args) of a task; in worker processes the stage events travel back with the result."""
+    if tracer.enabled and backend == "process":
+        return run_traced, (function, *args)
+    return function, args
+
+def task_result(result, backend: str):
+    """Result of a task created by traced_task (merging the worker's stage events into the tracer)."""
+    if tracer.enabled and backend == "process":
+        result, events = result
+        tracer.extend(events)
+    return result
+
+def finish_trace(task_stage: str, trace_file: str = None):
+    """Print the stage summary and write the Chrome trace (no-op while tracing is off)."""
+    if not tracer.enabled:
+        return
+    tracer.print_summary(task_stage)
+    if trace_file:
+        tracer.write_chrome_trace(trace_file)
+        print(f"Chrome trace written to {trace_file} (open in chrome://tracing or ui.perfetto.dev)")
@@ -1,118 +1,149 @@
-# import os
-# import cv2
-# import pillow_avif
-# import argparse
-# from PIL import Image
-# import concurrent.futures  # For multithreading
-
-# # CLI argument parsing
-# parser = argparse.ArgumentParser(description="Resize images and create a video.")
-# parser.add_argument("-i", "--input-path", required=True, help="Path to the folder containing images")
-# parser.add_argument("-o", "--output-path", required=True, help="Path to save the generated video")
-# parser.add_argument("-t", "--threads", type=int, required=True, help="Number of threads for processing")
-# parser.add_argument("-r", "--resolution", choices=["720p", "1080p", "4k", "8k"], required=True, help="Video resolution")
-# parser.add_argument("-f", "--format", choices=["jpg", "png", "webp", "avif"], required=True, help="Output image format")
-
-# # Add optional format-specific parameters
-# parser.add_argument("-q", "--quality", type=int, help="Quality (JPG, WEBP, AVIF only)")
-# parser.add_argument("-s", "--speed", type=int, choices=range(0, 11), help="Encoding speed (AVIF only)")
-# parser.add_argument("-c", "--compression", type=int, choices=range(0, 10), help="Compression level (PNG only)")
-
-# args = parser.parse_args()
-
-# # Resolution mapping
-# resolution_map = {
-#     "720p": (1280, 720),
-#     "1080p": (1920, 1080),
-#     "4k": (3840, 2160),
-#     "8k": (7680, 4320)
-# }
-# width, height = resolution_map[args.resolution]
-# output_format = args.format
-
-# print(f"Selected Resolution: {width}x{height}, Format: {output_format}")
-
-# # Path variables
-# input_path = args.input_path
-# output_path = args.output_path
-# threads = args.threads
-
-# # Format-specific parameters
-# if output_format in ["jpg", "webp", "avif"]:
-#     quality = args.quality if args.quality else 95  # Default quality
-# else:
-#     quality = None
-
-# if output_format == "avif":
-#     speed = args.speed if args.speed else 5  # Default AVIF encoding speed
-# else:
-#     speed = None
-
-# if output_format == "png":
-#     compression = args.compression if args.compression else 6  # Default PNG compression level
-# else:
-#     compression = None
-
-# # Image extensions (JPEG, PNG, AVIF, WEBP support)
-# valid_extensions = (".jpg", ".jpeg", ".png", ".avif", ".webp")
-
-# # Image list fetch karva
-# image_files = [file for file in os.listdir(input_path) if file.lower().endswith(valid_extensions)]
-# num_of_images = len(image_files)
-
-# if num_of_images == 0:
-#     print("No images found in the directory!")
-#     exit()
-
-# print("Number of Images:", num_of_images)
-
-# # Multithreading for resizing images
-# processed_images = []
-
-# def resize_image(file):
-#     im = Image.open(os.path.join(input_path, file))
-#     im_resized = im.resize((width, height), Image.LANCZOS)
-    
-#     # Convert & save in user-defined format
-#     output_file = os.path.join(input_path, os.path.splitext(file)[0] + f".{output_format}")
-    
-#     if output_format == "jpg":
-#         im_resized.save(output_file, "JPEG", quality=quality)
-#     elif output_format == "png":
-#         im_resized.save(output_file, "PNG", compress_level=compression)
-#     elif output_format == "webp":
-#         im_resized.save(output_file, "WEBP", quality=quality)
-#     elif output_format == "avif":
-#         im_resized.save(output_file, "AVIF", quality=quality, speed=speed)
-
-#     processed_images.append(output_file)
-#     print(f"{file} resized and saved as {output_format}")
-
-# with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
-#     executor.map(resize_image, image_files)
-
-# # Function to generate video
-# def generate_video():
-#     video_name = os.path.join(output_path, f'output_video.mp4')
-
-#     frame = cv2.imread(processed_images[0])
-#     height, width, layers = frame.shape
-
-#     # Codec selection
-#     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-#     video = cv2.VideoWriter(video_name, fourcc, 30, (width, height))
-
-#     for img_path in processed_images:
-#         img = cv2.imread(img_path)
-#         video.write(img)
-
-#     video.release()
-#     cv2.destroyAllWindows()
-#     print(f"Video generated successfully: {video_name}")
-
-# # Generate video
-# generate_video()
-
-
+import os
+import sys
+import queue
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import cv2
-print(cv2.__version__)
\ No newline at end of file
+import numpy as np
+from PIL import Image
+
+# Resolution mapping
+RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+    "8k": (7680, 4320)
+}
+
+# Image extensions (JPEG, PNG, AVIF, WEBP support)
+VALID_EXTENSIONS = (".jpg", ".jpeg", ".png", ".avif", ".webp")
+
+# **Frames decoded ahead of the writer, per worker (bounds memory for any video length)**
+PREFETCH_PER_WORKER = 2
+
+def list_frames(input_path: str, extensions: tuple = VALID_EXTENSIONS) -> list:
+    """Sorted image paths of a folder (case-insensitive extension match)."""
+    return [os.path.join(input_path, f) for f in sorted(os.listdir(input_path)) if f.lower().endswith(extensions)]
+
+def read_frame(path: str):
+    """Decode an image as a BGR frame, or None if it cannot be read."""
+    frame = cv2.imread(path)
+    if frame is None:
+        # **Formats OpenCV cannot decode (e.g. AVIF) go through Pillow; pillow_avif is only needed (and imported) here**
+        try:
+            import pillow_avif  # noqa: F401 (registers the AVIF plugin with Pillow)
+        except ImportError:
+            pass  # **Pillow builds with their own AVIF support still open it; other formats do not need the plugin**
+        try:
+            with Image.open(path) as im:
+                frame = cv2.cvtColor(np.asarray(im.convert("RGB")), cv2.COLOR_RGB2BGR)
+        except Exception:
+            return None
+    return frame
+
+def load_frame(path: str, size: tuple = None, interpolation: int = cv2.INTER_AREA, transform=None):
+    """Decode, resize (when the frame is not `size` already) and transform one frame in memory."""
+    frame = read_frame(path)
+    if frame is None:
+        return None
+    if size and (frame.shape[1], frame.shape[0]) != tuple(size):
+        frame = cv2.resize(frame, size, interpolation=interpolation)
+    return transform(frame) if transform else frame
+
+def prefetch_frames(paths: list, load, workers: int, prefetch: int = None):
+    """Yield (path, frame) in input order while up to `prefetch` later frames are decoded by the worker pool."""
+    prefetch = prefetch or workers * PREFETCH_PER_WORKER
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        paths = iter(paths)
+        for path in paths:
+            pending.append((path, executor.submit(load, path)))
+            if len(pending) >= prefetch:
+                break
+        while pending:
+            path, future = pending.popleft()
+            frame = future.result()
+            # **Refill the window before handing the frame on, so the workers never idle**
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append((next_path, executor.submit(load, next_path)))
+            yield path, frame
+
+class FrameWriter:
+    """Single thread that owns the cv2.VideoWriter and writes frames in the order they are queued."""
+
+    def __init__(self, output_file: str, fourcc: str, fps: int, size: tuple, queue_size: int = 8):
+        self.video = cv2.VideoWriter(output_file, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+        if not self.video.isOpened():
+            raise RuntimeError(f"Could not open video writer for {output_file}")
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.count = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="video-writer", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                continue  # **Keep draining so the producer never blocks after a failure**
+            try:
+                self.video.write(frame)
+                self.count += 1
+            except Exception as e:
+                self.error = e
+        self.video.release()
+
+    def write(self, frame):
+        self.frames.put(frame)
+
+    def close(self) -> int:
+        """Flush the queue, release the file and return the number of frames written."""
+        self.frames.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.count
+
+def generate_video(frame_paths: list, output_file: str, size: tuple, fps: int = 30, fourcc: str = "mp4v",
+                   workers: int = 4, interpolation: int = cv2.INTER_AREA, transform=None, prefetch: int = None) -> int:
+    """Encode the frames to a video without intermediate image files; returns the number of frames written."""
+    writer = FrameWriter(output_file, fourcc, fps, size)
+    try:
+        load = lambda path: load_frame(path, size, interpolation, transform)
+        for path, frame in prefetch_frames(frame_paths, load, workers, prefetch):
+            if frame is None:
+                print(f"⚠️ Skipping corrupted/missing image: {path}")
+                continue
+            writer.write(frame)
+    finally:
+        count = writer.close()
+    return count
+
+# **Main Execution (Command Line Arguments)**
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resize images and create a video.")
+    parser.add_argument("-i", "--input-path", required=True, help="Path to the folder containing images")
+    parser.add_argument("-o", "--output-path", required=True, help="Path to save the generated video")
+    parser.add_argument("-t", "--threads", type=int, required=True, help="Number of threads for decoding + resizing")
+    parser.add_argument("-r", "--resolution", choices=list(RESOLUTIONS), required=True, help="Video resolution")
+    parser.add_argument("--fps", type=int, default=30, help="Frames per second (default: 30)")
+    args = parser.parse_args()
+
+    width, height = RESOLUTIONS[args.resolution]
+    print(f"Selected Resolution: {width}x{height}")
+
+    image_files = list_frames(args.input_path)
+    if not image_files:
+        print("No images found in the directory!")
+        sys.exit(1)
+    print("Number of Images:", len(image_files))
+
+    os.makedirs(args.output_path, exist_ok=True)
+    video_name = os.path.join(args.output_path, "output_video.mp4")
+    frame_count = generate_video(image_files, video_name, (width, height), args.fps, workers=args.threads, interpolation=cv2.INTER_LANCZOS4)
+    print(f"Video generated successfully: {video_name} ({frame_count} frames)")
@@ -0,0 +1,198 @@
+import os
+import sys
+import time
+import select
+import struct
+import logging
+import ctypes
+import ctypes.util
+from pairs import iter_folder_pairs
+
+# **Watch Mode: New SKU Folders / Pairs Are Picked Up as They Arrive**
+# inotify : Linux, events for the input root and every SKU folder (no rescans)
+# poll    : anywhere (and for network mounts, where inotify does not see remote writes): size + mtime snapshot every interval
+
+# **Seconds a file must stay unchanged before it is treated as completely written**
+DEFAULT_SETTLE = 2.0
+
+# **Seconds between two snapshots of the polling watcher**
+DEFAULT_POLL_INTERVAL = 2.0
+
+# **Last bytes of every complete PNG (IEND chunk + CRC); a shorter or different tail means the file is still being written**
+PNG_TRAILER = b"IEND\xaeB`\x82"
+
+# **inotify Event Flags (linux/inotify.h)**
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")  # **wd, mask, cookie, name length**
+
+def file_signature(path: str):
+    """(size, mtime_ns) of a file, None when it is gone."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def is_complete(path: str) -> bool:
+    """A PNG is complete once it ends with its IEND chunk (other files: once they are not empty)."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if not path.lower().endswith(".png"):
+                return size > 0
+            if size < len(PNG_TRAILER):
+                return False
+            f.seek(-len(PNG_TRAILER), os.SEEK_END)
+            return f.read() == PNG_TRAILER
+    except OSError:
+        return False
+
+def sku_files(input_root: str):
+    """Paths of the files inside the SKU folders of input_root (the layout resize.py processes)."""
+    with os.scandir(input_root) as folders:
+        for folder in folders:
+            if folder.is_dir():
+                with os.scandir(folder.path) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            yield entry.path
+
+class PollWatcher:
+    """Reports files whose size or mtime changed between two snapshots of the SKU folders."""
+
+    def __init__(self, input_root: str, interval: float = DEFAULT_POLL_INTERVAL):
+        self.input_root = input_root
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self) -> dict:
+        return {path: file_signature(path) for path in sku_files(self.input_root)}
+
+    def changes(self, timeout: float) -> set:
+        time.sleep(self.interval)  # **Snapshots are taken every interval (the timeout is for event watchers)**
+        snapshot = self.scan()
+        changed = {path for path, signature in snapshot.items() if self.snapshot.get(path) != signature}
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """Reports files created, written or moved into the SKU folders, from inotify events (Linux only)."""
+
+    def __init__(self, input_root: str):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.input_root = input_root
+        self.folders = {}  # **watch descriptor -> folder**
+        self.add_watch(input_root)
+        with os.scandir(input_root) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    self.add_watch(entry.path)
+
+    def add_watch(self, folder: str):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder} (raise fs.inotify.max_user_watches or use polling)")
+        self.folders[wd] = folder
+
+    def changes(self, timeout: float) -> set:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0"))
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # **Events were lost: fall back to one snapshot of everything**
+                logging.warning("inotify queue overflow, rescanning the input folder")
+                changed.update(sku_files(self.input_root))
+                continue
+            if mask & IN_IGNORED:
+                self.folders.pop(wd, None)
+                continue
+            folder = self.folders.get(wd)
+            if folder is None or not name:
+                continue
+            path = os.path.join(folder, name)
+
+            if mask & IN_ISDIR:
+                if folder == self.input_root:
+                    # **New SKU folder: watch it, and report what was written before the watch existed**
+                    self.add_watch(path)
+                    with os.scandir(path) as entries:
+                        changed.update(entry.path for entry in entries if entry.is_file())
+            elif folder != self.input_root:
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+def create_watcher(input_root: str, poll: bool = False, interval: float = DEFAULT_POLL_INTERVAL):
+    """inotify watcher on Linux, polling watcher when asked for or when inotify is not available."""
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(input_root)
+        except (OSError, AttributeError) as e:
+            logging.warning(f"inotify not available ({e}), polling every {interval}s instead")
+    return PollWatcher(input_root, interval)
+
+def watch_pairs(watcher, input_root: str, output_root: str, settle: float = DEFAULT_SETTLE):
+    """Yield lists of (input_folder, output_folder, bg_file, no_bg_file) pairs as soon as both of their files are completely written.
+
+    A file settles once it has kept the same size + mtime for `settle` seconds and (PNG) ends with its IEND chunk;
+    a pair is yielded when one of its files settles while its partner is settled already."""
+    logging.info(f"Watching {input_root} ({'inotify' if isinstance(watcher, InotifyWatcher) else 'polling'}, settle {settle}s)")
+    pending = {}  # **path -> (signature, time the signature was last seen changing)**
+    while True:
+        now = time.monotonic()
+        for path in watcher.changes(settle / 2 if pending else 1.0):
+            signature = file_signature(path)
+            if signature is not None and pending.get(path, (None,))[0] != signature:
+                pending[path] = (signature, now)
+
+        # **Settled Files: Unchanged for `settle` Seconds and Complete**
+        now = time.monotonic()
+        settled = set()
+        for path, (signature, since) in list(pending.items()):
+            if now - since < settle:
+                continue
+            current = file_signature(path)
+            if current is None:
+                del pending[path]
+            elif current != signature or not is_complete(path):
+                pending[path] = (current, now)
+            else:
+                settled.add(path)
+                del pending[path]
+        if not settled:
+            continue
+
+        # **Complete Pairs of the Folders That Received Settled Files**
+        pairs = []
+        for input_folder in sorted({os.path.dirname(path) for path in settled}):
+            output_folder = os.path.join(output_root, os.path.relpath(input_folder, input_root))
+            for bg_file, no_bg_file in iter_folder_pairs(input_folder, os.path.basename(input_folder)):
+                files = (os.path.join(input_folder, bg_file), os.path.join(input_folder, no_bg_file))
+                if any(path in settled for path in files) and not any(path in pending for path in files):
+                    pairs.append((input_folder, output_folder, bg_file, no_bg_file))
+        if pairs:
+            yield pairs